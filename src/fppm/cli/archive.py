@@ -0,0 +1,88 @@
+import hashlib
+import os
+import tarfile
+import requests
+
+# timeout (seconds) of archive downloads
+ARCHIVE_TIMEOUT = float(os.environ.get("FPPM_ARCHIVE_TIMEOUT", 30))
+
+
+class HashingReader:
+    # file-like wrapper hashing the bytes read through it
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.digest.update(data)
+        return data
+
+
+def archive_url(archiveTemplate, revision) -> str:
+    """
+    Expands the archive URL template of a registry entry, e.g.
+    https://github.com/org/package/archive/{version}.tar.gz
+
+    Args:
+        archiveTemplate (str): Template with a {version} placeholder
+        revision (str): Revision to download (tags/<tag> or a commit hash)
+
+    Returns:
+        str: Archive URL
+    """
+
+    if revision.startswith("tags/"):
+        revision = revision[len("tags/") :]
+    return archiveTemplate.replace("{version}", revision)
+
+
+def extract_archive(url, destination) -> tuple:
+    """
+    Downloads a tarball (optionally compressed) and extracts it into
+    destination while it is being downloaded, without buffering it to disk
+
+    Args:
+        url (str): URL or local path of the archive
+        destination (str): Existing empty directory to extract into
+
+    Returns:
+        tuple: (root of the extracted package, hex sha256 of the archive, commit
+        recorded in the archive by `git archive` or None)
+
+    Raises:
+        requests.RequestException: The archive could not be downloaded
+        tarfile.TarError: The download is not a valid tarball
+    """
+
+    if url.startswith("http://") or url.startswith("https://"):
+        response = requests.get(url, stream=True, timeout=ARCHIVE_TIMEOUT)
+        response.raise_for_status()
+        # the tarball is decompressed by tarfile, not by requests
+        source = response.raw
+        close = response.close
+    else:
+        source = open(url, "rb")
+        close = source.close
+
+    try:
+        reader = HashingReader(source)
+        with tarfile.open(fileobj=reader, mode="r|*") as tar:
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(destination, filter="data")
+            else:
+                tar.extractall(destination)
+            commit = tar.pax_headers.get("comment")
+        # hash whatever trails the tar end-of-archive marker as well
+        while reader.read(64 * 1024):
+            pass
+    finally:
+        close()
+
+    # archives of a repository usually hold a single <package>-<version> folder
+    root = destination
+    entries = os.listdir(destination)
+    if len(entries) == 1 and os.path.isdir(os.path.join(destination, entries[0])):
+        root = os.path.join(destination, entries[0])
+
+    return (root, reader.digest.hexdigest(), commit)
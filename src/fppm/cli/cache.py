@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+import fppm.cli.utils as FppmUtils
+
+# in offline mode (--offline or FPPM_OFFLINE=1) only local caches may be used
+OFFLINE = os.environ.get("FPPM_OFFLINE", "") not in ("", "0")
+
+# cached registries older than this (seconds) are considered stale
+REGISTRY_MAX_AGE = float(os.environ.get("FPPM_REGISTRY_MAX_AGE", 300))
+
+
+def set_offline(offline: bool):
+    global OFFLINE
+    OFFLINE = offline
+
+
+def is_offline() -> bool:
+    return OFFLINE
+
+
+def get_cache_dir(*subdirs) -> str:
+    """
+    Returns (and creates) the user-level fppm cache directory
+
+    The location can be overridden with the FPPM_CACHE_DIR environment variable,
+    otherwise it follows XDG_CACHE_HOME and defaults to ~/.cache/fppm.
+
+    Args:
+        subdirs (str): Optional subdirectories inside the cache directory
+
+    Returns:
+        str: Path to the cache directory
+    """
+
+    cacheRoot = os.environ.get("FPPM_CACHE_DIR")
+    if not cacheRoot:
+        xdgCache = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        cacheRoot = os.path.join(xdgCache, "fppm")
+
+    cacheDir = os.path.join(cacheRoot, *subdirs)
+    os.makedirs(cacheDir, exist_ok=True)
+    return cacheDir
+
+
+def cache_key(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def write_atomic(path, data):
+    """
+    Writes data to path via a temporary file and a rename, so readers never
+    observe a partially written file.
+
+    Args:
+        path (str): Destination path
+        data (str | bytes): Content to write
+    """
+
+    mode = "wb" if isinstance(data, bytes) else "w"
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmpPath = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+        os.replace(tmpPath, path)
+    except BaseException:
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+        raise
+
+
+def registry_entry_path(registry_url) -> str:
+    return os.path.join(get_cache_dir("registries"), f"{cache_key(registry_url)}.json")
+
+
+def list_registry_entries() -> list:
+    registriesDir = get_cache_dir("registries")
+    return sorted(
+        os.path.join(registriesDir, name)
+        for name in os.listdir(registriesDir)
+        if name.endswith(".json")
+    )
+
+
+def load_registry_entry(registry_url):
+    """
+    Loads the cached entry of a remote registry
+
+    Args:
+        registry_url (str): URL of the registry
+
+    Returns:
+        dict: Cached entry (url, etag, last-modified, fetched-on, digest, source,
+        content), or None if the registry is not cached
+    """
+
+    entry = read_registry_entry(registry_entry_path(registry_url))
+    if entry is None or entry.get("url") != registry_url:
+        return None
+
+    return entry
+
+
+def read_registry_entry(entryPath):
+    try:
+        with open(entryPath, "r") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if entry.get("content") is None:
+        return None
+
+    return entry
+
+
+def store_registry_entry(
+    registry_url, content, etag, lastModified, digest, source="yaml", compiled=None
+):
+    """
+    Stores the parsed content of a remote registry along with its validators
+
+    Args:
+        registry_url (str): URL of the registry
+        content (dict): Parsed registry content
+        etag (str): ETag header of the response, if any
+        lastModified (str): Last-Modified header of the response, if any
+        digest (str): sha256 of the raw registry.yaml body
+        source (str): "yaml" or "compiled", the artifact the content came from
+        compiled (dict): Digest, ETag and Last-Modified of the compiled
+            snapshot published next to the registry, if any
+
+    Returns:
+        dict: The stored entry
+    """
+
+    entry = {
+        "url": registry_url,
+        "etag": etag,
+        "last-modified": lastModified,
+        "fetched-on": time.time(),
+        "digest": digest,
+        "source": source,
+        "compiled": compiled,
+        "content": content,
+    }
+
+    try:
+        # registries may contain YAML dates, which are stored as strings
+        write_atomic(registry_entry_path(registry_url), json.dumps(entry, default=str))
+    except OSError as e:
+        FppmUtils.print_warning(
+            f"[WARN]: Unable to cache registry [{registry_url}]: {e}"
+        )
+
+    return entry
+
+
+def touch_registry_entry(registry_url, entry) -> tuple:
+    """
+    Marks a cached registry as just revalidated
+
+    Returns:
+        tuple: (content, digest) of the entry
+    """
+
+    entry = dict(entry, **{"fetched-on": time.time()})
+    try:
+        write_atomic(registry_entry_path(registry_url), json.dumps(entry, default=str))
+    except OSError:
+        pass
+
+    return (entry["content"], entry.get("digest"))
+
+
+def registry_entry_age(entry) -> float:
+    return time.time() - entry.get("fetched-on", 0)
+
+
+def is_registry_entry_stale(entry) -> bool:
+    return registry_entry_age(entry) > REGISTRY_MAX_AGE
+
+
+def revalidation_headers(entry) -> dict:
+    headers = {}
+
+    if entry is None:
+        return headers
+
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last-modified"):
+        headers["If-Modified-Since"] = entry["last-modified"]
+
+    return headers
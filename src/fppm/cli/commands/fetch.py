@@ -0,0 +1,94 @@
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import fppm.cli.utils as FppmUtils
+import fppm.cli.cache as FppmCache
+import fppm.cli.git as FppmGit
+import fppm.cli.store as FppmStore
+import fppm.cli.project as FppmProject
+import fppm.cli.commands.install as cmd_install
+import fppm.cli.commands.registries as cmd_registries
+
+
+def fetch_source(resolved) -> int:
+    # download a package version into the git store, and into the package
+    # store when packages are linked from it
+    packageName = resolved["name"]
+    gitUrl = resolved["package"]["info"]["git"]
+
+    try:
+        mirrorPath = FppmGit.update_mirror(gitUrl)
+    except subprocess.CalledProcessError as e:
+        FppmUtils.print_error(
+            f"[ERR]: Error fetching package [{packageName}]: {e.stderr or e}"
+        )
+        return 1
+
+    commit = (
+        FppmGit.resolve_revision(mirrorPath, resolved["revision"])
+        if mirrorPath is not None
+        else None
+    )
+    if commit is None:
+        FppmUtils.print_error(
+            f"[ERR]: Version {resolved['version']} of package [{packageName}] was not found in its repository."
+        )
+        return 1
+
+    linkMode = resolved["link"] or FppmStore.LINK_MODE
+    if linkMode != "clone":
+        subdirectory = cmd_install.package_subdirectory(resolved)
+        try:
+            FppmStore.add_tree(
+                mirrorPath,
+                commit if subdirectory is None else f"{commit}:{subdirectory}",
+                FppmGit.tree_hash(mirrorPath, commit, subdirectory),
+            )
+        except (subprocess.CalledProcessError, OSError) as e:
+            FppmUtils.print_error(
+                f"[ERR]: Error adding package [{packageName}] to the package store: {e}"
+            )
+            return 1
+
+    FppmUtils.print_success(
+        f"[DONE]: Fetched package [{packageName}] at {cmd_install.version_text(resolved['version'])} {resolved['version']}"
+    )
+    return 0
+
+
+def fetch_project(args, context):
+    projectYamlPath = "./project.yaml"
+
+    if args.project_yaml_path is not None:
+        projectYamlPath = args.project_yaml_path
+
+    if FppmCache.is_offline():
+        FppmUtils.print_error(f"[ERR]: Cannot fetch packages in offline mode.")
+        return 1
+
+    # project files are only read: nothing is written to the project
+    session = FppmProject.ProjectSession(projectYamlPath)
+    if session.load() == 1:
+        return 1
+
+    # refresh every registry, so that unlocked packages can be resolved offline
+    print(f"[INFO]: Fetching registries...")
+    if cmd_registries.get_package_index(session.registries) == 1:
+        return 1
+
+    resolvedProject = cmd_install.resolve_project_packages(args, session)
+    if resolvedProject == 1:
+        return 1
+    resolvedPackages, failed = resolvedProject
+
+    jobs = max(1, getattr(args, "jobs", None) or 1)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        fetched = list(pool.map(fetch_source, resolvedPackages))
+
+    if failed or any(result == 1 for result in fetched):
+        FppmUtils.print_error(f"[ERR]: Some packages could not be fetched.")
+        return 1
+
+    FppmUtils.print_success(
+        f"[DONE]: Fetched {len(resolvedPackages)} package(s). Run `fppm --offline install --project` to install them without the network."
+    )
+    return 0
@@ -4,8 +4,20 @@ import os
 import fppm.cli.commands.registries as cmd_registries
 import glob
 import subprocess
+import tarfile
+import tempfile
+import requests
 from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
 import fppm.cli.utils as FppmUtils
+import fppm.cli.cache as FppmCache
+import fppm.cli.archive as FppmArchive
+import fppm.cli.git as FppmGit
+import fppm.cli.journal as FppmJournal
+import fppm.cli.lock as FppmLock
+import fppm.cli.store as FppmStore
+import fppm.cli.resolver as FppmResolver
+import fppm.cli.project as FppmProject
 
 
 def setup_ephemeral():
@@ -41,45 +53,87 @@ def setup_ephemeral():
                     return 1
 
 
-def add_package_to_cmake(folderName):
-    if os.path.exists("_fprime_packages"):
-        pass
-    else:
-        setup_ephemeral()
-
-    lineToAdd = 'add_fprime_subdirectory("${CMAKE_CURRENT_LIST_DIR}'
-    lineToAdd += f'/{folderName}")\n'
-
-    if os.path.exists("_fprime_packages/CMakeLists.txt"):
-
-        if lineToAdd in open("_fprime_packages/CMakeLists.txt").read():
-            pass
-        else:
-            with open("_fprime_packages/CMakeLists.txt", "a") as cmake:
-                cmake.write(lineToAdd)
-
-    else:
-        with open("_fprime_packages/CMakeLists.txt", "w") as cmake:
-            cmake.write(lineToAdd)
+def version_ref(packageVersion) -> str:
+    # versions starting with "v" are tags, anything else is a commit hash
+    if "v" == packageVersion[0]:
+        return f"tags/{packageVersion}"
+    return packageVersion
+
+
+def offline_unavailable_reason(
+    packageFolderName, packageVersion, gitUrl=None, revision=None
+):
+    # returns why a package cannot be installed from local clones, or None
+    revision = revision or version_ref(packageVersion)
+    packagePath = f"_fprime_packages/{packageFolderName}"
+    if is_package_clone(packagePath):
+        if FppmGit.has_revision(packagePath, revision):
+            return None
+        return f"version {packageVersion} is not present in its local clone"
+
+    # not installed yet: it can still be cloned from the git store
+    mirrorPath = FppmGit.mirror_path(gitUrl) if gitUrl is not None else None
+    if mirrorPath is None or not os.path.isdir(mirrorPath):
+        return "it has no local clone or cached mirror to install from"
+    if not FppmGit.has_revision(mirrorPath, revision):
+        return f"version {packageVersion} is not present in its cached mirror"
+
+    return None
+
+
+def is_package_clone(packagePath) -> bool:
+    # installed packages are git clones, unless linked from the package store
+    return os.path.isdir(os.path.join(packagePath, ".git"))
+
+
+def check_offline_project(content, lockEntries) -> int:
+    # verify up front that every package can be installed without the network
+    packageIndex = {}
+    if any(
+        FppmLock.locked_entry(lockEntries, package) is None
+        for package in content["packages"]
+    ):
+        packageIndex = cmd_registries.get_package_index(content.get("registries") or [])
+        if packageIndex == 1:
+            return 1
 
-    cmakeFiles = glob.glob("*.cmake")[0]
-    cmakeLineToAdd = (
-        'add_fprime_subdirectory("${CMAKE_CURRENT_LIST_DIR}/_fprime_packages")\n'
-    )
+    unavailable = []
+    for package in content["packages"]:
+        lockEntry = FppmLock.locked_entry(lockEntries, package)
+        if lockEntry is not None:
+            reason = offline_unavailable_reason(
+                package["name"].replace("/", "."),
+                package["version"],
+                lockEntry["git"],
+                lockEntry["commit"],
+            )
+            if reason is not None:
+                unavailable.append(f"[{package['name']}]: {reason}")
+            continue
 
-    if cmakeLineToAdd in open(cmakeFiles).read():
-        return 0
+        if package["name"] not in packageIndex:
+            unavailable.append(
+                f"[{package['name']}]: not found in the cached registries"
+            )
+            continue
 
-    askCMake = FppmUtils.prompt(
-        f"[???]: Would you like to include the _fprime_packages CMakeLists.txt file to {cmakeFiles}? (y/n): ",
-        ["y", "n"],
-    )
+        candidates = packageIndex[package["name"]]
+        reason = offline_unavailable_reason(
+            package["name"].replace("/", "."),
+            package["version"],
+            candidates[0]["info"].get("git") if len(candidates) == 1 else None,
+        )
+        if reason is not None:
+            unavailable.append(f"[{package['name']}]: {reason}")
 
-    if askCMake == "y":
-        with open(cmakeFiles, "a") as cmake:
-            cmake.write(cmakeLineToAdd)
+    if len(unavailable) > 0:
+        FppmUtils.print_error(
+            f"[ERR]: The following packages cannot be installed in offline mode:"
+        )
+        for problem in unavailable:
+            FppmUtils.print_error(f"    {problem}")
+        return 1
 
-    FppmUtils.print_success(f"[DONE]: Added _fprime_packages to {cmakeFiles}")
     return 0
 
 
@@ -91,201 +145,687 @@ def install_project_yaml(args, context):
 
     print(f"[INFO]: Finding packages in project.yaml file at {projectYamlPath}...")
 
-    path, content = cmd_registries.open_project_yaml(projectYamlPath)
+    session = FppmProject.ProjectSession(projectYamlPath)
+    if session.load() == 1:
+        return 1
 
-    if content["packages"] is None:
+    content = session.content
+    lockEntries = session.lockEntries
+    if content.get("packages") is None:
         FppmUtils.print_error(f"[ERR]: No packages found in project.yaml file.")
         return 1
 
-    for package in content["packages"]:
-        print(f"[INFO]: Installing package [{package['name']}]...")
-        install_package(
+    if getattr(args, "frozen", False):
+        mismatches = FppmLock.lock_mismatches(lockEntries, content["packages"])
+        if len(mismatches) > 0:
+            FppmUtils.print_error(
+                f"[ERR]: {FppmLock.lock_path(projectYamlPath)} does not match {projectYamlPath}:"
+            )
+            for mismatch in mismatches:
+                FppmUtils.print_error(f"    {mismatch}")
+            return 1
+
+    if FppmCache.is_offline() and check_offline_project(content, lockEntries) == 1:
+        return 1
+
+    # fetch the registries the lookups consult concurrently up front, resolving
+    # packages is then served from memory. Locked packages need no registry,
+    # and only the namespaces of the unlocked ones are built.
+    unlockedPackages = [
+        package
+        for package in content["packages"]
+        if FppmLock.locked_entry(lockEntries, package) is None
+    ]
+    if (
+        len(unlockedPackages) > 0
+        and cmd_registries.get_package_index(
+            cmd_registries.lookup_registries(
+                unlockedPackages, content.get("registries") or []
+            ),
+            sorted({package["name"].split("/")[0] for package in unlockedPackages}),
+        )
+        == 1
+    ):
+        return 1
+
+    resolvedProject = resolve_project_packages(args, session)
+    if resolvedProject == 1:
+        return 1
+    resolvedPackages, failed = resolvedProject
+
+    setup_ephemeral()
+    journal = open_journal()
+
+    # clones and checkouts of different packages are independent
+    jobs = max(1, getattr(args, "jobs", None) or 1)
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        fetched = list(
+            pool.map(
+                lambda resolved: fetch_journaled(journal, resolved), resolvedPackages
+            )
+        )
+
+    installedPackages = [
+        resolved for resolved, result in zip(resolvedPackages, fetched) if result != 1
+    ]
+    if len(installedPackages) < len(resolvedPackages):
+        failed = True
+
+    # project.yaml and the CMake files are updated once, for all packages
+    if record_packages(session, installedPackages) == 1:
+        return 1
+
+    if failed:
+        FppmUtils.print_error(
+            f"[ERR]: Some packages could not be installed. Run the install again to resume it."
+        )
+        return 1
+
+    journal.clear()
+    return 0
+
+
+def resolve_project_packages(args, session):
+    """
+    Resolves the packages of project.yaml and their dependencies: locked
+    packages at their locked commit, the others from the registries
+
+    Returns:
+        tuple: (resolved packages, whether some packages could not be
+        resolved), or 1 if the dependencies cannot be resolved
+    """
+
+    lockEntries = session.lockEntries
+    failed = False
+    resolvedPackages = []
+    for package in session.packages:
+        lockEntry = FppmLock.locked_entry(lockEntries, package)
+        if lockEntry is not None:
+            resolvedPackages.append(resolve_locked_package(args, package, lockEntry))
+            continue
+
+        resolved = resolve_package(
             Namespace(
                 package=package["name"],
                 version=package["version"],
-                project_yaml_path=projectYamlPath,
+                registry=package.get("registry"),
+                fetch_strategy=getattr(args, "fetch_strategy", None),
+                link_mode=getattr(args, "link_mode", None),
             ),
-            {},
+            session,
         )
+        if resolved == 1:
+            failed = True
+        else:
+            resolvedPackages.append(resolved)
+
+    if all(
+        FppmLock.locked_entry(lockEntries, package) is not None
+        for package in session.packages
+    ):
+        # the dependencies of locked packages are locked as well, the ones no
+        # longer required by a package of project.yaml are left out
+        for lockEntry in FppmLock.prune_lock(
+            lockEntries, {package["name"] for package in session.packages}
+        ).values():
+            if lockEntry.get("required-by"):
+                resolvedPackages.append(
+                    resolve_locked_package(
+                        args,
+                        {"name": lockEntry["name"], "version": lockEntry["version"]},
+                        lockEntry,
+                    )
+                )
+    else:
+        dependencies = resolve_package_dependencies(args, session, resolvedPackages)
+        if dependencies == 1:
+            return 1
+        resolvedPackages += dependencies
 
+    return (resolvedPackages, failed)
 
-def install_package(args, context):
-    if (args.package is None and args.version is None) or args.project:
-        return install_project_yaml(args, context)
 
-    package = None
-    if validators.url(args.package) != True:
-        # check the registries
-        print(f"[INFO]: Checking registries for package [{args.package}]...")
+def resolve_package_dependencies(args, session, roots, installed=None):
+    # transitive dependencies of the packages to install, declared in their
+    # package.yaml, or 1 if they cannot be resolved
+    print(f"[INFO]: Resolving package dependencies...")
 
-        if args.project_yaml_path is not None or args.project_yaml_path != "":
-            projectYamlPath = args.project_yaml_path
-        else:
-            projectYamlPath = "./project.yaml"
+    lookups = {}
 
-        package = cmd_registries.shortname_to_git(projectYamlPath, args.package)
-        if package == 1:
-            return 1
+    def lookup_package(shortname):
+        if shortname not in lookups:
+            package = cmd_registries.shortname_to_git(
+                session.projectYamlPath, shortname, registries=session.registries
+            )
+            lookups[shortname] = None if package == 1 else package
+        return lookups[shortname]
+
+    try:
+        dependencies = FppmResolver.resolve_dependencies(
+            {
+                resolved["name"]: (
+                    resolved["version"],
+                    resolved["package"],
+                    resolved["revision"],
+                )
+                for resolved in roots
+            },
+            lookup_package,
+            version_ref,
+            installed,
+            max(1, getattr(args, "jobs", None) or 1),
+        )
+    except (ValueError, subprocess.CalledProcessError) as e:
+        FppmUtils.print_error(f"[ERR]: Error resolving package dependencies: {e}")
+        return 1
 
+    resolvedDependencies = []
+    for shortname in sorted(dependencies):
+        version, package, requiredBy = dependencies[shortname]
         print(
-            f"[INFO]: Located package in {package['registry']} (published by: {package['publisher']})"
+            f"[INFO]: Package [{shortname}] {version} is required by {', '.join(f'[{name}]' for name in requiredBy)}"
+        )
+        resolvedDependencies.append(
+            {
+                "name": shortname,
+                "folder": shortname.replace("/", "."),
+                "version": version,
+                "revision": version_ref(version),
+                "registry": None,
+                "package": package,
+                "strategy": getattr(args, "fetch_strategy", None),
+                "link": getattr(args, "link_mode", None),
+                "required-by": requiredBy,
+            }
         )
-        setup_ephemeral()
 
-        packageFolderName = args.package.replace("/", ".")
-        existingPackage = None
-        try:
-            existingPackage = glob.glob(f"_fprime_packages/{packageFolderName}*")
-        except Exception as e:
-            FppmUtils.print_error(f"[ERR]: Error checking for existing package: {e}")
+    return resolvedDependencies
+
+
+def resolve_locked_package(args, package, lockEntry) -> dict:
+    # a package locked in project.lock is checked out at its locked commit
+    print(
+        f"[INFO]: Using locked commit {lockEntry['commit']} for package [{package['name']}]"
+    )
+
+    return {
+        "name": package["name"],
+        "folder": package["name"].replace("/", "."),
+        "version": package["version"],
+        "revision": lockEntry["commit"] or version_ref(package["version"]),
+        "registry": package.get("registry"),
+        "package": {
+            "registry": lockEntry["registry"],
+            "publisher": None,
+            "info": {
+                "git": lockEntry["git"],
+                "archive": lockEntry.get("archive"),
+                "package": lockEntry.get("package"),
+            },
+        },
+        "strategy": getattr(args, "fetch_strategy", None),
+        "link": getattr(args, "link_mode", None),
+        "tree": lockEntry["tree"],
+        "archive-sha256": lockEntry.get("archive-sha256"),
+        "required-by": lockEntry.get("required-by"),
+    }
+
+
+def resolve_package(args, session):
+    # find the package in the registries and the version to install
+    print(f"[INFO]: Checking registries for package [{args.package}]...")
+
+    pinnedRegistry = getattr(args, "registry", None)
+    package = cmd_registries.shortname_to_git(
+        session.projectYamlPath,
+        args.package,
+        pinnedRegistry,
+        registries=session.registries,
+    )
+    if package == 1:
+        return 1
+
+    print(
+        f"[INFO]: Located package in {package['registry']} (published by: {package['publisher']})"
+    )
+
+    packageVersion = None
+    if args.version is not None:
+        packageVersion = args.version
+    else:
+        if package["info"].get("stable") is not None:
+            packageVersion = package["info"]["stable"]
+        else:
+            FppmUtils.print_error(
+                f"[ERR]: No stable version found for package [{args.package}]. Please provide a package version to install."
+            )
             return 1
 
-        packageVersion = None
-        if args.version is not None:
-            packageVersion = args.version
+    return {
+        "name": args.package,
+        "folder": args.package.replace("/", "."),
+        "version": packageVersion,
+        "revision": version_ref(packageVersion),
+        "registry": pinnedRegistry,
+        "package": package,
+        "strategy": getattr(args, "fetch_strategy", None),
+        "link": getattr(args, "link_mode", None),
+    }
+
+
+def package_subdirectory(resolved):
+    # subdirectory of its repository a package lives in, for registry entries
+    # sharing a repository (the `package` key), or None
+    subdirectory = str(resolved["package"]["info"].get("package") or "").strip("/")
+    return subdirectory or None
+
+
+def package_cmake_folder(resolved) -> str:
+    # folder of _fprime_packages holding the CMakeLists.txt of a package
+    subdirectory = package_subdirectory(resolved)
+    if subdirectory is None:
+        return resolved["folder"]
+    return f"{resolved['folder']}/{subdirectory}"
+
+
+def checkout_version(packagePath, revision):
+    FppmGit.backend().checkout(packagePath, revision)
+
+
+def version_text(packageVersion) -> str:
+    return "version" if "v" == packageVersion[0] else "commit hash"
+
+
+def staging_dir() -> str:
+    # packages are prepared in a hidden directory of _fprime_packages, on the
+    # same filesystem, so that moving them in place is a rename
+    return tempfile.mkdtemp(dir="_fprime_packages", prefix=".tmp-")
+
+
+def clean_staging():
+    # staging directories and files left behind by an interrupted install
+    for stagingPath in glob.glob("_fprime_packages/.tmp-*"):
+        if os.path.isdir(stagingPath) and not os.path.islink(stagingPath):
+            shutil.rmtree(stagingPath, ignore_errors=True)
         else:
-            if package["info"]["stable"] is not None:
-                packageVersion = package["info"]["stable"]
-            else:
-                FppmUtils.print_error(
-                    f"[ERR]: No stable version found for package [{args.package}]. Please provide a package version to install."
-                )
-                return 1
+            os.remove(stagingPath)
+
+
+def move_into_place(stagedPath, packagePath):
+    """
+    Replaces packagePath with a staged package. The previous package is moved
+    aside first, and restored if the staged package cannot be moved in place.
+
+    Args:
+        stagedPath (str): Staged package, in a staging directory
+        packagePath (str): Final location of the package
+    """
+
+    previousPath = None
+    if os.path.lexists(packagePath):
+        previousPath = f"{stagedPath}.previous"
+        os.rename(packagePath, previousPath)
+
+    try:
+        os.rename(stagedPath, packagePath)
+    except OSError:
+        if previousPath is not None:
+            os.rename(previousPath, packagePath)
+        raise
+
+    if previousPath is not None:
+        remove_package_path(previousPath)
+
+
+def open_journal():
+    # journal of this install, resuming an interrupted one if there is any
+    clean_staging()
+    journal = FppmJournal.InstallJournal()
+    if len(journal.load()) > 0:
+        print(f"[INFO]: Resuming an interrupted install...")
+    return journal
+
+
+def fetch_journaled(journal, resolved) -> int:
+    # fetch a package, unless an interrupted install already did
+    linkMode = resolved["link"] or FppmStore.LINK_MODE
+    completed = journal.completed(resolved, linkMode)
+    if completed is not None:
+        print(
+            f"[INFO]: Package [{resolved['name']}] was already installed by an interrupted install."
+        )
+        resolved.update(completed)
+        return 0
+
+    if fetch_package(resolved) == 1:
+        return 1
+
+    try:
+        journal.record(resolved, linkMode)
+    except OSError as e:
+        FppmUtils.print_warning(f"[WARN]: Error writing the install journal: {e}")
+    return 0
+
+
+def record_checkout(resolved, packagePath, headCommit=None) -> int:
+    # record what was checked out for project.lock, and verify locked packages.
+    # headCommit is the commit of HEAD when the caller already resolved it.
+    resolved["commit"] = headCommit or FppmGit.resolve_revision(packagePath, "HEAD")
+    lockedTree = resolved.get("tree")
+    resolved["tree"] = FppmGit.tree_hash(
+        packagePath, subdirectory=package_subdirectory(resolved)
+    )
+    if lockedTree is not None and resolved["tree"] != lockedTree:
+        FppmUtils.print_error(
+            f"[ERR]: Package [{resolved['name']}] does not match project.lock: expected tree {lockedTree}, got {resolved['tree']}."
+        )
+        return 1
+    return 0
 
-        if existingPackage is not None and len(existingPackage) > 0:
-            print(
-                f"[INFO]: Package [{args.package}] already exists in _fprime_packages. Changing version..."
+
+def fetch_package(resolved) -> int:
+    # clone or check out a resolved package in _fprime_packages. This runs
+    # concurrently for several packages, so it must not change directory.
+    packageName = resolved["name"]
+    packageFolderName = resolved["folder"]
+    packageVersion = resolved["version"]
+    revision = resolved["revision"]
+    packagePath = f"_fprime_packages/{packageFolderName}"
+
+    if FppmCache.is_offline():
+        unavailableReason = offline_unavailable_reason(
+            packageFolderName,
+            packageVersion,
+            resolved["package"]["info"].get("git"),
+            revision,
+        )
+        if unavailableReason is not None:
+            FppmUtils.print_error(
+                f"[ERR]: Cannot install package [{packageName}] in offline mode: {unavailableReason}."
             )
-            try:
-                os.chdir(existingPackage[0])
-                subprocess.check_call(
-                    ["git", "fetch"], stderr=subprocess.PIPE, stdout=subprocess.PIPE
-                )
+            return 1
 
-                stashed = subprocess.check_call(
-                    ["git", "stash"], stderr=subprocess.PIPE, stdout=subprocess.PIPE
+    linkMode = resolved["link"] or FppmStore.LINK_MODE
+    if linkMode != "clone":
+        return link_package(resolved, linkMode)
+
+    # packages published as archives are downloaded instead of cloned, unless
+    # a fetch strategy is requested or the package is already a clone
+    archiveTemplate = resolved["package"]["info"].get("archive")
+    if (
+        archiveTemplate
+        and (resolved["strategy"] or FppmGit.FETCH_STRATEGY) is None
+        and not FppmCache.is_offline()
+        and not is_package_clone(packagePath)
+    ):
+        installed = archive_package(resolved, archiveTemplate)
+        if installed is not None:
+            return installed
+
+    # packages linked from the store are replaced by a clone
+    headCommit = None
+    if is_package_clone(packagePath) and not os.path.islink(packagePath):
+        print(
+            f"[INFO]: Package [{packageName}] already exists in _fprime_packages. Changing version..."
+        )
+        try:
+            targetCommit = FppmGit.resolve_revision(packagePath, revision)
+
+            if targetCommit is not None and targetCommit == FppmGit.resolve_revision(
+                packagePath, "HEAD"
+            ):
+                headCommit = targetCommit
+                print(
+                    f"[INFO]: Package [{packageName}] is already at {version_text(packageVersion)} {packageVersion}."
                 )
+            else:
+                # only go to the network for revisions missing locally
+                if targetCommit is None and not FppmCache.is_offline():
+                    FppmGit.fetch_revision(packagePath, revision)
 
-                if "v" == packageVersion[0]:
-                    subprocess.check_call(
-                        ["git", "checkout", f"tags/{packageVersion}"],
-                        stderr=subprocess.PIPE,
-                        stdout=subprocess.PIPE,
-                    )
-                else:
-                    subprocess.check_call(
-                        ["git", "checkout", f"{packageVersion}"],
-                        stderr=subprocess.PIPE,
-                        stdout=subprocess.PIPE,
-                    )
+                if FppmGit.has_local_changes(packagePath):
+                    FppmGit.backend().stash(packagePath)
+
+                checkout_version(packagePath, revision)
 
-                os.chdir("../../")
-                versionTextTernary = (
-                    "version" if "v" == packageVersion[0] else "commit hash"
-                )
                 FppmUtils.print_success(
-                    f"[DONE]: Changed installed package [{args.package}] to {versionTextTernary} {packageVersion}"
-                )
-            except Exception as e:
-                FppmUtils.print_error(f"[ERR]: Error changing package version: {e}")
-                return 1
-        else:
-            # clone the package
-            print(f"[INFO]: Cloning package [{args.package}]...")
-
-            try:
-                subprocess.check_call(
-                    [
-                        "git",
-                        "clone",
-                        package["info"]["git"],
-                        f"_fprime_packages/{packageFolderName}",
-                    ],
-                    stderr=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
+                    f"[DONE]: Changed installed package [{packageName}] to {version_text(packageVersion)} {packageVersion}"
                 )
-                os.chdir(f"_fprime_packages/{packageFolderName}")
+        except Exception as e:
+            FppmUtils.print_error(f"[ERR]: Error changing package version: {e}")
+            return 1
+    else:
+        # clone the package in a staging directory, it only replaces the
+        # installed package once it is checked out and verified
+        print(f"[INFO]: Cloning package [{packageName}]...")
 
-                if "v" == packageVersion[0]:
-                    subprocess.check_call(
-                        ["git", "checkout", f"tags/{packageVersion}"],
-                        stderr=subprocess.PIPE,
-                        stdout=subprocess.PIPE,
-                    )
-                else:
-                    subprocess.check_call(
-                        ["git", "checkout", f"{packageVersion}"],
-                        stderr=subprocess.PIPE,
-                        stdout=subprocess.PIPE,
-                    )
+        stagingPath = staging_dir()
+        try:
+            stagedPath = os.path.join(stagingPath, packageFolderName)
+            FppmGit.clone_package(
+                resolved["package"]["info"]["git"],
+                stagedPath,
+                revision,
+                resolved["strategy"],
+                package_subdirectory(resolved),
+            )
 
-                os.chdir("../../")
-                versionTextTernary = (
-                    "version" if "v" == packageVersion[0] else "commit hash"
-                )
+            checkout_version(stagedPath, revision)
 
-                FppmUtils.print_success(
-                    f"[DONE]: Installed package [{args.package}] at {versionTextTernary} {packageVersion}"
-                )
-            except Exception as e:
-                FppmUtils.print_error(f"[ERR]: Error cloning package: {e}")
+            if record_checkout(resolved, stagedPath) == 1:
                 return 1
 
-        # add version to end of package folder
-        packagePath = (
-            f"_fprime_packages/{packageFolderName}"
-            if existingPackage is None or len(existingPackage) == 0
-            else existingPackage[0]
-        )
-
-        try:
-            os.rename(packagePath, f"_fprime_packages/{packageFolderName}")
+            move_into_place(stagedPath, packagePath)
         except Exception as e:
-            FppmUtils.print_error(f"[ERR]: Error renaming package folder: {e}")
+            FppmUtils.print_error(f"[ERR]: Error cloning package: {e}")
             return 1
+        finally:
+            shutil.rmtree(stagingPath, ignore_errors=True)
+
+        FppmUtils.print_success(
+            f"[DONE]: Installed package [{packageName}] at {version_text(packageVersion)} {packageVersion}"
+        )
+        return 0
+
+    return record_checkout(resolved, packagePath, headCommit)
+
+
+def remove_package_path(packagePath):
+    if os.path.islink(packagePath):
+        os.remove(packagePath)
+    elif os.path.isdir(packagePath):
+        FppmStore.remove_path(packagePath)
+
 
-        # add package to project.yaml
+def archive_package(resolved, archiveTemplate):
+    # install a package from an archive, None when git must be used instead
+    packageName = resolved["name"]
+    packagePath = f"_fprime_packages/{resolved['folder']}"
+    url = FppmArchive.archive_url(archiveTemplate, resolved["revision"])
+
+    print(f"[INFO]: Downloading package [{packageName}] from {url}...")
+
+    stagingPath = staging_dir()
+    try:
         try:
-            projectYamlPath, projectYamlContent = cmd_registries.open_project_yaml(
-                projectYamlPath
+            root, digest, commit = FppmArchive.extract_archive(url, stagingPath)
+        except (requests.RequestException, tarfile.TarError, OSError) as e:
+            FppmUtils.print_warning(
+                f"[WARN]: Archive of package [{packageName}] is not available ({e}), falling back to git."
             )
-            if projectYamlContent == 1:
-                return 1
+            return None
+
+        lockedDigest = resolved.get("archive-sha256")
+        if lockedDigest is not None and digest != lockedDigest:
+            FppmUtils.print_error(
+                f"[ERR]: Package [{packageName}] does not match project.lock: expected archive sha256 {lockedDigest}, got {digest}."
+            )
+            return 1
 
-            if projectYamlContent.get("packages") is None:
-                projectYamlContent["packages"] = []
+        move_into_place(root, packagePath)
+    except Exception as e:
+        FppmUtils.print_error(f"[ERR]: Error installing package archive: {e}")
+        return 1
+    finally:
+        shutil.rmtree(stagingPath, ignore_errors=True)
+
+    resolved["commit"] = commit
+    resolved["tree"] = None
+    resolved["archive"] = url
+    resolved["archive-sha256"] = digest
 
-            alreadyExists = False
-            for package in projectYamlContent["packages"]:
-                if package["name"] == args.package:
-                    package["version"] = packageVersion
-                    alreadyExists = True
+    FppmUtils.print_success(
+        f"[DONE]: Installed package [{packageName}] at {version_text(resolved['version'])} {resolved['version']}"
+    )
+    return 0
 
-            if alreadyExists == False:
-                projectYamlContent["packages"].append(
-                    {"name": args.package, "version": packageVersion}
+
+def link_package(resolved, linkMode) -> int:
+    # install a package as links into the package store instead of a clone
+    packageName = resolved["name"]
+    packagePath = f"_fprime_packages/{resolved['folder']}"
+    revision = resolved["revision"]
+    lockedTree = resolved.get("tree")
+    subdirectory = package_subdirectory(resolved)
+
+    try:
+        if lockedTree is not None and FppmStore.has_tree(lockedTree):
+            # locked packages already in the store need no git at all
+            commit, treeHash = revision, lockedTree
+        else:
+            mirrorPath = FppmGit.update_mirror(resolved["package"]["info"]["git"])
+            commit = (
+                FppmGit.resolve_revision(mirrorPath, revision)
+                if mirrorPath is not None
+                else None
+            )
+            if commit is None:
+                FppmUtils.print_error(
+                    f"[ERR]: Version {resolved['version']} of package [{packageName}] was not found in its repository."
                 )
-                FppmUtils.print_success(
-                    f"[DONE]: Added package [{args.package}] to project.yaml file."
+                return 1
+
+            treeHash = FppmGit.tree_hash(mirrorPath, commit, subdirectory)
+            if lockedTree is not None and treeHash != lockedTree:
+                FppmUtils.print_error(
+                    f"[ERR]: Package [{packageName}] does not match project.lock: expected tree {lockedTree}, got {treeHash}."
                 )
+                return 1
+
+            FppmStore.add_tree(
+                mirrorPath,
+                commit if subdirectory is None else f"{commit}:{subdirectory}",
+                treeHash,
+            )
+
+        if is_package_clone(packagePath) and FppmGit.has_local_changes(packagePath):
+            FppmUtils.print_error(
+                f"[ERR]: Package [{packageName}] has local changes. Commit or revert them before linking it from the store."
+            )
+            return 1
+
+        stagingPath = staging_dir()
+        try:
+            stagedPath = os.path.join(stagingPath, resolved["folder"])
+            if subdirectory is None:
+                FppmStore.link_tree(treeHash, stagedPath, linkMode)
             else:
-                FppmUtils.print_success(
-                    f"[DONE]: Updated package [{args.package}] to version {packageVersion} in project.yaml file."
-                )
+                # the package keeps its place in the layout of its repository
+                linkPath = os.path.join(stagedPath, subdirectory)
+                os.makedirs(os.path.dirname(linkPath))
+                FppmStore.link_tree(treeHash, linkPath, linkMode)
+            move_into_place(stagedPath, packagePath)
+        finally:
+            shutil.rmtree(stagingPath, ignore_errors=True)
+    except Exception as e:
+        FppmUtils.print_error(f"[ERR]: Error linking package from the store: {e}")
+        return 1
+
+    resolved["commit"] = commit
+    resolved["tree"] = treeHash
+
+    FppmUtils.print_success(
+        f"[DONE]: Linked package [{packageName}] at {version_text(resolved['version'])} {resolved['version']}"
+    )
+    return 0
+
+
+def record_packages(session, resolvedPackages) -> int:
+    # add installed packages to project.yaml, project.lock, the CMake files and
+    # the state manifest, which are written once for all packages
+    if len(resolvedPackages) == 0:
+        return 0
 
-            write = cmd_registries.write_to_project_yaml(
-                projectYamlPath, projectYamlContent
+    for resolved in resolvedPackages:
+        session.add_cmake_subdirectory(package_cmake_folder(resolved))
+        session.record_installed(resolved, resolved["link"] or FppmStore.LINK_MODE)
+
+        if resolved.get("required-by"):
+            # dependencies are only recorded in project.lock
+            continue
+
+        if session.set_package(
+            resolved["name"], resolved["version"], resolved["registry"]
+        ):
+            FppmUtils.print_success(
+                f"[DONE]: Added package [{resolved['name']}] to project.yaml file."
             )
-            if write == 1:
-                return 1
+        else:
+            FppmUtils.print_success(
+                f"[DONE]: Updated package [{resolved['name']}] to version {resolved['version']} in project.yaml file."
+            )
+
+    session.lock_packages(resolvedPackages)
+
+    try:
+        return session.commit()
+    except Exception as e:
+        FppmUtils.print_error(f"[ERR]: Error adding package to project.yaml: {e}")
+        return 1
+
+
+def install_package(args, context):
+    if (args.package is None and args.version is None) or args.project:
+        return install_project_yaml(args, context)
+
+    if validators.url(args.package) != True:
+        if args.project_yaml_path is not None and args.project_yaml_path != "":
+            projectYamlPath = args.project_yaml_path
+        else:
+            projectYamlPath = "./project.yaml"
+
+        session = FppmProject.ProjectSession(projectYamlPath)
+        if session.load() == 1:
+            return 1
+
+        resolved = resolve_package(args, session)
+        if resolved == 1:
+            return 1
+
+        # other packages of the project keep their version
+        installed = {
+            package["name"]: package["version"]
+            for package in session.packages
+            if package["name"] != resolved["name"]
+        }
 
-            addToCmake = add_package_to_cmake(packageFolderName)
+        dependencies = resolve_package_dependencies(
+            args, session, [resolved], installed
+        )
+        if dependencies == 1:
+            return 1
+
+        setup_ephemeral()
+        journal = open_journal()
 
-            if addToCmake == 1:
+        for package in [resolved] + dependencies:
+            if fetch_journaled(journal, package) == 1:
                 return 1
 
-        except Exception as e:
-            FppmUtils.print_error(f"[ERR]: Error adding package to project.yaml: {e}")
+        if record_packages(session, [resolved] + dependencies) == 1:
             return 1
+
+        journal.clear()
+        return 0
     else:
         pass
@@ -6,6 +6,7 @@ from pathlib import Path
 import sys
 import subprocess
 import fppm.cli.utils as FppmUtils
+import fppm.cli.git as FppmGit
 
 
 # context is usually empty unless unit testing
@@ -14,9 +15,7 @@ def create_new_package_yml(args, context):
     userProvidedGitURL = hasattr(args, "git_url") and args.git_url is not None
     if userProvidedGitURL:
         try:
-            validate = subprocess.run(
-                ["git", "ls-remote", args.git_url], capture_output=True, check=True
-            )
+            FppmGit.backend().ls_remote(args.git_url)
         except subprocess.CalledProcessError as e:
             FppmUtils.print_error(
                 f"[ERR]: Invalid git URL provided. Please provide a valid git URL."
@@ -81,22 +80,15 @@ def create_new_package_yml(args, context):
 
     if not skipGitSetup:
         # check if package was created inside a git repo
-        isInGitRepo = False
-        try:
-            validate = subprocess.run(
-                ["git", "status"], cwd=gen_path, capture_output=True, check=True
-            )
+        isInGitRepo = FppmGit.backend().is_repository(gen_path)
+        if isInGitRepo:
             print(f"[INFO]: Detected package created in a git repo.")
-            isInGitRepo = True
-        except subprocess.CalledProcessError:
+        else:
             print(f"[INFO]: Detected not in a git repo.")
-            isInGitRepo = False
 
         try:
             print(f"[INFO]: Setting up package as a git repo...")
-            gitInit = subprocess.run(
-                ["git", "init"], cwd=gen_path, capture_output=True, check=True
-            )
+            FppmGit.backend().init(gen_path)
         except subprocess.CalledProcessError as e:
             FppmUtils.print_error(f"[ERR]: Failed to set up package as a git repo: {e}")
             return 1
@@ -104,12 +96,7 @@ def create_new_package_yml(args, context):
         if args.git_url is not None:
             try:
                 print(f"[INFO]: Setting up remote origin...")
-                addRemoteSource = subprocess.run(
-                    ["git", "remote", "add", "origin", args.git_url],
-                    cwd=gen_path,
-                    capture_output=True,
-                    check=True,
-                )
+                FppmGit.backend().add_remote(gen_path, "origin", args.git_url)
             except subprocess.CalledProcessError as e:
                 FppmUtils.print_error(f"[ERR]: Failed to set up remote origin. {e}")
                 return 1
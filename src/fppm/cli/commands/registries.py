@@ -3,9 +3,37 @@ import requests
 import yaml
 import os
 import fppm.cli.utils as FppmUtils
-
-
-def shortname_to_git(project_yaml_path, shortname: str):
+import fppm.cli.cache as FppmCache
+import fppm.cli.index as FppmIndex
+import fppm.cli.registry_format as RegistryFormat
+import email.utils
+import queue
+import threading
+import time
+
+# registries are fetched concurrently, each within its own deadline (seconds),
+# counted from when its fetch starts
+REGISTRY_FETCH_JOBS = 8
+REGISTRY_TIMEOUT = float(os.environ.get("FPPM_REGISTRY_TIMEOUT", 30))
+
+# registries larger than this (bytes) are rejected, 0 disables the limit
+REGISTRY_MAX_BYTES = int(os.environ.get("FPPM_REGISTRY_MAX_BYTES", 64 * 1024 * 1024))
+
+# cached registries are served immediately; past their freshness window
+# (FPPM_REGISTRY_MAX_AGE) they are refreshed in the background unless
+# FPPM_REGISTRY_BACKGROUND_REFRESH=0, in which case they are revalidated first
+REGISTRY_BACKGROUND_REFRESH = os.environ.get(
+    "FPPM_REGISTRY_BACKGROUND_REFRESH", "1"
+) not in ("", "0")
+
+# registries obtained during this invocation: url -> (content, revision,
+# namespaces it was parsed for, None when whole)
+_REGISTRY_MEMO = {}
+_REGISTRY_MEMO_LOCK = threading.Lock()
+_REFRESHING_REGISTRIES = set()
+
+
+def shortname_to_git(project_yaml_path, shortname: str, registry=None, registries=None):
     # shortnames must be in the format "namespace/package"
     if "/" not in shortname:
         FppmUtils.print_error(
@@ -15,32 +43,36 @@ def shortname_to_git(project_yaml_path, shortname: str):
 
     pathToPackage = shortname.split("/")
 
-    projectYamlPath, projectYamlContent = open_project_yaml(project_yaml_path)
-    if projectYamlContent == 1:
-        return 1
+    if registries is None:
+        projectYamlPath, projectYamlContent = open_project_yaml(project_yaml_path)
+        if projectYamlContent == 1:
+            return 1
+        registries = projectYamlContent.get("registries") or []
 
-    allLocatedPackages = []
+    packageKey = f"{pathToPackage[0]}/{pathToPackage[1]}"
 
-    for registry in projectYamlContent.get("registries"):
-        yamlContent = get_registry(registry)
-        if yamlContent == 1:
-            return 1
+    if registry is not None:
+        # the package is pinned to a registry: no other registry is consulted
+        candidateRegistries = [registry]
+    else:
+        # only consult the registries known to host the namespace
+        candidateRegistries = FppmIndex.route_namespace(pathToPackage[0], registries)
 
-        for namespace in yamlContent.get("namespaces"):
-            if pathToPackage[0] in namespace.keys():
-                for packages in namespace.get(pathToPackage[0]):
-                    if pathToPackage[1] in packages.keys():
-                        allLocatedPackages.append(
-                            {
-                                "registry": registry,
-                                "publisher": yamlContent.get("publisher"),
-                                "info": packages.get(pathToPackage[1]),
-                            }
-                        )
-                    else:
-                        pass
-            else:
-                pass
+    # registries not obtained yet only need the namespace of the package
+    packageIndex = get_package_index(candidateRegistries, [pathToPackage[0]])
+    if packageIndex == 1:
+        return 1
+
+    allLocatedPackages = packageIndex.get(packageKey, [])
+
+    if len(allLocatedPackages) == 0 and registry is None:
+        otherRegistries = [r for r in registries if r not in candidateRegistries]
+        if len(otherRegistries) > 0:
+            # routing miss: the routing table may be outdated, scan the rest
+            packageIndex = get_package_index(otherRegistries, [pathToPackage[0]])
+            if packageIndex == 1:
+                return 1
+            allLocatedPackages = packageIndex.get(packageKey, [])
 
     if len(allLocatedPackages) == 0:
         FppmUtils.print_error(
@@ -71,16 +103,63 @@ def shortname_to_git(project_yaml_path, shortname: str):
         return allLocatedPackages[0]
 
 
-def get_registry(registry_url):
+def lookup_registries(packages, registries) -> list:
+    """
+    Selects the registries that looking up the given packages consults first:
+    the registry a package is pinned to, or the ones routed to its namespace
+
+    Args:
+        packages (list): project.yaml package entries
+        registries (list): Registries of the project, in declared order
+
+    Returns:
+        list: Registries to consult, in declared order, pinned ones last
+    """
+
+    selected = set()
+    for package in packages:
+        if "/" not in package["name"]:
+            continue
+        if package.get("registry") is not None:
+            selected.add(package["registry"])
+        else:
+            selected.update(
+                FppmIndex.route_namespace(package["name"].split("/")[0], registries)
+            )
+
+    pinned = sorted(selected.difference(registries))
+    return [registry for registry in registries if registry in selected] + pinned
+
+
+def is_remote_registry(registry_url) -> bool:
+    # localhost bypass: it should still fail if invalid later on
+    return bool(validators.url(registry_url)) or "localhost" in registry_url
+
+
+def get_registry(registry_url, namespaces=None):
+    # with namespaces, only those namespaces of the registry are returned. Local
+    # registries are then parsed partially, building only those namespaces;
+    # remote registries are always obtained whole, so that they are cached.
+    with _REGISTRY_MEMO_LOCK:
+        memo = _REGISTRY_MEMO.get(registry_url)
+    if memo is not None:
+        getYamlContent, _, parsedNamespaces = memo
+        if namespaces is not None and (
+            parsedNamespaces is None or parsedNamespaces.issuperset(namespaces)
+        ):
+            return RegistryFormat.select_namespaces(getYamlContent, namespaces)
+        if parsedNamespaces is None:
+            return getYamlContent
+
     isRemoteYaml = False
     if registry_url is not None:
-        # localhost bypass: it should still fail if invalid later on
-        if validators.url(registry_url) or "localhost" in registry_url:
-            if registry_url.endswith(".yaml"):  # https://stackoverflow.com/a/21059164
+        if is_remote_registry(registry_url):
+            # https://stackoverflow.com/a/21059164
+            if RegistryFormat.registry_extension(registry_url) is not None:
                 isRemoteYaml = True
             else:
                 FppmUtils.print_error(
-                    f"[ERR]: Invalid URL [{registry_url}]: link must end in .yaml"
+                    f"[ERR]: Invalid URL [{registry_url}]: link must end in .yaml, .yaml.gz or .yaml.zst"
                 )
                 return 1
         else:
@@ -98,31 +177,408 @@ def get_registry(registry_url):
         )
         return 1
 
-    getYamlContent = None
-    try:
-        if isRemoteYaml:
-            getYamlContent = requests.get(registry_url, allow_redirects=True)
-        else:
-            with open(registry_url, "r") as f:
-                getYamlContent = yaml.safe_load(f)
-    except requests.exceptions.RequestException as e:
-        FppmUtils.print_error(f"[ERR]: Error obtaining registry [{registry_url}]: {e}")
+    # a registry parsed partially before is parsed again for the namespaces it
+    # was parsed for as well, so that the memo only ever grows
+    parsedNamespaces = None
+    if namespaces is not None:
+        parsedNamespaces = set(namespaces)
+        if memo is not None:
+            parsedNamespaces |= memo[2]
+
+    hostedNamespaces = set()
+    if isRemoteYaml:
+        getYamlContent, revision = get_remote_registry(registry_url)
+    else:
+        getYamlContent, revision = get_local_registry(
+            registry_url, parsedNamespaces, hostedNamespaces
+        )
+    if getYamlContent == 1:
         return 1
 
+    if getYamlContent is None:
+        FppmUtils.print_error(f"[ERR]: No content found in registry [{registry_url}].")
+        return 1
+
+    if len(hostedNamespaces) == 0:
+        # compiled snapshots and remote registries hold every namespace
+        hostedNamespaces = RegistryFormat.namespace_names(getYamlContent)
+        parsedNamespaces = None
+
+    # the namespaces a registry hosts are recorded whenever it is obtained, so
+    # that later lookups only consult the registries hosting their namespace
+    FppmIndex.update_namespace_routes(registry_url, hostedNamespaces)
+
+    with _REGISTRY_MEMO_LOCK:
+        _REGISTRY_MEMO[registry_url] = (getYamlContent, revision, parsedNamespaces)
+
+    if namespaces is not None:
+        return RegistryFormat.select_namespaces(getYamlContent, namespaces)
+    return getYamlContent
+
+
+def get_registry_revision(registry_url):
+    # only known once the registry has been obtained by get_registry
+    with _REGISTRY_MEMO_LOCK:
+        if registry_url in _REGISTRY_MEMO:
+            return _REGISTRY_MEMO[registry_url][1]
+    return None
+
+
+def get_local_registry(registry_url, namespaces=None, hostedNamespaces=None) -> tuple:
     try:
-        if isRemoteYaml:
-            getYamlContent = yaml.safe_load(getYamlContent.content.decode("utf-8"))
+        with open(registry_url, "rb") as f:
+            digest = RegistryFormat.file_digest(f)
+
+            # a compiled snapshot built from this exact registry.yaml skips the parse
+            compiledPath = RegistryFormat.compiled_path(registry_url)
+            if os.path.exists(compiledPath):
+                with open(compiledPath, "rb") as compiled:
+                    compiledContent = RegistryFormat.load_compiled_registry(
+                        compiled.read(), digest
+                    )
+                if compiledContent is not None:
+                    return (compiledContent, digest)
+
+            f.seek(0)
+            registryStream = RegistryFormat.open_decompressed(f, registry_url)
+            return (
+                RegistryFormat.load_registry(
+                    registryStream, namespaces, hostedNamespaces
+                ),
+                digest,
+            )
+    except (OSError, ValueError) as e:
+        FppmUtils.print_error(f"[ERR]: Error reading registry [{registry_url}]: {e}")
+        return (1, None)
     except yaml.YAMLError as e:
         FppmUtils.print_error(
             f"[ERR]: Error parsing YAML content of registry [{registry_url}]: {e}"
         )
-        return 1
+        return (1, None)
+
+
+def get_remote_compiled_registry(registry_url, cachedEntry):
+    """
+    Downloads the compiled snapshot (registry.fppmc) publishers may host next
+    to a registry.yaml. The snapshot of the previous lookup, if any, is
+    revalidated rather than downloaded again.
+
+    Returns:
+        dict: The snapshot content (None when unchanged since the previous
+        lookup), the digest of the registry.yaml it was compiled from, and its
+        ETag and Last-Modified headers. None if no readable snapshot is
+        published.
+    """
+
+    previous = (cachedEntry or {}).get("compiled")
+    try:
+        response = requests.get(
+            RegistryFormat.compiled_path(registry_url),
+            headers=FppmCache.revalidation_headers(previous),
+            allow_redirects=True,
+            timeout=REGISTRY_TIMEOUT,
+            stream=True,
+        )
+        with response:
+            if response.status_code == 304 and previous is not None:
+                return dict(previous, content=None)
+            if response.status_code != 200:
+                return None
+
+            body, _ = RegistryFormat.spool_chunks(
+                response.iter_content(RegistryFormat.SPOOL_CHUNK_BYTES),
+                REGISTRY_MAX_BYTES,
+            )
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+    with body:
+        compiledData = body.read()
+    content = RegistryFormat.load_compiled_registry(compiledData)
+    if content is None:
+        return None
+
+    return {
+        "content": content,
+        "digest": RegistryFormat.compiled_source_digest(compiledData),
+        "etag": response.headers.get("ETag"),
+        "last-modified": response.headers.get("Last-Modified"),
+    }
+
+
+def published_after(lastModified, otherLastModified) -> bool:
+    # whether a file was published no earlier than another, from their
+    # Last-Modified headers. False when either is unknown.
+    try:
+        return email.utils.parsedate_to_datetime(
+            lastModified
+        ) >= email.utils.parsedate_to_datetime(otherLastModified)
+    except (TypeError, ValueError):
+        return False
+
+
+def get_offline_registry(registry_url, cachedEntry) -> tuple:
+    if cachedEntry is None:
+        FppmUtils.print_error(
+            f"[ERR]: Registry [{registry_url}] is not cached and cannot be fetched in offline mode."
+        )
+        return (1, None)
+
+    if FppmCache.is_registry_entry_stale(cachedEntry):
+        ageHours = FppmCache.registry_entry_age(cachedEntry) / 3600
+        FppmUtils.print_warning(
+            f"[WARN]: Using stale cached registry [{registry_url}] (last fetched {ageHours:.1f} hours ago)."
+        )
+
+    return (cachedEntry["content"], cachedEntry.get("digest"))
+
+
+def get_remote_registry(registry_url) -> tuple:
+    cachedEntry = FppmCache.load_registry_entry(registry_url)
+
+    if FppmCache.is_offline():
+        return get_offline_registry(registry_url, cachedEntry)
+
+    if cachedEntry is None:
+        return fetch_remote_registry(registry_url, None)
+
+    # stale-while-revalidate: a cached copy is always served immediately, and
+    # once it is past the freshness window it is refreshed for next time
+    if FppmCache.is_registry_entry_stale(cachedEntry):
+        if REGISTRY_BACKGROUND_REFRESH:
+            refresh_registry_in_background(registry_url, cachedEntry)
+        else:
+            refreshed = fetch_remote_registry(registry_url, cachedEntry, quiet=True)
+            if refreshed[0] != 1:
+                return refreshed
+            warn_last_good_registry(registry_url, cachedEntry)
+
+    return (cachedEntry["content"], cachedEntry.get("digest"))
+
+
+def warn_last_good_registry(registry_url, cachedEntry):
+    ageHours = FppmCache.registry_entry_age(cachedEntry) / 3600
+    FppmUtils.print_warning(
+        f"[WARN]: Unable to refresh registry [{registry_url}]. Using the last good copy (fetched {ageHours:.1f} hours ago)."
+    )
+
+
+def refresh_registry_in_background(registry_url, cachedEntry):
+    # at most one refresh per registry and invocation. The thread is not a
+    # daemon so the refreshed copy is written before fppm exits.
+    with _REGISTRY_MEMO_LOCK:
+        if registry_url in _REFRESHING_REGISTRIES:
+            return
+        _REFRESHING_REGISTRIES.add(registry_url)
+
+    def refresh():
+        refreshed = fetch_remote_registry(registry_url, cachedEntry, quiet=True)
+        if refreshed[0] == 1:
+            warn_last_good_registry(registry_url, cachedEntry)
+
+    threading.Thread(target=refresh, name=f"fppm-refresh-{registry_url}").start()
+
+
+def fetch_remote_registry(registry_url, cachedEntry, quiet=False) -> tuple:
+    # revalidate the cached copy (if any) so an unchanged registry is neither
+    # transferred nor parsed again
+    try:
+        # the body is streamed into a bounded spool file and parsed from there,
+        # it is never held in memory as a whole
+        response = requests.get(
+            registry_url,
+            headers=FppmCache.revalidation_headers(cachedEntry),
+            allow_redirects=True,
+            timeout=REGISTRY_TIMEOUT,
+            stream=True,
+        )
+        with response:
+            if response.status_code == 304 and cachedEntry is not None:
+                # unchanged: restart the freshness window of the cached copy
+                return FppmCache.touch_registry_entry(registry_url, cachedEntry)
+            response.raise_for_status()
+
+            # the registry changed: a compiled snapshot published after it
+            # replaces both its download and its parse
+            snapshot = get_remote_compiled_registry(registry_url, cachedEntry)
+            if (
+                snapshot is not None
+                and snapshot["content"] is not None
+                and published_after(
+                    snapshot["last-modified"], response.headers.get("Last-Modified")
+                )
+            ):
+                return store_remote_registry(
+                    registry_url,
+                    snapshot["content"],
+                    response,
+                    snapshot["digest"],
+                    "compiled",
+                    snapshot,
+                )
+
+            # compressed registries are kept compressed until they are parsed
+            body, digest = RegistryFormat.spool_chunks(
+                response.raw.stream(
+                    RegistryFormat.SPOOL_CHUNK_BYTES,
+                    decode_content=not RegistryFormat.is_compressed(registry_url),
+                ),
+                REGISTRY_MAX_BYTES,
+            )
+    except (requests.exceptions.RequestException, ValueError) as e:
+        if not quiet:
+            FppmUtils.print_error(
+                f"[ERR]: Error obtaining registry [{registry_url}]: {e}"
+            )
+        return (1, None)
+
+    # otherwise a snapshot compiled from this exact registry.yaml still skips
+    # the parse
+    if (
+        snapshot is not None
+        and snapshot["content"] is not None
+        and snapshot["digest"] == digest
+    ):
+        body.close()
+        return store_remote_registry(
+            registry_url, snapshot["content"], response, digest, "compiled", snapshot
+        )
+
+    try:
+        with body:
+            getYamlContent = RegistryFormat.load_registry(
+                RegistryFormat.open_decompressed(body, registry_url)
+            )
+    except (yaml.YAMLError, OSError, ValueError) as e:
+        if not quiet:
+            FppmUtils.print_error(
+                f"[ERR]: Error parsing YAML content of registry [{registry_url}]: {e}"
+            )
+        return (1, None)
 
     if getYamlContent is None:
-        FppmUtils.print_error(f"[ERR]: No content found in registry [{registry_url}].")
-        return 1
+        return (None, digest)
+    return store_remote_registry(
+        registry_url, getYamlContent, response, digest, "yaml", snapshot
+    )
 
-    return getYamlContent
+
+def store_remote_registry(registry_url, content, response, digest, source, snapshot):
+    # caches a registry with the validators of its registry.yaml, and those of
+    # its compiled snapshot (if any), which is only downloaded again once it
+    # changes
+    FppmCache.store_registry_entry(
+        registry_url,
+        content,
+        response.headers.get("ETag"),
+        response.headers.get("Last-Modified"),
+        digest,
+        source=source,
+        compiled=None
+        if snapshot is None
+        else {key: snapshot[key] for key in ("digest", "etag", "last-modified")},
+    )
+    return (content, digest)
+
+
+def get_registries(registry_urls, fetch=get_registry) -> list:
+    """
+    Fetches several registries concurrently over a bounded set of workers. A
+    registry not obtained within REGISTRY_TIMEOUT seconds of the start of its
+    fetch fails, however slowly its server keeps responding.
+
+    Args:
+        registry_urls (list): URLs (or paths) of the registries
+        fetch (callable): Function used to obtain a single registry
+
+    Returns:
+        list: Result of fetch for each registry, in the declared order, 1 for
+        the registries that timed out
+    """
+
+    if not registry_urls:
+        return []
+
+    pending = queue.Queue()
+    for index in range(len(registry_urls)):
+        pending.put(index)
+    startedOn = {}
+    finished = [threading.Event() for _ in registry_urls]
+    outcomes = {}
+
+    def worker():
+        while True:
+            try:
+                index = pending.get_nowait()
+            except queue.Empty:
+                return
+            startedOn[index] = time.monotonic()
+            try:
+                outcomes[index] = (fetch(registry_urls[index]), None)
+            except Exception as e:
+                outcomes[index] = (None, e)
+            finished[index].set()
+
+    def start_worker():
+        # daemon threads: a fetch past its deadline never delays the exit
+        threading.Thread(target=worker, name="fppm-registry", daemon=True).start()
+
+    for _ in range(min(REGISTRY_FETCH_JOBS, len(registry_urls))):
+        start_worker()
+
+    results = []
+    for index, url in enumerate(registry_urls):
+        while True:
+            # queued fetches are waited for until they start
+            started = startedOn.get(index)
+            remaining = REGISTRY_TIMEOUT
+            if started is not None:
+                remaining = started + REGISTRY_TIMEOUT - time.monotonic()
+            if finished[index].wait(max(0, remaining)):
+                result, error = outcomes[index]
+                if error is not None:
+                    raise error
+                results.append(result)
+                break
+            if started is None:
+                continue
+            FppmUtils.print_error(
+                f"[ERR]: Timed out obtaining registry [{url}] after {REGISTRY_TIMEOUT:g} seconds."
+            )
+            results.append(1)
+            # the worker stays blocked on that registry, another one takes
+            # over the queued registries
+            start_worker()
+            break
+
+    return results
+
+
+def get_package_index(registry_urls, namespaces=None):
+    """
+    Obtains the package index merged across the given registries
+
+    Args:
+        registry_urls (list): URLs (or paths) of the registries, in declared order
+        namespaces (list): If given, only the packages of these namespaces are
+            indexed, and only they are built when a registry has to be parsed
+
+    Returns:
+        dict: Mapping of "namespace/package" to candidate packages, or 1 on error
+    """
+
+    registries = []
+    for registry, yamlContent in zip(
+        registry_urls,
+        get_registries(
+            registry_urls, lambda registry: get_registry(registry, namespaces)
+        ),
+    ):
+        if yamlContent == 1:
+            return 1
+        registries.append((registry, yamlContent, get_registry_revision(registry)))
+
+    return FppmIndex.build_package_index(registries, namespaces)
 
 
 def verify_registry(registry_url) -> int:
@@ -236,9 +692,13 @@ def registries_validate(args, context) -> int:
 
     validRegistries = []
 
-    for registry in projectYamlContent.get("registries"):
+    registries = projectYamlContent.get("registries")
+    for registry in registries:
         print(f"[INFO]: Validating registry: {registry}")
-        yamlContent = verify_registry(registry)
+
+    for registry, yamlContent in zip(
+        registries, get_registries(registries, verify_registry)
+    ):
         if yamlContent == 1:
             FppmUtils.print_error(f"[ERR]: Registry [{registry}] is invalid.")
         else:
@@ -253,6 +713,40 @@ def registries_validate(args, context) -> int:
     FppmUtils.print_success(f"[DONE]: Validated all registries in project.yaml file.")
 
 
+def registries_compile(args, context) -> int:
+    registryPath = args.compile
+
+    if not os.path.exists(registryPath):
+        FppmUtils.print_error(f"[ERR]: Registry [{registryPath}] does not exist.")
+        return 1
+
+    # only valid registries are worth publishing
+    if verify_registry(registryPath) == 1:
+        return 1
+
+    outputPath = (
+        args.output
+        if getattr(args, "output", None)
+        else RegistryFormat.compiled_path(registryPath)
+    )
+
+    try:
+        with open(registryPath, "rb") as f:
+            sourceDigest = RegistryFormat.file_digest(f)
+            f.seek(0)
+            yamlData = RegistryFormat.open_decompressed(f, registryPath).read()
+        compiled = RegistryFormat.compile_registry(yamlData, sourceDigest)
+        FppmCache.write_atomic(outputPath, compiled)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        FppmUtils.print_error(f"[ERR]: Error compiling registry [{registryPath}]: {e}")
+        return 1
+
+    FppmUtils.print_success(
+        f"[DONE]: Compiled registry [{registryPath}] to {outputPath}. Publish it alongside the registry."
+    )
+    return 0
+
+
 def registries_entrypoint(args, context) -> int:
     if args.validate:
         print(f"[INFO]: Validating package registries...")
@@ -260,6 +754,9 @@ def registries_entrypoint(args, context) -> int:
     elif args.add:
         print(f"[INFO]: Adding new package registry: {args.add}")
         return registries_add(args, context)
+    elif getattr(args, "compile", None):
+        print(f"[INFO]: Compiling package registry: {args.compile}")
+        return registries_compile(args, context)
     else:
         FppmUtils.print_error(
             f"[ERR]: No arguments provided. Please provide a command."
@@ -1,7 +1,9 @@
-import fppm.cli.commands.registries as cmd_registries
 import glob
+import os
 import shutil
 import fppm.cli.utils as FppmUtils
+import fppm.cli.project as FppmProject
+import fppm.cli.commands.install as cmd_install
 
 
 def remove_package(args, context):
@@ -12,33 +14,23 @@ def remove_package(args, context):
 
     packageFolder = args.package.replace("/", ".")
 
+    session = FppmProject.ProjectSession(projectYamlPath)
+    if session.load() == 1:
+        return 1
+
     print(f"[INFO]: Removing package [{args.package}]...")
 
+    packagePath = f"_fprime_packages/{packageFolder}"
     try:
-        existingPackage = glob.glob(f"_fprime_packages/{packageFolder}*")
+        if os.path.islink(packagePath):
+            # linked from the package store
+            os.remove(packagePath)
+        elif os.path.isdir(packagePath):
+            shutil.rmtree(packagePath)
     except Exception as e:
-        FppmUtils.print_error(
-            f"[ERR]: Error checking for existing package [{args.package}]: {e}"
-        )
+        FppmUtils.print_error(f"[ERR]: Error removing package [{args.package}]: {e}")
         return 1
 
-    for package in existingPackage:
-        try:
-            shutil.rmtree(package)
-        except Exception as e:
-            FppmUtils.print_error(
-                f"[ERR]: Error removing package [{args.package}]: {e}"
-            )
-            return 1
-
-    with open(f"_fprime_packages/CMakeLists.txt", "r") as f:
-        lines = f.readlines()
-
-    with open(f"_fprime_packages/CMakeLists.txt", "w") as f:
-        for line in lines:
-            if packageFolder not in line:
-                f.write(line)
-
     fillables = glob.glob(f"{packageFolder}.fillables")
 
     if len(fillables) > 0:
@@ -57,22 +49,41 @@ def remove_package(args, context):
 
     print(f"[INFO]: Updating project.yaml file...")
 
-    projectYamlPath, projectYamlContent = cmd_registries.open_project_yaml(
-        projectYamlPath
-    )
-
-    if projectYamlContent == 1:
+    if session.content.get("packages") is None:
+        FppmUtils.print_error(f"[ERR]: No packages found in project.yaml file.")
         return 1
 
-    if projectYamlContent.get("packages") is not None:
-        for package in projectYamlContent["packages"]:
-            if package["name"] == args.package:
-                projectYamlContent["packages"].remove(package)
-                break
-    else:
-        FppmUtils.print_error(f"[ERR]: No packages found in project.yaml file.")
+    lockedNames = set(session.lockEntries)
+    session.remove_package(args.package)
+    session.prune_lock()
+    session.remove_cmake_subdirectory(packageFolder)
+    session.forget_installed(args.package)
+
+    # dependencies no longer required by any package of the project are removed
+    # along with it
+    failed = False
+    orphaned = sorted(
+        lockedNames.difference(session.lockEntries).difference([args.package])
+    )
+    for name in orphaned:
+        print(f"[INFO]: Removing dependency [{name}], no longer required...")
+        folder = name.replace("/", ".")
+        try:
+            cmd_install.remove_package_path(f"_fprime_packages/{folder}")
+        except OSError as e:
+            FppmUtils.print_error(f"[ERR]: Error removing package [{name}]: {e}")
+            failed = True
+            continue
+        session.remove_cmake_subdirectory(folder)
+        session.forget_installed(name)
+
+    if session.commit() == 1:
         return 1
 
-    write = cmd_registries.write_to_project_yaml(projectYamlPath, projectYamlContent)
+    if failed:
+        FppmUtils.print_error(
+            f"[ERR]: Some dependencies of package [{args.package}] could not be removed. Run `fppm sync` to remove them."
+        )
+        return 1
 
     FppmUtils.print_success(f"[DONE]: Removed package [{args.package}]")
@@ -0,0 +1,115 @@
+import os
+import yaml
+import fppm.cli.commands.registries as cmd_registries
+import fppm.cli.cache as FppmCache
+import fppm.cli.index as FppmIndex
+import fppm.cli.utils as FppmUtils
+
+
+def file_revision(path):
+    try:
+        fileStat = os.stat(path)
+    except OSError:
+        return None
+    return f"{fileStat.st_mtime_ns}-{fileStat.st_size}"
+
+
+def project_registries(project_yaml_path):
+    # registries of the project, or None when there is no project.yaml
+    projectYamlPath = (
+        project_yaml_path if project_yaml_path is not None else "./project.yaml"
+    )
+    if not os.path.exists(projectYamlPath):
+        return None
+
+    try:
+        with open(projectYamlPath, "r") as f:
+            projectYamlContent = yaml.safe_load(f) or {}
+    except yaml.YAMLError as e:
+        FppmUtils.print_error(f"[ERR]: Error parsing {projectYamlPath}: {e}")
+        return None
+
+    return projectYamlContent.get("registries") or []
+
+
+def search_sources(args) -> dict:
+    """
+    Collects the registries to search, without touching the network: the
+    cached copies of remote registries and the local registry files
+
+    Returns:
+        dict: Mapping of registry file (cache entry or local path) to its revision
+    """
+
+    sources = {}
+    registries = project_registries(getattr(args, "project_yaml_path", None))
+
+    if registries is None:
+        # outside of a project, search everything that has been cached
+        for entryPath in FppmCache.list_registry_entries():
+            sources[entryPath] = file_revision(entryPath)
+        return sources
+
+    for registry in registries:
+        if cmd_registries.is_remote_registry(registry):
+            registryFile = FppmCache.registry_entry_path(registry)
+        else:
+            registryFile = os.path.abspath(registry)
+
+        revision = file_revision(registryFile)
+        if revision is None:
+            FppmUtils.print_warning(
+                f"[WARN]: Registry [{registry}] is not cached and will not be searched. Run `fppm registries --validate` to fetch it."
+            )
+            continue
+        sources[registryFile] = revision
+
+    return sources
+
+
+def load_source(registryFile):
+    if registryFile.startswith(FppmCache.get_cache_dir("registries")):
+        entry = FppmCache.read_registry_entry(registryFile)
+        if entry is None:
+            return None
+        return (entry["url"], entry["content"])
+
+    registryContent, _ = cmd_registries.get_local_registry(registryFile)
+    if registryContent == 1 or registryContent is None:
+        return None
+    return (registryFile, registryContent)
+
+
+def search_packages(args, context) -> int:
+    query = " ".join(args.query or [])
+    if query.strip() == "":
+        FppmUtils.print_error(f"[ERR]: No search query provided.")
+        return 1
+
+    sources = search_sources(args)
+    searchIndex = FppmIndex.load_search_index(sources)
+
+    if searchIndex is None:
+        registries = []
+        for registryFile in sources:
+            registry = load_source(registryFile)
+            if registry is not None:
+                registries.append(registry)
+
+        searchIndex = FppmIndex.build_search_index(registries, sources)
+        FppmIndex.store_search_index(searchIndex)
+
+    results = FppmIndex.search_packages(searchIndex, query, args.limit)
+
+    if len(results) == 0:
+        FppmUtils.print_warning(f"[INFO]: No packages found matching [{query}].")
+        return 0
+
+    for result in results:
+        stable = f" (stable: {result['stable']})" if result.get("stable") else ""
+        print(
+            f"{FppmUtils.bcolors.BOLD}{result['shortname']}{FppmUtils.bcolors.ENDC}{stable}"
+        )
+        print(f"    {result['registry']} (published by: {result['publisher']})")
+
+    return 0
@@ -0,0 +1,117 @@
+import contextlib
+import json
+import os
+import sys
+import fppm.cli.project as FppmProject
+
+
+def package_rows(session) -> list:
+    """
+    Lists the packages of a project and what is installed in _fprime_packages,
+    from project.yaml and the state manifest alone (no git is run)
+
+    Returns:
+        list: One dict per package, with the installed version, commit, tree,
+        link mode, registry and install time, and a status: installed,
+        outdated (installed at another version than project.yaml), missing,
+        dependency (installed for another package) or extra (installed but no
+        longer required)
+    """
+
+    rows = []
+    names = [package["name"] for package in session.packages]
+    wantedVersions = {
+        package["name"]: str(package["version"]) for package in session.packages
+    }
+
+    for name in names + sorted(set(session.installed) - set(names)):
+        entry = session.installed.get(name)
+        if entry is not None and not os.path.lexists(
+            f"_fprime_packages/{entry['folder']}"
+        ):
+            # removed by hand
+            entry = None
+
+        if name in wantedVersions:
+            if entry is None:
+                status = "missing"
+            elif str(entry["version"]) != wantedVersions[name]:
+                status = "outdated"
+            else:
+                status = "installed"
+        elif entry is None:
+            continue
+        elif entry.get("required-by"):
+            status = "dependency"
+        else:
+            status = "extra"
+
+        entry = entry or {}
+        rows.append(
+            {
+                "name": name,
+                "version": entry.get("version", wantedVersions.get(name)),
+                "commit": entry.get("commit"),
+                "tree": entry.get("tree"),
+                "link": entry.get("link"),
+                "registry": entry.get("registry"),
+                "installed-at": entry.get("installed-at"),
+                "status": status,
+            }
+        )
+
+    return rows
+
+
+def format_cell(row, column) -> str:
+    value = row[column]
+    if value is None:
+        return "-"
+    if column == "commit":
+        return str(value)[:12]
+    return str(value)
+
+
+def list_packages(args, context):
+    projectYamlPath = "./project.yaml"
+
+    if args.project_yaml_path is not None:
+        projectYamlPath = args.project_yaml_path
+
+    # with --json, only the JSON document is printed on stdout
+    session = FppmProject.ProjectSession(projectYamlPath)
+    with contextlib.redirect_stdout(
+        sys.stderr if getattr(args, "json", False) else sys.stdout
+    ):
+        if session.load() == 1:
+            return 1
+
+    rows = package_rows(session)
+
+    if getattr(args, "json", False):
+        print(json.dumps(rows, indent=2))
+        return 0
+
+    if len(rows) == 0:
+        print(f"[INFO]: No packages in project.yaml or _fprime_packages.")
+        return 0
+
+    columns = [
+        "name",
+        "version",
+        "commit",
+        "link",
+        "registry",
+        "installed-at",
+        "status",
+    ]
+    table = [[column.upper() for column in columns]] + [
+        [format_cell(row, column) for column in columns] for row in rows
+    ]
+    widths = [max(len(line[i]) for line in table) for i in range(len(columns))]
+    for line in table:
+        print(
+            "  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip()
+        )
+
+    return 0
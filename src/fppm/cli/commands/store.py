@@ -0,0 +1,43 @@
+import fppm.cli.store as FppmStore
+import fppm.cli.utils as FppmUtils
+
+
+def format_size(size) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def store_gc(args, context) -> int:
+    maxSize = args.max_size if args.max_size is not None else FppmStore.STORE_MAX_SIZE
+
+    try:
+        maxBytes = FppmStore.parse_size(maxSize)
+    except ValueError as e:
+        FppmUtils.print_error(f"[ERR]: {e}")
+        return 1
+
+    try:
+        evicted = FppmStore.collect_garbage(maxBytes)
+    except OSError as e:
+        FppmUtils.print_error(f"[ERR]: Error cleaning up the package store: {e}")
+        return 1
+
+    for treeHash, size in evicted:
+        print(f"[INFO]: Evicted {treeHash} ({format_size(size)})")
+
+    remainingSize = sum(size for _, size, _ in FppmStore.list_trees())
+    FppmUtils.print_success(
+        f"[DONE]: Evicted {len(evicted)} package trees, the store now uses {format_size(remainingSize)}"
+    )
+    return 0
+
+
+def store_entrypoint(args, context) -> int:
+    if args.action == "gc":
+        return store_gc(args, context)
+
+    FppmUtils.print_error(f"[ERR]: Unknown store action [{args.action}].")
+    return 1
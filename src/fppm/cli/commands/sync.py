@@ -0,0 +1,162 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import fppm.cli.utils as FppmUtils
+import fppm.cli.git as FppmGit
+import fppm.cli.store as FppmStore
+import fppm.cli.project as FppmProject
+import fppm.cli.commands.install as cmd_install
+
+
+def is_in_sync(resolved, stateEntry) -> bool:
+    """
+    Checks whether a package is installed at the resolved version, with the
+    resolved link mode, without fetching anything
+
+    Packages resolved from project.lock carry the commit and tree they were
+    installed at. Clones are compared by their HEAD, since they may have been
+    checked out by hand, symlinked packages by the stored tree they point to.
+    Hardlinked and archive packages are compared with what the state manifest
+    recorded when they were installed.
+    """
+
+    packagePath = f"_fprime_packages/{resolved['folder']}"
+    linkMode = resolved["link"] or FppmStore.LINK_MODE
+    lockedTree = resolved.get("tree")
+
+    if not os.path.lexists(packagePath):
+        return False
+
+    if cmd_install.is_package_clone(packagePath) and not os.path.islink(packagePath):
+        if linkMode != "clone":
+            return False
+        headCommit = FppmGit.resolve_revision(packagePath, "HEAD")
+        if headCommit is None or headCommit != FppmGit.resolve_revision(
+            packagePath, resolved["revision"]
+        ):
+            return False
+        resolved["commit"] = headCommit
+        resolved["tree"] = FppmGit.tree_hash(
+            packagePath, subdirectory=cmd_install.package_subdirectory(resolved)
+        )
+        return lockedTree is None or resolved["tree"] == lockedTree
+
+    if lockedTree is None and resolved.get("archive-sha256") is None:
+        # not locked: what is installed is unknown
+        return False
+
+    resolved["commit"] = resolved["revision"]
+    if os.path.islink(packagePath):
+        return linkMode == "symlink" and os.path.realpath(
+            packagePath
+        ) == os.path.realpath(FppmStore.tree_path(lockedTree or ""))
+
+    if stateEntry is None or stateEntry.get("link") != linkMode:
+        return False
+    if resolved.get("archive-sha256") is not None:
+        resolved["archive"] = resolved["package"]["info"].get("archive")
+        return stateEntry.get("archive-sha256") == resolved["archive-sha256"]
+    return stateEntry.get("tree") == lockedTree
+
+
+def sync_project(args, context):
+    projectYamlPath = "./project.yaml"
+
+    if args.project_yaml_path is not None:
+        projectYamlPath = args.project_yaml_path
+
+    session = FppmProject.ProjectSession(projectYamlPath)
+    if session.load() == 1:
+        return 1
+
+    # locked packages are resolved from project.lock alone, only unlocked ones
+    # need the registries
+    resolvedProject = cmd_install.resolve_project_packages(args, session)
+    if resolvedProject == 1:
+        return 1
+    resolvedPackages, failed = resolvedProject
+
+    outdated = [
+        resolved
+        for resolved in resolvedPackages
+        if not is_in_sync(resolved, session.installed.get(resolved["name"]))
+    ]
+
+    # packages installed by fppm are recorded in the state manifest and in
+    # project.lock, the ones no longer required by project.yaml are removed.
+    # Nothing is removed when the resolution failed, as the dependencies of the
+    # packages that failed to resolve are unknown.
+    desiredNames = {package["name"] for package in session.packages} | {
+        resolved["name"] for resolved in resolvedPackages
+    }
+    removed = []
+    if not failed:
+        removed = sorted(
+            name
+            for name in set(session.installed) | set(session.lockEntries)
+            if name not in desiredNames
+            and os.path.lexists(f"_fprime_packages/{name.replace('/', '.')}")
+        )
+
+    for name in removed:
+        print(f"[INFO]: Removing package [{name}]...")
+        folder = name.replace("/", ".")
+        try:
+            cmd_install.remove_package_path(f"_fprime_packages/{folder}")
+        except OSError as e:
+            FppmUtils.print_error(f"[ERR]: Error removing package [{name}]: {e}")
+            failed = True
+            continue
+        session.remove_cmake_subdirectory(folder)
+        session.forget_installed(name)
+
+    if len(outdated) > 0:
+        cmd_install.setup_ephemeral()
+        journal = cmd_install.open_journal()
+
+        jobs = max(1, getattr(args, "jobs", None) or 1)
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            fetched = list(
+                pool.map(
+                    lambda resolved: cmd_install.fetch_journaled(journal, resolved),
+                    outdated,
+                )
+            )
+        failedFolders = {
+            resolved["folder"]
+            for resolved, result in zip(outdated, fetched)
+            if result == 1
+        }
+        if len(failedFolders) > 0:
+            failed = True
+            resolvedPackages = [
+                resolved
+                for resolved in resolvedPackages
+                if resolved["folder"] not in failedFolders
+            ]
+
+    # project.yaml is the desired state, only project.lock, the CMake files and
+    # the state manifest follow what is installed
+    for resolved in resolvedPackages:
+        session.add_cmake_subdirectory(cmd_install.package_cmake_folder(resolved))
+        session.record_installed(resolved, resolved["link"] or FppmStore.LINK_MODE)
+    session.lock_packages(resolvedPackages)
+    if session.commit() == 1:
+        return 1
+
+    if failed:
+        FppmUtils.print_error(
+            f"[ERR]: Some packages could not be synchronized. Run the sync again to resume it."
+        )
+        return 1
+
+    if len(outdated) == 0 and len(removed) == 0:
+        FppmUtils.print_success(f"[DONE]: All packages are up to date.")
+        return 0
+
+    if len(outdated) > 0:
+        journal.clear()
+
+    FppmUtils.print_success(
+        f"[DONE]: Synchronized packages: {len(outdated)} installed or updated, {len(removed)} removed."
+    )
+    return 0
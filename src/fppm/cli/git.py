@@ -0,0 +1,648 @@
+import abc
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import fppm.cli.cache as FppmCache
+
+# package clones borrow their objects from a bare mirror of their remote kept
+# in the user cache, unless FPPM_GIT_STORE=0
+GIT_STORE_ENABLED = os.environ.get("FPPM_GIT_STORE", "1") not in ("", "0")
+
+# how package clones are fetched:
+#   full     complete history (through the git store when enabled)
+#   shallow  only the requested tag or commit (--depth 1)
+#   partial  complete history without file contents, which are fetched on
+#            checkout (--filter=blob:none)
+FETCH_STRATEGIES = ("full", "shallow", "partial")
+# when no strategy is set, packages with an archive are downloaded as archives
+FETCH_STRATEGY = os.environ.get("FPPM_FETCH_STRATEGY") or None
+
+# implementation of the local git operations (see GitBackend):
+#   subprocess  the git command line (default)
+#   dulwich     in-process, through the dulwich package
+GIT_BACKENDS = ("subprocess", "dulwich")
+GIT_BACKEND = os.environ.get("FPPM_GIT_BACKEND") or "subprocess"
+_BACKEND = None
+
+# mirrors already refreshed during this invocation
+_UPDATED_MIRRORS = set()
+_MIRROR_LOCKS = {}
+_MIRROR_LOCKS_LOCK = threading.Lock()
+
+
+def run_git(args, cwd=None):
+    return subprocess.run(
+        ["git", *args], cwd=cwd, capture_output=True, check=True, text=True
+    )
+
+
+class GitBackend(abc.ABC):
+    """
+    Local git operations fppm runs for every package: revision lookups,
+    checkouts and repository setup. Each implementation reports failures as
+    subprocess.CalledProcessError, as the git command line does.
+
+    Clones, fetches and mirrors (git store, sparse, shallow and partial clones)
+    always go through the git command line, whatever the backend.
+    """
+
+    name = None
+
+    @abc.abstractmethod
+    def resolve_revision(self, repositoryPath, revision):
+        # commit hash a revision resolves to in a repository, or None
+        pass
+
+    @abc.abstractmethod
+    def tree_hash(self, repositoryPath, revision="HEAD", subdirectory=None):
+        # hash of the tree of a revision, or of one of its subdirectories, or None
+        pass
+
+    @abc.abstractmethod
+    def list_tags(self, repositoryPath) -> list:
+        pass
+
+    @abc.abstractmethod
+    def read_file(self, repositoryPath, revision, path):
+        # content of a file at a revision, or None if it does not exist
+        pass
+
+    @abc.abstractmethod
+    def has_local_changes(self, repositoryPath) -> bool:
+        # changes to tracked files, which `git stash` would save
+        pass
+
+    @abc.abstractmethod
+    def stash(self, repositoryPath):
+        pass
+
+    @abc.abstractmethod
+    def checkout(self, repositoryPath, revision):
+        pass
+
+    @abc.abstractmethod
+    def ls_remote(self, remoteUrl) -> list:
+        # refs published by a remote, which is how a git URL is validated
+        pass
+
+    @abc.abstractmethod
+    def is_repository(self, path) -> bool:
+        # whether path is inside a git repository
+        pass
+
+    @abc.abstractmethod
+    def init(self, path):
+        pass
+
+    @abc.abstractmethod
+    def add_remote(self, repositoryPath, name, remoteUrl):
+        pass
+
+
+class SubprocessBackend(GitBackend):
+    # runs the git command line for every operation
+    name = "subprocess"
+
+    def resolve_revision(self, repositoryPath, revision):
+        try:
+            return run_git(
+                ["rev-parse", "--verify", "--quiet", f"{revision}^{{commit}}"],
+                cwd=repositoryPath,
+            ).stdout.strip()
+        except (subprocess.CalledProcessError, OSError):
+            return None
+
+    def tree_hash(self, repositoryPath, revision="HEAD", subdirectory=None):
+        treeish = f"{revision}^{{tree}}"
+        if subdirectory is not None:
+            treeish = f"{revision}:{subdirectory}"
+        try:
+            return run_git(
+                ["rev-parse", "--verify", "--quiet", treeish],
+                cwd=repositoryPath,
+            ).stdout.strip()
+        except (subprocess.CalledProcessError, OSError):
+            return None
+
+    def list_tags(self, repositoryPath) -> list:
+        return run_git(
+            ["for-each-ref", "--format=%(refname:short)", "refs/tags"],
+            cwd=repositoryPath,
+        ).stdout.split()
+
+    def read_file(self, repositoryPath, revision, path):
+        try:
+            return run_git(["show", f"{revision}:{path}"], cwd=repositoryPath).stdout
+        except subprocess.CalledProcessError:
+            return None
+
+    def has_local_changes(self, repositoryPath) -> bool:
+        status = run_git(
+            ["status", "--porcelain", "--untracked-files=no"], cwd=repositoryPath
+        )
+        return status.stdout.strip() != ""
+
+    def stash(self, repositoryPath):
+        run_git(["stash"], cwd=repositoryPath)
+
+    def checkout(self, repositoryPath, revision):
+        run_git(["checkout", revision], cwd=repositoryPath)
+
+    def ls_remote(self, remoteUrl) -> list:
+        return run_git(["ls-remote", remoteUrl]).stdout.splitlines()
+
+    def is_repository(self, path) -> bool:
+        try:
+            run_git(["rev-parse", "--git-dir"], cwd=path)
+            return True
+        except subprocess.CalledProcessError:
+            return False
+
+    def init(self, path):
+        run_git(["init"], cwd=path)
+
+    def add_remote(self, repositoryPath, name, remoteUrl):
+        run_git(["remote", "add", name, remoteUrl], cwd=repositoryPath)
+
+
+class DulwichBackend(SubprocessBackend):
+    """
+    Runs revision lookups, checkouts and repository setup in-process with
+    dulwich, without spawning git. Sparse and partial clones still use git for
+    their working tree: dulwich would check out every file of a sparse clone,
+    and cannot fetch the files missing from a partial one.
+    """
+
+    name = "dulwich"
+
+    def __init__(self):
+        try:
+            import dulwich.porcelain
+        except ImportError:
+            raise ValueError(
+                "the dulwich git backend requires the dulwich package (pip install fprime-fppm[dulwich])"
+            )
+        self.porcelain = dulwich.porcelain
+
+    def _git_error(self, operation, error):
+        return subprocess.CalledProcessError(
+            1, ["git", operation], stderr=f"{type(error).__name__}: {error}"
+        )
+
+    def _open(self, repositoryPath):
+        from dulwich.repo import Repo
+
+        return Repo(repositoryPath)
+
+    def _lookup(self, repositoryPath, revision, subdirectory=None):
+        # (commit, tree) of a revision, where tree is the tree of subdirectory
+        # when given, or None if the revision or subdirectory does not exist
+        from dulwich.object_store import tree_lookup_path
+        from dulwich.objectspec import parse_commit
+
+        try:
+            with self._open(repositoryPath) as repo:
+                commit = parse_commit(repo, revision)
+                tree = commit.tree
+                if subdirectory is not None:
+                    _, tree = tree_lookup_path(
+                        repo.__getitem__, tree, subdirectory.encode("utf-8")
+                    )
+                return (commit.id.decode("ascii"), tree.decode("ascii"))
+        except Exception:
+            return None
+
+    def resolve_revision(self, repositoryPath, revision):
+        found = self._lookup(repositoryPath, revision)
+        return found[0] if found is not None else None
+
+    def tree_hash(self, repositoryPath, revision="HEAD", subdirectory=None):
+        found = self._lookup(repositoryPath, revision, subdirectory)
+        return found[1] if found is not None else None
+
+    def list_tags(self, repositoryPath) -> list:
+        try:
+            with self._open(repositoryPath) as repo:
+                tags = repo.refs.as_dict(b"refs/tags")
+        except Exception as e:
+            raise self._git_error("for-each-ref", e)
+        return sorted(tag.decode("utf-8") for tag in tags)
+
+    def read_file(self, repositoryPath, revision, path):
+        from dulwich.object_store import tree_lookup_path
+        from dulwich.objectspec import parse_commit
+
+        try:
+            with self._open(repositoryPath) as repo:
+                try:
+                    _, blob = tree_lookup_path(
+                        repo.__getitem__,
+                        parse_commit(repo, revision).tree,
+                        path.encode("utf-8"),
+                    )
+                except KeyError:
+                    return None
+                if blob in repo:
+                    return repo[blob].data.decode("utf-8")
+        except Exception as e:
+            raise self._git_error("show", e)
+
+        # file contents missing from a partial clone are fetched by git
+        return super().read_file(repositoryPath, revision, path)
+
+    def _needs_git(self, repositoryPath) -> bool:
+        # sparse clones (the sparse checkout setting lives in the worktree
+        # config, which dulwich does not read) and partial clones, whose
+        # remote is a promisor
+        try:
+            with self._open(repositoryPath) as repo:
+                if os.path.exists(
+                    os.path.join(repo.controldir(), "info", "sparse-checkout")
+                ):
+                    return True
+                config = repo.get_config()
+        except Exception as e:
+            raise self._git_error("config", e)
+
+        return any(
+            section[0] == b"remote" and config.get_boolean(section, b"promisor", False)
+            for section in config.sections()
+        )
+
+    def has_local_changes(self, repositoryPath) -> bool:
+        if self._needs_git(repositoryPath):
+            return super().has_local_changes(repositoryPath)
+
+        try:
+            status = self.porcelain.status(repositoryPath, untracked_files="no")
+        except Exception as e:
+            raise self._git_error("status", e)
+        return any(status.staged.values()) or len(status.unstaged) > 0
+
+    def stash(self, repositoryPath):
+        if self._needs_git(repositoryPath):
+            return super().stash(repositoryPath)
+
+        try:
+            self.porcelain.stash_push(repositoryPath)
+        except Exception as e:
+            raise self._git_error("stash", e)
+
+    def checkout(self, repositoryPath, revision):
+        if self._needs_git(repositoryPath):
+            return super().checkout(repositoryPath, revision)
+
+        try:
+            self.porcelain.checkout(repositoryPath, revision)
+        except Exception as e:
+            raise self._git_error("checkout", e)
+
+    def ls_remote(self, remoteUrl) -> list:
+        try:
+            refs = self.porcelain.ls_remote(remoteUrl).refs
+        except Exception as e:
+            raise self._git_error("ls-remote", e)
+        return [
+            f"{sha.decode('ascii')}\t{ref.decode('utf-8')}"
+            for ref, sha in refs.items()
+            if sha is not None
+        ]
+
+    def is_repository(self, path) -> bool:
+        from dulwich.errors import NotGitRepository
+        from dulwich.repo import Repo
+
+        try:
+            Repo.discover(path).close()
+            return True
+        except NotGitRepository:
+            return False
+
+    def init(self, path):
+        try:
+            self.porcelain.init(path).close()
+        except Exception as e:
+            raise self._git_error("init", e)
+
+    def add_remote(self, repositoryPath, name, remoteUrl):
+        try:
+            self.porcelain.remote_add(repositoryPath, name, remoteUrl)
+        except Exception as e:
+            raise self._git_error("remote", e)
+
+
+def set_git_backend(name):
+    global GIT_BACKEND, _BACKEND
+    GIT_BACKEND = name
+    _BACKEND = None
+
+
+def backend() -> GitBackend:
+    """
+    Returns the git backend selected by --git-backend or FPPM_GIT_BACKEND
+
+    Raises:
+        ValueError: The backend is unknown or not installed
+    """
+
+    global _BACKEND
+    if _BACKEND is None or _BACKEND.name != GIT_BACKEND:
+        if GIT_BACKEND == "subprocess":
+            _BACKEND = SubprocessBackend()
+        elif GIT_BACKEND == "dulwich":
+            _BACKEND = DulwichBackend()
+        else:
+            raise ValueError(
+                f"unknown git backend [{GIT_BACKEND}], expected one of {', '.join(GIT_BACKENDS)}"
+            )
+    return _BACKEND
+
+
+def mirror_path(remoteUrl) -> str:
+    return os.path.join(
+        FppmCache.get_cache_dir("git"), f"{FppmCache.cache_key(remoteUrl)}.git"
+    )
+
+
+def mirror_lock(mirrorPath):
+    with _MIRROR_LOCKS_LOCK:
+        return _MIRROR_LOCKS.setdefault(mirrorPath, threading.Lock())
+
+
+def update_mirror(remoteUrl):
+    """
+    Creates or refreshes the bare mirror of a remote, at most once per remote
+    and invocation. In offline mode an existing mirror is used as is.
+
+    Args:
+        remoteUrl (str): Git URL of the package
+
+    Returns:
+        str: Path to the mirror, or None if it is not available
+
+    Raises:
+        subprocess.CalledProcessError: git failed to clone or fetch the remote
+    """
+
+    mirrorPath = mirror_path(remoteUrl)
+
+    with mirror_lock(mirrorPath):
+        if mirrorPath in _UPDATED_MIRRORS and os.path.isdir(mirrorPath):
+            return mirrorPath
+
+        if os.path.isdir(mirrorPath):
+            if not FppmCache.is_offline():
+                run_git(["remote", "update", "--prune"], cwd=mirrorPath)
+        elif FppmCache.is_offline():
+            return None
+        else:
+            # clone next to the final location, then move it in place so an
+            # interrupted clone never looks like a mirror
+            tmpPath = tempfile.mkdtemp(dir=os.path.dirname(mirrorPath), prefix=".tmp-")
+            try:
+                run_git(["clone", "--mirror", "--quiet", remoteUrl, tmpPath])
+                try:
+                    os.replace(tmpPath, mirrorPath)
+                except OSError:
+                    # another fppm process created the mirror meanwhile
+                    if not os.path.isdir(mirrorPath):
+                        raise
+            finally:
+                shutil.rmtree(tmpPath, ignore_errors=True)
+
+        _UPDATED_MIRRORS.add(mirrorPath)
+        return mirrorPath
+
+
+def metadata_path(remoteUrl) -> str:
+    return os.path.join(
+        FppmCache.get_cache_dir("git-metadata"),
+        f"{FppmCache.cache_key(remoteUrl)}.git",
+    )
+
+
+def fetch_metadata(remoteUrl, revision):
+    """
+    Fetches a single revision of a remote into a bare repository of the user
+    cache, without its history and, when the server supports it, without file
+    contents, which git fetches when they are read. This is how the
+    package.yaml of a version is read before the package itself is fetched,
+    whatever the fetch strategy and even without the git store.
+
+    Args:
+        remoteUrl (str): Git URL of the package
+        revision (str): tags/<tag> or a commit hash
+
+    Returns:
+        str: Path to the repository, or None in offline mode when the revision
+        was never fetched
+
+    Raises:
+        subprocess.CalledProcessError: git failed to fetch the revision
+    """
+
+    metadataPath = metadata_path(remoteUrl)
+
+    with mirror_lock(metadataPath):
+        if os.path.isdir(metadataPath) and has_revision(metadataPath, revision):
+            return metadataPath
+        if FppmCache.is_offline():
+            return None
+
+        if not os.path.isdir(metadataPath):
+            # initialized next to the final location, then moved in place so
+            # an interrupted setup never looks like a repository
+            tmpPath = tempfile.mkdtemp(
+                dir=os.path.dirname(metadataPath), prefix=".tmp-"
+            )
+            try:
+                run_git(["init", "--bare", "--quiet"], cwd=tmpPath)
+                run_git(["remote", "add", "origin", remoteUrl], cwd=tmpPath)
+                try:
+                    os.replace(tmpPath, metadataPath)
+                except OSError:
+                    # another fppm process created the repository meanwhile
+                    if not os.path.isdir(metadataPath):
+                        raise
+            finally:
+                shutil.rmtree(tmpPath, ignore_errors=True)
+
+        try:
+            run_git(
+                [
+                    "fetch",
+                    "--quiet",
+                    "--depth",
+                    "1",
+                    "--filter=blob:none",
+                    "--no-tags",
+                    "origin",
+                    revision_refspec(revision),
+                ],
+                cwd=metadataPath,
+            )
+        except subprocess.CalledProcessError:
+            # the server cannot serve the revision directly (e.g. an
+            # abbreviated hash), fetch every branch and tag instead
+            run_git(
+                ["fetch", "--quiet", "--filter=blob:none", "--tags", "origin"],
+                cwd=metadataPath,
+            )
+        return metadataPath
+
+
+def clone_package(
+    remoteUrl, packagePath, revision=None, strategy=None, subdirectory=None
+):
+    """
+    Clones a package. With the git store, the clone is made from the mirror of
+    the remote and references its objects instead of copying them; its origin
+    still points to the remote. Packages living in a subdirectory of their
+    repository (monorepos) are sparse clones: only that subdirectory is
+    checked out.
+
+    Args:
+        remoteUrl (str): Git URL of the package
+        packagePath (str): Where to clone the package
+        revision (str): Revision that will be checked out (tags/<tag> or a
+            commit hash), required by the shallow strategy
+        strategy (str): One of FETCH_STRATEGIES, defaults to FETCH_STRATEGY,
+            or full
+        subdirectory (str): Subdirectory of the repository holding the package
+
+    Raises:
+        subprocess.CalledProcessError: git failed to clone the package
+    """
+
+    strategy = strategy or FETCH_STRATEGY or "full"
+    if FppmCache.is_offline():
+        # only the git store can serve packages without the network
+        strategy = "full"
+
+    cloned = False
+    if strategy == "shallow" and revision is not None:
+        try:
+            shallow_clone(remoteUrl, packagePath, revision)
+            cloned = True
+        except subprocess.CalledProcessError:
+            # the server cannot serve the revision directly (e.g. an
+            # abbreviated hash), fall back to a full clone
+            shutil.rmtree(packagePath, ignore_errors=True)
+    elif strategy == "partial":
+        try:
+            run_git(
+                [
+                    "clone",
+                    "--quiet",
+                    "--no-checkout",
+                    "--filter=blob:none",
+                    remoteUrl,
+                    packagePath,
+                ]
+            )
+            cloned = True
+        except subprocess.CalledProcessError:
+            shutil.rmtree(packagePath, ignore_errors=True)
+
+    if not cloned:
+        # sparse clones are checked out once the sparse checkout is set up
+        noCheckout = ["--no-checkout"] if subdirectory is not None else []
+        mirrorPath = update_mirror(remoteUrl) if GIT_STORE_ENABLED else None
+
+        if mirrorPath is None:
+            run_git(["clone", "--quiet", *noCheckout, remoteUrl, packagePath])
+        else:
+            run_git(
+                [
+                    "clone",
+                    "--quiet",
+                    *noCheckout,
+                    "--reference",
+                    mirrorPath,
+                    mirrorPath,
+                    packagePath,
+                ]
+            )
+            run_git(["remote", "set-url", "origin", remoteUrl], cwd=packagePath)
+
+    if subdirectory is not None:
+        run_git(["sparse-checkout", "set", "--cone", subdirectory], cwd=packagePath)
+
+
+def revision_refspec(revision) -> str:
+    # tags are fetched into their own ref so that tags/<tag> resolves
+    if revision.startswith("tags/"):
+        tag = revision[len("tags/") :]
+        return f"+refs/tags/{tag}:refs/tags/{tag}"
+    return revision
+
+
+def shallow_clone(remoteUrl, packagePath, revision):
+    # a repository holding only the requested revision, without its history
+    os.makedirs(packagePath)
+    run_git(["init", "--quiet"], cwd=packagePath)
+    run_git(["remote", "add", "origin", remoteUrl], cwd=packagePath)
+    run_git(
+        [
+            "fetch",
+            "--quiet",
+            "--depth",
+            "1",
+            "--no-tags",
+            "origin",
+            revision_refspec(revision),
+        ],
+        cwd=packagePath,
+    )
+
+
+def resolve_revision(repositoryPath, revision):
+    # commit hash a revision resolves to in a repository, or None
+    return backend().resolve_revision(repositoryPath, revision)
+
+
+def tree_hash(repositoryPath, revision="HEAD", subdirectory=None):
+    # hash of the tree of a revision (by default, the one checked out), or of
+    # one of its subdirectories, or None
+    return backend().tree_hash(repositoryPath, revision, subdirectory)
+
+
+def has_revision(repositoryPath, revision) -> bool:
+    return resolve_revision(repositoryPath, revision) is not None
+
+
+def fetch_revision(repositoryPath, revision):
+    """
+    Fetches a single revision (tags/<tag> or a commit hash) from the origin of
+    a package clone, falling back to fetching every branch and tag when the
+    server cannot serve it directly (e.g. an abbreviated hash)
+
+    Raises:
+        subprocess.CalledProcessError: git failed to fetch from the remote
+    """
+
+    depth = []
+    if os.path.exists(os.path.join(repositoryPath, ".git", "shallow")):
+        # keep shallow clones shallow
+        depth = ["--depth", "1"]
+
+    try:
+        run_git(
+            [
+                "fetch",
+                "--quiet",
+                *depth,
+                "--no-tags",
+                "origin",
+                revision_refspec(revision),
+            ],
+            cwd=repositoryPath,
+        )
+    except subprocess.CalledProcessError:
+        run_git(["fetch", "--quiet", "--tags", "origin"], cwd=repositoryPath)
+
+
+def has_local_changes(repositoryPath) -> bool:
+    return backend().has_local_changes(repositoryPath)
@@ -0,0 +1,406 @@
+import bisect
+import difflib
+import json
+import os
+import re
+import threading
+import fppm.cli.cache as FppmCache
+
+# merged indexes built during this invocation, keyed by the registry revisions
+_MERGED_INDEXES = {}
+_MERGED_INDEXES_LOCK = threading.Lock()
+
+# namespace routing table: registry -> namespaces it hosts, loaded once
+_ROUTES = None
+_ROUTES_LOCK = threading.Lock()
+
+
+def normalize_package_info(info) -> dict:
+    """
+    Normalizes a registry package entry into a single dictionary
+
+    Registries may describe a package either as a mapping (git: ..., stable: ...)
+    or as a list of single-key mappings (- git: ..., - stable: ...).
+
+    Args:
+        info (dict | list): Package entry as written in the registry
+
+    Returns:
+        dict: Package entry as a mapping
+    """
+
+    if isinstance(info, dict):
+        return info
+
+    normalized = {}
+    for item in info or []:
+        if isinstance(item, dict):
+            normalized.update(item)
+    return normalized
+
+
+def iter_registry_packages(registryContent):
+    """
+    Walks the namespaces of a parsed registry
+
+    Args:
+        registryContent (dict): Parsed registry content
+
+    Yields:
+        tuple: (namespace, package, normalized package info)
+    """
+
+    for namespace in registryContent.get("namespaces") or []:
+        if not isinstance(namespace, dict):
+            continue
+        for namespaceName, packages in namespace.items():
+            for packageList in packages or []:
+                if not isinstance(packageList, dict):
+                    continue
+                for packageName, info in packageList.items():
+                    yield (namespaceName, packageName, normalize_package_info(info))
+
+
+def flatten_registry(registryContent) -> dict:
+    flattened = {}
+    for namespaceName, packageName, info in iter_registry_packages(registryContent):
+        flattened.setdefault(f"{namespaceName}/{packageName}", []).append(info)
+    return flattened
+
+
+def registry_index_path(registry_url) -> str:
+    return os.path.join(
+        FppmCache.get_cache_dir("index"), f"{FppmCache.cache_key(registry_url)}.json"
+    )
+
+
+def load_registry_index(registry_url, registryContent, revision, namespaces=None):
+    """
+    Loads the flattened index of a registry, rebuilding it when the persisted
+    copy was built from a different registry revision or lacks a namespace
+
+    Args:
+        registry_url (str): URL (or path) of the registry
+        registryContent (dict): Parsed registry content
+        revision (str): Revision of the registry content
+        namespaces (list): If given, only these namespaces are indexed, and the
+            registry content may only hold them
+
+    Returns:
+        dict: Mapping of "namespace/package" to its package entries
+    """
+
+    indexPath = registry_index_path(registry_url)
+    wanted = set(namespaces) if namespaces is not None else None
+
+    # an index built for some namespaces only is extended with the others
+    # looked up at the same revision
+    persisted = None
+    if revision is not None:
+        try:
+            with open(indexPath, "r") as f:
+                persisted = json.load(f)
+            if persisted.get("revision") != revision:
+                persisted = None
+        except (OSError, ValueError):
+            persisted = None
+
+    if persisted is not None:
+        indexed = persisted.get("namespaces")
+        if indexed is None or (wanted is not None and wanted.issubset(indexed)):
+            return select_index_namespaces(persisted.get("packages") or {}, wanted)
+
+    packages = select_index_namespaces(flatten_registry(registryContent), wanted)
+
+    if revision is not None:
+        indexed = None
+        persistedPackages = packages
+        if wanted is not None:
+            indexed = sorted(wanted)
+            if persisted is not None and persisted.get("namespaces") is not None:
+                indexed = sorted(wanted.union(persisted["namespaces"]))
+                persistedPackages = {**(persisted.get("packages") or {}), **packages}
+        try:
+            FppmCache.write_atomic(
+                indexPath,
+                json.dumps(
+                    {
+                        "url": registry_url,
+                        "revision": revision,
+                        "namespaces": indexed,
+                        "packages": persistedPackages,
+                    },
+                    default=str,
+                ),
+            )
+        except OSError:
+            pass
+
+    return packages
+
+
+def select_index_namespaces(packages, namespaces) -> dict:
+    # entries of a registry index that belong to the given namespaces
+    if namespaces is None:
+        return packages
+    return {
+        shortname: infos
+        for shortname, infos in packages.items()
+        if shortname.split("/")[0] in namespaces
+    }
+
+
+def build_package_index(registries, namespaces=None) -> dict:
+    """
+    Builds the package index merged across registries
+
+    Args:
+        registries (list): (registry_url, registryContent, revision) tuples, in
+            the order the registries are declared in project.yaml
+        namespaces (list): If given, only these namespaces are indexed, and the
+            registries may only hold them
+
+    Returns:
+        dict: Mapping of "namespace/package" to a list of candidates, each with
+        the registry, publisher and package info
+    """
+
+    memoKey = (
+        tuple((url, revision) for url, _, revision in registries),
+        tuple(sorted(set(namespaces))) if namespaces is not None else None,
+    )
+    with _MERGED_INDEXES_LOCK:
+        if memoKey in _MERGED_INDEXES:
+            return _MERGED_INDEXES[memoKey]
+
+    mergedIndex = {}
+    for registry_url, registryContent, revision in registries:
+        publisher = registryContent.get("publisher")
+        registryIndex = load_registry_index(
+            registry_url, registryContent, revision, namespaces
+        )
+        for shortname, infos in registryIndex.items():
+            for info in infos:
+                mergedIndex.setdefault(shortname, []).append(
+                    {"registry": registry_url, "publisher": publisher, "info": info}
+                )
+
+    with _MERGED_INDEXES_LOCK:
+        _MERGED_INDEXES[memoKey] = mergedIndex
+
+    return mergedIndex
+
+
+def search_tokens(text) -> set:
+    """
+    Splits text into lowercase search tokens. Hyphenated or dotted names are
+    indexed both whole and by their parts.
+    """
+
+    if text is None:
+        return set()
+
+    text = str(text).lower()
+    tokens = set(re.findall(r"[a-z0-9]+", text))
+    tokens.update(word for word in re.findall(r"[a-z0-9_.\-]+", text) if word)
+    return tokens
+
+
+def build_search_index(registries, sources) -> dict:
+    """
+    Builds an inverted token index over the packages of the given registries
+
+    Args:
+        registries (list): (registry_url, registryContent) tuples
+        sources (dict): Revisions of the registries the index is built from
+
+    Returns:
+        dict: Search index with the indexed documents and token postings
+    """
+
+    documents = []
+    postings = {}
+
+    for registry_url, registryContent in registries:
+        registryTokens = set()
+        for field in ("name", "publisher", "description"):
+            registryTokens |= search_tokens(registryContent.get(field))
+
+        for namespaceName, packageName, info in iter_registry_packages(registryContent):
+            documentId = len(documents)
+            documents.append(
+                {
+                    "shortname": f"{namespaceName}/{packageName}",
+                    "registry": registry_url,
+                    "publisher": registryContent.get("publisher"),
+                    "stable": info.get("stable"),
+                }
+            )
+
+            tokens = registryTokens | search_tokens(namespaceName)
+            tokens |= search_tokens(packageName)
+            for token in tokens:
+                postings.setdefault(token, []).append(documentId)
+
+    return {"sources": sources, "documents": documents, "tokens": postings}
+
+
+def search_index_path() -> str:
+    return os.path.join(FppmCache.get_cache_dir(), "search-index.json")
+
+
+def load_search_index(sources):
+    """
+    Loads the persisted search index if it was built from the given sources
+
+    Args:
+        sources (dict): Current revisions of the registries to search
+
+    Returns:
+        dict: Search index, or None if missing or out of date
+    """
+
+    try:
+        with open(search_index_path(), "r") as f:
+            searchIndex = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if searchIndex.get("sources") != sources:
+        return None
+
+    return searchIndex
+
+
+def store_search_index(searchIndex):
+    try:
+        FppmCache.write_atomic(
+            search_index_path(), json.dumps(searchIndex, default=str)
+        )
+    except OSError:
+        pass
+
+
+def search_packages(searchIndex, query, limit=None) -> list:
+    """
+    Searches the index; every query term must match a token exactly, as a
+    prefix, or (when neither matches) approximately, in decreasing order of
+    relevance
+
+    Args:
+        searchIndex (dict): Search index
+        query (str): Search query
+        limit (int): Maximum number of results
+
+    Returns:
+        list: Matching documents, best match first
+    """
+
+    postings = searchIndex["tokens"]
+    sortedTokens = sorted(postings)
+    scores = None
+
+    for term in search_tokens(query):
+        termScores = {}
+
+        def credit(token, score):
+            for documentId in postings[token]:
+                termScores[documentId] = max(termScores.get(documentId, 0), score)
+
+        if term in postings:
+            credit(term, 3)
+
+        position = bisect.bisect_left(sortedTokens, term)
+        while position < len(sortedTokens) and sortedTokens[position].startswith(term):
+            credit(sortedTokens[position], 2)
+            position += 1
+
+        # misspellings are only considered when nothing matches as typed
+        if len(termScores) == 0:
+            for token in difflib.get_close_matches(
+                term, sortedTokens, n=5, cutoff=0.75
+            ):
+                credit(token, 1)
+
+        if scores is None:
+            scores = termScores
+        else:
+            scores = {
+                documentId: score + termScores[documentId]
+                for documentId, score in scores.items()
+                if documentId in termScores
+            }
+
+    if not scores:
+        return []
+
+    ranked = sorted(
+        scores,
+        key=lambda documentId: (
+            -scores[documentId],
+            searchIndex["documents"][documentId]["shortname"],
+        ),
+    )
+    return [searchIndex["documents"][documentId] for documentId in ranked[:limit]]
+
+
+def routes_path() -> str:
+    return os.path.join(FppmCache.get_cache_dir(), "routes.json")
+
+
+def load_routes() -> dict:
+    global _ROUTES
+    with _ROUTES_LOCK:
+        if _ROUTES is None:
+            try:
+                with open(routes_path(), "r") as f:
+                    _ROUTES = json.load(f)
+            except (OSError, ValueError):
+                _ROUTES = {}
+        return _ROUTES
+
+
+def update_namespace_routes(registry_url, namespaces):
+    """
+    Records the namespaces hosted by a registry in the routing table
+
+    Args:
+        registry_url (str): URL (or path) of the registry
+        namespaces (set): Namespaces found in the registry
+    """
+
+    routes = load_routes()
+    namespaces = sorted(namespaces)
+
+    with _ROUTES_LOCK:
+        if routes.get(registry_url) == namespaces:
+            return
+        routes[registry_url] = namespaces
+        try:
+            FppmCache.write_atomic(routes_path(), json.dumps(routes))
+        except OSError:
+            pass
+
+
+def route_namespace(namespace, registry_urls) -> list:
+    """
+    Selects the registries that may host a namespace, based on the routing
+    table recorded from previously obtained registries
+
+    Args:
+        namespace (str): Namespace being looked up
+        registry_urls (list): Registries to choose from, in declared order
+
+    Returns:
+        list: Registries known to host the namespace, plus the ones never
+        obtained, in declared order. Empty on a routing miss.
+    """
+
+    routes = load_routes()
+    candidates = [
+        registry_url
+        for registry_url in registry_urls
+        if registry_url not in routes or namespace in routes[registry_url]
+    ]
+
+    return candidates
@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import fppm.cli.cache as FppmCache
+import fppm.cli.git as FppmGit
+
+# the journal records the packages fetched by an install that has not been
+# recorded in project.yaml yet, so that an interrupted install resumes without
+# fetching them again. It is removed once the install is recorded.
+JOURNAL_PATH = "_fprime_packages/.fppm-journal.json"
+JOURNAL_VERSION = 1
+
+# results of fetch_package kept by the journal
+_RESULT_KEYS = ("commit", "tree", "archive", "archive-sha256")
+
+
+def journal_request(resolved, linkMode) -> dict:
+    # what was asked for a package, a journal entry is only reused for the
+    # same request
+    return {
+        "folder": resolved["folder"],
+        "revision": resolved["revision"],
+        "git": resolved["package"]["info"].get("git"),
+        "link": linkMode,
+    }
+
+
+class InstallJournal:
+    """
+    Journal of the packages fetched by a batch install. Entries are written as
+    soon as a package is in place, and may be recorded concurrently.
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        # a missing or unreadable journal means there is nothing to resume
+        try:
+            with open(self.path, "r") as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            return self.entries
+
+        if content.get("journal-version") == JOURNAL_VERSION:
+            self.entries = content.get("packages") or {}
+        return self.entries
+
+    def completed(self, resolved, linkMode):
+        """
+        Returns the recorded results of a package fetched by an interrupted
+        install, if the same version is still in place
+
+        Args:
+            resolved (dict): Package to install, as returned by resolve_package
+            linkMode (str): Link mode the package is installed with
+
+        Returns:
+            dict: Recorded results (commit, tree, archive), or None if the
+            package must be fetched
+        """
+
+        entry = self.entries.get(resolved["name"])
+        if entry is None or entry["request"] != journal_request(resolved, linkMode):
+            return None
+
+        lockedTree = resolved.get("tree")
+        if lockedTree is not None and entry["result"].get("tree") != lockedTree:
+            return None
+
+        packagePath = f"_fprime_packages/{resolved['folder']}"
+        if not os.path.lexists(packagePath):
+            return None
+        # clones may have been checked out at another version since
+        isClone = os.path.isdir(os.path.join(packagePath, ".git"))
+        recordedCommit = entry["result"].get("commit")
+        if isClone and FppmGit.resolve_revision(packagePath, "HEAD") != recordedCommit:
+            return None
+
+        return entry["result"]
+
+    def record(self, resolved, linkMode):
+        with self._lock:
+            self.entries[resolved["name"]] = {
+                "request": journal_request(resolved, linkMode),
+                "result": {key: resolved.get(key) for key in _RESULT_KEYS},
+            }
+            FppmCache.write_atomic(
+                self.path,
+                json.dumps(
+                    {"journal-version": JOURNAL_VERSION, "packages": self.entries},
+                    indent=2,
+                ),
+            )
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
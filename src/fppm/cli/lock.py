@@ -0,0 +1,167 @@
+import os
+import yaml
+import fppm.cli.cache as FppmCache
+import fppm.cli.utils as FppmUtils
+
+# project.lock sits next to project.yaml and records, for every installed
+# package, where it was found and the exact commit and tree that were checked out
+LOCK_FILE_NAME = "project.lock"
+LOCK_VERSION = 1
+
+
+def lock_path(projectYamlPath) -> str:
+    return os.path.join(os.path.dirname(projectYamlPath), LOCK_FILE_NAME)
+
+
+def load_lock(projectYamlPath):
+    """
+    Loads the lockfile of a project
+
+    Args:
+        projectYamlPath (str): Path to the project.yaml of the project
+
+    Returns:
+        dict: Mapping of package name to its lock entry, empty when the project
+        has no lockfile, or 1 if the lockfile cannot be read
+    """
+
+    path = lock_path(projectYamlPath)
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, "r") as f:
+            lockContent = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        FppmUtils.print_error(f"[ERR]: Error reading {path}: {e}")
+        return 1
+
+    if lockContent.get("lock-version") != LOCK_VERSION:
+        FppmUtils.print_error(
+            f"[ERR]: Unsupported lockfile version in {path}. Delete it to recreate it."
+        )
+        return 1
+
+    return {entry["name"]: entry for entry in lockContent.get("packages") or []}
+
+
+def store_lock(projectYamlPath, lockEntries) -> int:
+    # the lockfile is only rewritten when its content changes
+    path = lock_path(projectYamlPath)
+    lockContent = {
+        "lock-version": LOCK_VERSION,
+        "packages": [lockEntries[name] for name in sorted(lockEntries)],
+    }
+
+    try:
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                if yaml.safe_load(f) == lockContent:
+                    return 0
+
+        FppmCache.write_atomic(
+            path,
+            "# Generated by fppm, do not edit\n"
+            + yaml.dump(lockContent, default_flow_style=False, sort_keys=False),
+        )
+    except (OSError, yaml.YAMLError) as e:
+        FppmUtils.print_error(f"[ERR]: Error writing {path}: {e}")
+        return 1
+
+    return 0
+
+
+def lock_entry(resolved) -> dict:
+    entry = {
+        "name": resolved["name"],
+        "version": resolved["version"],
+        "registry": resolved["package"]["registry"],
+        "git": resolved["package"]["info"]["git"],
+        "commit": resolved["commit"],
+        "tree": resolved["tree"],
+    }
+
+    # packages sharing a repository with others are checked out from a
+    # subdirectory
+    if resolved["package"]["info"].get("package"):
+        entry["package"] = resolved["package"]["info"]["package"]
+
+    # dependencies are not in project.yaml, they are locked with the packages
+    # requiring them
+    if resolved.get("required-by"):
+        entry["required-by"] = resolved["required-by"]
+
+    # packages installed from an archive are verified by the archive digest
+    if resolved.get("archive") is not None:
+        entry["archive"] = resolved["archive"]
+        entry["archive-sha256"] = resolved["archive-sha256"]
+
+    return entry
+
+
+def prune_lock(lockEntries, packageNames) -> dict:
+    """
+    Drops the lock entries of packages that are no longer part of the project:
+    packages not in project.yaml, and dependencies only required by dropped
+    packages
+
+    Args:
+        lockEntries (dict): Lock entries, as returned by load_lock
+        packageNames (set): Names of the packages in project.yaml
+
+    Returns:
+        dict: Remaining lock entries
+    """
+
+    kept = set(name for name in packageNames if name in lockEntries)
+    changed = True
+    while changed:
+        changed = False
+        for name, entry in lockEntries.items():
+            if name not in kept and kept.intersection(entry.get("required-by") or []):
+                kept.add(name)
+                changed = True
+
+    return {name: entry for name, entry in lockEntries.items() if name in kept}
+
+
+def locked_entry(lockEntries, package):
+    """
+    Returns the lock entry of a project.yaml package if it still matches the
+    package (same version, and same registry when the package is pinned)
+
+    Args:
+        lockEntries (dict): Lock entries, as returned by load_lock
+        package (dict): Package entry of project.yaml
+
+    Returns:
+        dict: Lock entry, or None if the package is not locked
+    """
+
+    entry = lockEntries.get(package["name"])
+    if entry is None or str(entry.get("version")) != str(package["version"]):
+        return None
+
+    pinnedRegistry = package.get("registry")
+    if pinnedRegistry is not None and entry.get("registry") != pinnedRegistry:
+        return None
+
+    return entry
+
+
+def lock_mismatches(lockEntries, packages) -> list:
+    # differences between the lockfile and the packages of project.yaml
+    mismatches = []
+
+    for package in packages:
+        if locked_entry(lockEntries, package) is None:
+            mismatches.append(
+                f"[{package['name']}]: version {package['version']} is not locked"
+            )
+
+    keptEntries = prune_lock(lockEntries, {package["name"] for package in packages})
+    for name in lockEntries:
+        if name not in keptEntries:
+            mismatches.append(f"[{name}]: locked but not in project.yaml")
+
+    return mismatches
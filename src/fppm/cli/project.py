@@ -0,0 +1,237 @@
+import copy
+import glob
+import os
+import yaml
+import fppm.cli.cache as FppmCache
+import fppm.cli.lock as FppmLock
+import fppm.cli.state as FppmState
+import fppm.cli.utils as FppmUtils
+import fppm.cli.commands.registries as cmd_registries
+
+PACKAGES_CMAKE_PATH = "_fprime_packages/CMakeLists.txt"
+PACKAGES_CMAKE_LINE = (
+    'add_fprime_subdirectory("${CMAKE_CURRENT_LIST_DIR}/_fprime_packages")\n'
+)
+
+
+def package_cmake_line(folderName) -> str:
+    return f'add_fprime_subdirectory("${{CMAKE_CURRENT_LIST_DIR}}/{folderName}")\n'
+
+
+def is_package_cmake_line(line, folderName) -> bool:
+    # the line of a package folder, or of a subdirectory of it (packages
+    # checked out from a subdirectory of their repository)
+    return line == package_cmake_line(folderName) or line.startswith(
+        f'add_fprime_subdirectory("${{CMAKE_CURRENT_LIST_DIR}}/{folderName}/'
+    )
+
+
+class ProjectSession:
+    """
+    The files of a project (project.yaml, project.lock, the CMake files and the
+    state manifest of _fprime_packages), loaded once per invocation. Changes
+    are accumulated in memory and written by commit, atomically, and only for
+    the files whose content changed.
+    """
+
+    def __init__(self, projectYamlPath):
+        self.projectYamlPath = projectYamlPath
+        self.content = None
+        self.lockEntries = None
+        self._savedContent = None
+        self._savedLockEntries = None
+        self.installed = None
+        self._savedInstalled = None
+        self._addedSubdirectories = []
+        self._removedSubdirectories = []
+
+    def load(self) -> int:
+        projectYamlPath, content = cmd_registries.open_project_yaml(
+            self.projectYamlPath
+        )
+        if content == 1:
+            return 1
+
+        lockEntries = FppmLock.load_lock(self.projectYamlPath)
+        if lockEntries == 1:
+            return 1
+
+        self.content = content or {}
+        self.lockEntries = lockEntries
+        self._savedContent = copy.deepcopy(self.content)
+        self._savedLockEntries = copy.deepcopy(self.lockEntries)
+        self.installed = FppmState.load_state()
+        self._savedInstalled = copy.deepcopy(self.installed)
+        return 0
+
+    @property
+    def registries(self) -> list:
+        return self.content.get("registries") or []
+
+    @property
+    def packages(self) -> list:
+        return self.content.get("packages") or []
+
+    def set_package(self, name, version, registry=None) -> bool:
+        """
+        Adds a package to project.yaml, or updates its version
+
+        Returns:
+            bool: True if the package was added
+        """
+
+        for package in self.packages:
+            if package["name"] == name:
+                package["version"] = version
+                if registry is not None:
+                    package["registry"] = registry
+                return False
+
+        newPackage = {"name": name, "version": version}
+        if registry is not None:
+            newPackage["registry"] = registry
+        self.content.setdefault("packages", [])
+        if self.content["packages"] is None:
+            self.content["packages"] = []
+        self.content["packages"].append(newPackage)
+        return True
+
+    def remove_package(self, name) -> bool:
+        for package in self.packages:
+            if package["name"] == name:
+                self.content["packages"].remove(package)
+                return True
+        return False
+
+    def lock_packages(self, resolvedPackages):
+        # record installed packages, and forget those no longer in the project
+        for resolved in resolvedPackages:
+            self.lockEntries[resolved["name"]] = FppmLock.lock_entry(resolved)
+        self.prune_lock()
+
+    def prune_lock(self):
+        self.lockEntries = FppmLock.prune_lock(
+            self.lockEntries, {package["name"] for package in self.packages}
+        )
+
+    def record_installed(self, resolved, linkMode):
+        self.installed[resolved["name"]] = FppmState.state_entry(
+            resolved, linkMode, self.installed.get(resolved["name"])
+        )
+
+    def forget_installed(self, name):
+        self.installed.pop(name, None)
+
+    def add_cmake_subdirectory(self, folderName):
+        if folderName not in self._addedSubdirectories:
+            self._addedSubdirectories.append(folderName)
+
+    def remove_cmake_subdirectory(self, folderName):
+        self._removedSubdirectories.append(folderName)
+
+    def commit(self) -> int:
+        """
+        Writes the changed files of the project
+
+        Returns:
+            int: 0 on success, 1 on error
+        """
+
+        if self.content != self._savedContent:
+            try:
+                FppmCache.write_atomic(
+                    self.projectYamlPath,
+                    yaml.dump(self.content, default_flow_style=False),
+                )
+            except (OSError, yaml.YAMLError) as e:
+                FppmUtils.print_error(f"[ERR]: Error writing to project.yaml file: {e}")
+                return 1
+            self._savedContent = copy.deepcopy(self.content)
+
+        if self.lockEntries != self._savedLockEntries:
+            if FppmLock.store_lock(self.projectYamlPath, self.lockEntries) == 1:
+                return 1
+            self._savedLockEntries = copy.deepcopy(self.lockEntries)
+
+        if self.installed != self._savedInstalled:
+            try:
+                FppmState.store_state(self.installed)
+            except OSError as e:
+                FppmUtils.print_error(
+                    f"[ERR]: Error writing {FppmState.STATE_PATH}: {e}"
+                )
+                return 1
+            self._savedInstalled = copy.deepcopy(self.installed)
+
+        if self.commit_cmake() == 1:
+            return 1
+
+        return 0
+
+    def commit_cmake(self) -> int:
+        if (
+            len(self._addedSubdirectories) == 0
+            and len(self._removedSubdirectories) == 0
+        ):
+            return 0
+
+        existingLines = ""
+        if os.path.exists(PACKAGES_CMAKE_PATH):
+            with open(PACKAGES_CMAKE_PATH, "r") as cmake:
+                existingLines = cmake.read()
+
+        lines = existingLines.splitlines(keepends=True)
+        if len(lines) > 0 and not lines[-1].endswith("\n"):
+            lines[-1] += "\n"
+        lines = [
+            line
+            for line in lines
+            if not any(
+                is_package_cmake_line(line, folderName)
+                for folderName in self._removedSubdirectories
+            )
+        ]
+        for folderName in self._addedSubdirectories:
+            if package_cmake_line(folderName) not in lines:
+                lines.append(package_cmake_line(folderName))
+
+        try:
+            if "".join(lines) != existingLines:
+                FppmCache.write_atomic(PACKAGES_CMAKE_PATH, "".join(lines))
+        except OSError as e:
+            FppmUtils.print_error(f"[ERR]: Error writing {PACKAGES_CMAKE_PATH}: {e}")
+            return 1
+
+        addedSubdirectories = self._addedSubdirectories
+        self._addedSubdirectories = []
+        self._removedSubdirectories = []
+
+        if len(addedSubdirectories) > 0:
+            return self.include_packages_cmake()
+        return 0
+
+    def include_packages_cmake(self) -> int:
+        # offer to include _fprime_packages in the project CMake file
+        cmakeFiles = glob.glob("*.cmake")
+        if len(cmakeFiles) == 0:
+            FppmUtils.print_warning(
+                f"[WARN]: No .cmake file found to include _fprime_packages in."
+            )
+            return 0
+
+        cmakeFile = cmakeFiles[0]
+        with open(cmakeFile, "r") as cmake:
+            if PACKAGES_CMAKE_LINE in cmake.read():
+                return 0
+
+        askCMake = FppmUtils.prompt(
+            f"[???]: Would you like to include the _fprime_packages CMakeLists.txt file to {cmakeFile}? (y/n): ",
+            ["y", "n"],
+        )
+
+        if askCMake == "y":
+            with open(cmakeFile, "a") as cmake:
+                cmake.write(PACKAGES_CMAKE_LINE)
+
+        FppmUtils.print_success(f"[DONE]: Added _fprime_packages to {cmakeFile}")
+        return 0
@@ -0,0 +1,320 @@
+import gzip
+import hashlib
+import json
+import struct
+import tempfile
+import zlib
+import yaml
+
+# use libyaml when PyYAML was built against it
+YamlSafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class YamlEventLoader(YamlSafeLoader, yaml.composer.Composer):
+    # YamlSafeLoader that also composes single nodes while reading events, which
+    # the libyaml loader otherwise only does for whole documents
+    def __init__(self, stream):
+        super().__init__(stream)
+        yaml.composer.Composer.__init__(self)
+
+
+# compiled registry layout:
+#   magic (8 bytes) | format version (u16) | encoding (u8) | sha256 of the
+#   source registry.yaml (32 bytes) | payload
+# The payload encoding is versioned so that readers can reject layouts they
+# do not understand and fall back to the YAML registry.
+COMPILED_MAGIC = b"FPPMREG\x00"
+COMPILED_VERSION = 1
+COMPILED_ENCODING_ZLIB_JSON = 0
+COMPILED_EXTENSION = ".fppmc"
+_COMPILED_HEADER = struct.Struct(">8sHB32s")
+
+# downloads are spooled to disk past this size, and read in chunks of this size
+SPOOL_MEMORY_BYTES = 1024 * 1024
+SPOOL_CHUNK_BYTES = 64 * 1024
+
+
+# registries may be served compressed, they are decompressed while parsed
+REGISTRY_EXTENSIONS = {".yaml": None, ".yaml.gz": "gzip", ".yaml.zst": "zstd"}
+
+
+def registry_extension(registry_path):
+    # returns the registry extension of a path or URL, or None if unsupported
+    for extension in sorted(REGISTRY_EXTENSIONS, key=len, reverse=True):
+        if registry_path.endswith(extension):
+            return extension
+    return None
+
+
+def is_compressed(registry_path) -> bool:
+    return REGISTRY_EXTENSIONS.get(registry_extension(registry_path)) is not None
+
+
+def open_decompressed(stream, registry_path):
+    """
+    Wraps a binary stream of a registry with streaming decompression when the
+    registry is compressed (.yaml.gz or .yaml.zst)
+
+    Raises:
+        ValueError: zstd decompression is not available
+    """
+
+    compression = REGISTRY_EXTENSIONS.get(registry_extension(registry_path))
+
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+
+    if compression == "zstd":
+        try:
+            from compression import zstd  # Python 3.14+
+
+            return zstd.ZstdFile(stream, mode="rb")
+        except ImportError:
+            pass
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError(
+                "zstd registries require the zstandard package (pip install fprime-fppm[zstd])"
+            )
+        return zstandard.ZstdDecompressor().stream_reader(stream)
+
+    return stream
+
+
+def yaml_load(data):
+    return yaml.load(data, Loader=YamlSafeLoader)
+
+
+def compiled_path(registry_path) -> str:
+    """
+    Returns the path (or URL) of the compiled artifact that is published
+    alongside a registry, i.e. registry.yaml (or registry.yaml.gz) ->
+    registry.fppmc
+    """
+
+    extension = registry_extension(registry_path)
+    if extension is not None:
+        registry_path = registry_path[: -len(extension)]
+    return registry_path + COMPILED_EXTENSION
+
+
+def compile_registry(yamlData: bytes, sourceDigest=None) -> bytes:
+    """
+    Compiles the content of a registry.yaml into the binary snapshot format
+
+    Args:
+        yamlData (bytes): Uncompressed content of the registry.yaml
+        sourceDigest (str): Hex sha256 of the published registry file, defaults
+            to the digest of yamlData (they differ for compressed registries)
+
+    Returns:
+        bytes: Compiled registry
+    """
+
+    if sourceDigest is None:
+        sourceDigest = hashlib.sha256(yamlData).hexdigest()
+
+    content = yaml_load(yamlData)
+    payload = zlib.compress(
+        json.dumps(content, default=str, separators=(",", ":")).encode("utf-8")
+    )
+    header = _COMPILED_HEADER.pack(
+        COMPILED_MAGIC,
+        COMPILED_VERSION,
+        COMPILED_ENCODING_ZLIB_JSON,
+        bytes.fromhex(sourceDigest),
+    )
+    return header + payload
+
+
+def compiled_source_digest(data: bytes):
+    """
+    Returns the hex sha256 of the registry.yaml a compiled registry was built
+    from, or None if data is not a compiled registry this version understands
+    """
+
+    if len(data) < _COMPILED_HEADER.size:
+        return None
+
+    magic, version, encoding, digest = _COMPILED_HEADER.unpack_from(data)
+    if (
+        magic != COMPILED_MAGIC
+        or version != COMPILED_VERSION
+        or encoding != COMPILED_ENCODING_ZLIB_JSON
+    ):
+        return None
+
+    return digest.hex()
+
+
+def load_compiled_registry(data: bytes, expectedDigest=None):
+    """
+    Loads a compiled registry
+
+    Args:
+        data (bytes): Compiled registry
+        expectedDigest (str): If given, hex sha256 of the registry.yaml the
+            snapshot must have been compiled from
+
+    Returns:
+        dict: Registry content, or None if the snapshot is invalid or stale
+    """
+
+    digest = compiled_source_digest(data)
+    if digest is None:
+        return None
+    if expectedDigest is not None and digest != expectedDigest:
+        return None
+
+    try:
+        return json.loads(zlib.decompress(data[_COMPILED_HEADER.size :]))
+    except (zlib.error, ValueError):
+        return None
+
+
+def spool_chunks(chunks, maxBytes=None) -> tuple:
+    """
+    Spools a stream of byte chunks into a temporary file (kept in memory while
+    small), hashing it on the way
+
+    Args:
+        chunks (iterable): Byte chunks, e.g. response.iter_content()
+        maxBytes (int): Maximum accepted size, None or 0 for no limit
+
+    Returns:
+        tuple: (file positioned at its start, hex sha256 of the content)
+
+    Raises:
+        ValueError: The content is larger than maxBytes
+    """
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    digest = hashlib.sha256()
+    size = 0
+
+    for chunk in chunks:
+        size += len(chunk)
+        if maxBytes and size > maxBytes:
+            spool.close()
+            raise ValueError(f"registry is larger than the {maxBytes} bytes limit")
+        digest.update(chunk)
+        spool.write(chunk)
+
+    spool.seek(0)
+    return (spool, digest.hexdigest())
+
+
+def file_digest(stream) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(SPOOL_CHUNK_BYTES), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def select_namespaces(registryContent, namespaces) -> dict:
+    # copy of a parsed registry that only keeps the given namespaces
+    selected = []
+    for namespace in registryContent.get("namespaces") or []:
+        if not isinstance(namespace, dict):
+            continue
+        kept = {name: value for name, value in namespace.items() if name in namespaces}
+        if kept:
+            selected.append(kept)
+    return dict(registryContent, namespaces=selected)
+
+
+def skip_node(loader):
+    # consumes the events of the next node without building it
+    depth = 0
+    while True:
+        event = loader.get_event()
+        if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
+
+
+def load_node(loader):
+    return loader.construct_document(loader.compose_node(None, None))
+
+
+def namespace_names(registryContent) -> set:
+    # names of the namespaces a parsed registry hosts
+    names = set()
+    for namespace in (registryContent or {}).get("namespaces") or []:
+        if isinstance(namespace, dict):
+            names.update(namespace)
+    return names
+
+
+def load_registry(stream, namespaces=None, hostedNamespaces=None):
+    """
+    Parses a registry from a stream (text or bytes)
+
+    When namespaces are given the registry is parsed event by event and only
+    those namespaces are built, so memory stays proportional to what is looked
+    up rather than to the size of the registry.
+
+    Args:
+        stream: File-like object (or str/bytes) holding the registry YAML
+        namespaces (iterable): Namespaces to keep, None to load everything
+        hostedNamespaces (set): If given, receives the names of every namespace
+            met while parsing partially, including the skipped ones
+
+    Returns:
+        dict: Registry content
+    """
+
+    if namespaces is None:
+        return yaml_load(stream)
+
+    namespaces = set(namespaces)
+    loader = YamlEventLoader(stream)
+    try:
+        loader.get_event()  # stream start
+        if loader.check_event(yaml.StreamEndEvent):
+            return None
+        loader.get_event()  # document start
+
+        if not loader.check_event(yaml.MappingStartEvent):
+            # not a registry layout, nothing to select from
+            return loader.construct_document(loader.compose_node(None, None))
+
+        loader.get_event()
+        registryContent = {}
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = load_node(loader)
+            if key != "namespaces" or not loader.check_event(yaml.SequenceStartEvent):
+                registryContent[key] = load_node(loader)
+                continue
+
+            loader.get_event()
+            selected = []
+            while not loader.check_event(yaml.SequenceEndEvent):
+                if not loader.check_event(yaml.MappingStartEvent):
+                    skip_node(loader)
+                    continue
+
+                loader.get_event()
+                namespace = {}
+                while not loader.check_event(yaml.MappingEndEvent):
+                    namespaceName = load_node(loader)
+                    if hostedNamespaces is not None:
+                        hostedNamespaces.add(namespaceName)
+                    if namespaceName in namespaces:
+                        namespace[namespaceName] = load_node(loader)
+                    else:
+                        skip_node(loader)
+                loader.get_event()
+
+                if namespace:
+                    selected.append(namespace)
+            loader.get_event()
+            registryContent["namespaces"] = selected
+
+        return registryContent
+    finally:
+        loader.dispose()
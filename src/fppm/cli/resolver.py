@@ -0,0 +1,423 @@
+import json
+import os
+import re
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import yaml
+import fppm.cli.cache as FppmCache
+import fppm.cli.git as FppmGit
+
+# the dependencies of a commit never change, so they are cached per commit
+# in the user cache, and in memory for this invocation
+_DEPENDENCIES = {}
+_TAGS = {}
+_MEMO_LOCK = threading.Lock()
+
+# version selection is repeated until no selected version changes
+MAX_RESOLUTION_ROUNDS = 100
+
+_CONSTRAINT_PATTERN = re.compile(r"^(==|!=|>=|<=|>|<)\s*(\S+)$")
+
+
+def parse_version(version):
+    # tags such as v1.2.0 or 1.2 as comparable tuples, None for other revisions
+    match = re.fullmatch(r"v?(\d+(?:\.\d+)*)", str(version).strip())
+    if match is None:
+        return None
+    return tuple(int(part) for part in match.group(1).split("."))
+
+
+def parse_constraint(constraint):
+    """
+    Parses a dependency version constraint
+
+    A constraint is either empty (any version), an exact tag or commit hash, or
+    comma separated comparisons of version tags, e.g. ">=v1.0, <v2.0".
+
+    Returns:
+        list: (operator, version) comparisons, with operator "any" or "exact"
+        for the first two forms
+
+    Raises:
+        ValueError: The constraint compares against something that is not a
+            version tag
+    """
+
+    if constraint is None or str(constraint).strip() in ("", "*"):
+        return [("any", None)]
+
+    constraint = str(constraint).strip()
+    if not any(constraint.startswith(op) for op in ("=", "!", ">", "<")):
+        return [("exact", constraint)]
+
+    comparisons = []
+    for part in constraint.split(","):
+        match = _CONSTRAINT_PATTERN.match(part.strip())
+        if match is None or parse_version(match.group(2)) is None:
+            raise ValueError(f"invalid version constraint [{constraint}]")
+        comparisons.append((match.group(1), parse_version(match.group(2))))
+    return comparisons
+
+
+def satisfies(version, comparisons) -> bool:
+    parsed = parse_version(version)
+
+    for operator, expected in comparisons:
+        if operator == "any":
+            continue
+        if operator == "exact":
+            if version != expected:
+                return False
+            continue
+        if parsed is None:
+            return False
+        if not {
+            "==": parsed == expected,
+            "!=": parsed != expected,
+            ">=": parsed >= expected,
+            "<=": parsed <= expected,
+            ">": parsed > expected,
+            "<": parsed < expected,
+        }[operator]:
+            return False
+
+    return True
+
+
+def normalize_dependencies(dependencies) -> list:
+    """
+    Normalizes the dependencies section of a package.yaml. Dependencies are
+    either shortnames, or mappings with a name and an optional version.
+
+    Returns:
+        list: (shortname, version constraint) tuples
+    """
+
+    normalized = []
+    for dependency in dependencies or []:
+        if isinstance(dependency, str):
+            normalized.append((dependency, None))
+        elif isinstance(dependency, dict) and "name" in dependency:
+            version = dependency.get("version")
+            normalized.append(
+                (dependency["name"], str(version) if version is not None else None)
+            )
+    return normalized
+
+
+def dependencies_path(gitUrl, commit, subdirectory=None) -> str:
+    key = f"{gitUrl}@{commit}"
+    if subdirectory is not None:
+        key += f":{subdirectory}"
+    return os.path.join(
+        FppmCache.get_cache_dir("dependencies"),
+        f"{FppmCache.cache_key(key)}.json",
+    )
+
+
+def local_repositories(gitUrl, packagePath=None) -> list:
+    # local copies of a package: its installed clone and its git store mirror
+    repositories = []
+    if packagePath is not None and os.path.isdir(os.path.join(packagePath, ".git")):
+        repositories.append(packagePath)
+    if os.path.isdir(FppmGit.mirror_path(gitUrl)):
+        repositories.append(FppmGit.mirror_path(gitUrl))
+    return repositories
+
+
+def package_repository(gitUrl, revision, packagePath=None):
+    # repository holding a revision, the network is only used when no local
+    # copy of the package has it, to fetch that revision alone
+    for repositoryPath in local_repositories(gitUrl, packagePath) + [
+        FppmGit.metadata_path(gitUrl)
+    ]:
+        if os.path.isdir(repositoryPath) and FppmGit.has_revision(
+            repositoryPath, revision
+        ):
+            return repositoryPath
+
+    try:
+        return FppmGit.fetch_metadata(gitUrl, revision)
+    except subprocess.CalledProcessError:
+        return None
+
+
+def remote_tags(refs) -> list:
+    # tag names of the refs listed by ls_remote, without the peeled entries
+    tags = set()
+    for line in refs:
+        ref = line.split("\t")[-1]
+        if ref.startswith("refs/tags/") and not ref.endswith("^{}"):
+            tags.add(ref[len("refs/tags/") :])
+    return sorted(tags)
+
+
+def list_tags(gitUrl, packagePath=None) -> list:
+    with _MEMO_LOCK:
+        if gitUrl in _TAGS:
+            return _TAGS[gitUrl]
+
+    # all published tags are needed: they are listed by the remote, without
+    # fetching anything. Local copies are used offline or when the remote
+    # cannot be reached.
+    tags = None
+    if not FppmCache.is_offline():
+        try:
+            tags = remote_tags(FppmGit.backend().ls_remote(gitUrl))
+        except subprocess.CalledProcessError:
+            pass
+    if tags is None:
+        tags = []
+        for repositoryPath in local_repositories(gitUrl, packagePath):
+            tags = FppmGit.backend().list_tags(repositoryPath)
+            break
+
+    with _MEMO_LOCK:
+        _TAGS[gitUrl] = tags
+    return tags
+
+
+def read_dependencies(gitUrl, revision, packagePath=None, subdirectory=None) -> list:
+    """
+    Reads the dependencies declared in the package.yaml of a package revision
+
+    Args:
+        gitUrl (str): Git URL of the package
+        revision (str): tags/<tag> or a commit hash
+        packagePath (str): Installed clone of the package, looked up before
+            the git store
+        subdirectory (str): Subdirectory of the repository holding the
+            package and its package.yaml
+
+    Returns:
+        list: (shortname, version constraint) tuples
+
+    Raises:
+        ValueError: The revision is not available
+    """
+
+    with _MEMO_LOCK:
+        if (gitUrl, revision, subdirectory) in _DEPENDENCIES:
+            return _DEPENDENCIES[(gitUrl, revision, subdirectory)]
+
+    repositoryPath = package_repository(gitUrl, revision, packagePath)
+    commit = (
+        FppmGit.resolve_revision(repositoryPath, revision)
+        if repositoryPath is not None
+        else None
+    )
+    if commit is None:
+        raise ValueError(f"revision {revision} of {gitUrl} is not available")
+
+    with _MEMO_LOCK:
+        if (gitUrl, commit, subdirectory) in _DEPENDENCIES:
+            return _DEPENDENCIES[(gitUrl, commit, subdirectory)]
+
+    cachePath = dependencies_path(gitUrl, commit, subdirectory)
+    packageYamlPath = (
+        "package.yaml" if subdirectory is None else f"{subdirectory}/package.yaml"
+    )
+    try:
+        with open(cachePath, "r") as f:
+            dependencies = [tuple(dependency) for dependency in json.load(f)]
+    except (OSError, ValueError):
+        try:
+            # packages without a package.yaml have no dependencies
+            packageYaml = FppmGit.backend().read_file(
+                repositoryPath, commit, packageYamlPath
+            )
+            dependencies = normalize_dependencies(
+                (yaml.safe_load(packageYaml or "") or {}).get("dependencies")
+            )
+        except yaml.YAMLError as e:
+            raise ValueError(f"invalid package.yaml in {gitUrl} at {commit}: {e}")
+
+        try:
+            FppmCache.write_atomic(cachePath, json.dumps(dependencies))
+        except OSError:
+            pass
+
+    with _MEMO_LOCK:
+        _DEPENDENCIES[(gitUrl, commit, subdirectory)] = dependencies
+        _DEPENDENCIES[(gitUrl, revision, subdirectory)] = dependencies
+    return dependencies
+
+
+def select_version(shortname, package, requirements, packagePath=None) -> str:
+    """
+    Selects the version of a dependency satisfying all its requirements: the
+    stable version when unconstrained, otherwise the exact version required,
+    or the highest version tag allowed by the constraints
+
+    Args:
+        shortname (str): Dependency shortname
+        package (dict): Registry candidate of the dependency
+        requirements (list): (required by, constraint) tuples
+
+    Returns:
+        str: Selected version
+
+    Raises:
+        ValueError: No version satisfies the requirements
+    """
+
+    comparisons = []
+    for _, constraint in requirements:
+        comparisons += parse_constraint(constraint)
+
+    exact = [expected for operator, expected in comparisons if operator == "exact"]
+    stable = package["info"].get("stable")
+
+    if len(exact) > 0:
+        candidates = [exact[0]]
+    elif stable is not None and all(operator == "any" for operator, _ in comparisons):
+        candidates = [str(stable)]
+    else:
+        candidates = sorted(
+            (
+                tag
+                for tag in list_tags(package["info"]["git"], packagePath)
+                if parse_version(tag) is not None
+            ),
+            key=parse_version,
+            reverse=True,
+        )
+
+    for candidate in candidates:
+        if satisfies(candidate, comparisons):
+            return candidate
+
+    required = ", ".join(
+        f"{constraint or 'any version'} (required by {requiredBy})"
+        for requiredBy, constraint in requirements
+    )
+    raise ValueError(f"no version of [{shortname}] satisfies: {required}")
+
+
+def resolve_dependencies(
+    roots, lookup_package, version_ref, installed=None, jobs=1
+) -> dict:
+    """
+    Computes the transitive dependencies of a set of packages
+
+    The versions of the roots are fixed. Every other package gets the version
+    selected by select_version from the requirements of the packages depending
+    on it; selection is repeated until no version changes, since selecting a
+    different version may change the dependencies of that package.
+
+    Args:
+        roots (dict): Mapping of shortname to (version, registry candidate,
+            git revision) of the packages of the project
+        lookup_package (callable): Returns the registry candidate of a
+            shortname, or None if it cannot be found
+        version_ref (callable): Turns a version into a git revision
+        installed (dict): Mapping of shortname to version of other packages of
+            the project, whose versions are fixed as well
+        jobs (int): Number of package.yaml files read concurrently
+
+    Returns:
+        dict: Mapping of shortname to (version, registry candidate, sorted list
+        of the packages requiring it) for the dependencies that are not roots
+
+    Raises:
+        ValueError: A dependency cannot be found, is not available, or has no
+            version satisfying its requirements
+    """
+
+    installed = installed or {}
+    packages = {}
+    selected = {}
+
+    def folder(shortname):
+        return f"_fprime_packages/{shortname.replace('/', '.')}"
+
+    def package_dependencies(shortname, package, revision):
+        return read_dependencies(
+            package["info"]["git"],
+            revision,
+            folder(shortname),
+            str(package["info"].get("package") or "").strip("/") or None,
+        )
+
+    for _ in range(MAX_RESOLUTION_ROUNDS):
+        # requirements of every package currently part of the graph, the
+        # package.yaml files of each level of the graph are read concurrently
+        requirements = {}
+        pending = list(roots)
+        visited = set()
+        while len(pending) > 0:
+            level = []
+            for shortname in pending:
+                if shortname in visited:
+                    continue
+                visited.add(shortname)
+
+                if shortname in roots:
+                    _, package, revision = roots[shortname]
+                elif shortname in selected:
+                    package = packages[shortname]
+                    revision = version_ref(selected[shortname])
+                else:
+                    # selected at the end of this round, walked in the next one
+                    continue
+                level.append((shortname, package, revision))
+
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                levelDependencies = list(
+                    pool.map(lambda walked: package_dependencies(*walked), level)
+                )
+
+            pending = []
+            for (shortname, _, _), dependencies in zip(level, levelDependencies):
+                for dependency, constraint in dependencies:
+                    requirements.setdefault(dependency, []).append(
+                        (shortname, constraint)
+                    )
+                    pending.append(dependency)
+
+        changed = False
+        for shortname, required in requirements.items():
+            if shortname in roots or shortname in installed:
+                version = (
+                    roots[shortname][0] if shortname in roots else installed[shortname]
+                )
+                for requiredBy, constraint in required:
+                    if not satisfies(version, parse_constraint(constraint)):
+                        raise ValueError(
+                            f"[{requiredBy}] requires [{shortname}] {constraint}, but the project uses {version}"
+                        )
+                continue
+
+            if shortname not in packages:
+                package = lookup_package(shortname)
+                if package is None:
+                    raise ValueError(
+                        f"dependency [{shortname}] was not found in the registries"
+                    )
+                packages[shortname] = package
+
+            version = select_version(
+                shortname, packages[shortname], required, folder(shortname)
+            )
+            if selected.get(shortname) != version:
+                selected[shortname] = version
+                changed = True
+
+        # drop dependencies no longer required by the selected versions
+        for shortname in list(selected):
+            if shortname not in requirements:
+                del selected[shortname]
+                changed = True
+
+        if not changed:
+            return {
+                shortname: (
+                    version,
+                    packages[shortname],
+                    sorted({requiredBy for requiredBy, _ in requirements[shortname]}),
+                )
+                for shortname, version in selected.items()
+            }
+
+    raise ValueError("dependency versions did not converge")
@@ -5,6 +5,11 @@ import fppm.cli.commands.init as cmd_init
 import fppm.cli.commands.install as cmd_install
 import fppm.cli.commands.config as cmd_config
 import fppm.cli.commands.remove as cmd_remove
+import fppm.cli.commands.search as cmd_search
+import fppm.cli.commands.store as cmd_store
+import fppm.cli.commands.fetch as cmd_fetch
+import fppm.cli.commands.sync as cmd_sync
+import fppm.cli.commands.status as cmd_status
 import sys
 from fppm.cli.utils import bcolors
 
@@ -15,6 +20,12 @@ ROUTER = {
     "install": cmd_install.install_package,
     "config": cmd_config.config_entry,
     "remove": cmd_remove.remove_package,
+    "search": cmd_search.search_packages,
+    "store": cmd_store.store_entrypoint,
+    "fetch": cmd_fetch.fetch_project,
+    "sync": cmd_sync.sync_project,
+    "list": cmd_status.list_packages,
+    "status": cmd_status.list_packages,
 }
 
 
@@ -2,6 +2,182 @@ import argparse
 import sys
 import fppm.cli.router as CMD_ROUTER
 import fppm.cli.utils as FppmUtils
+import fppm.cli.cache as FppmCache
+import fppm.cli.git as FppmGit
+import fppm.cli.store as FppmStore
+
+
+# set up the "search" subcommand parser
+def setup_search_parser(subparsers) -> callable:
+    search_parser = subparsers.add_parser(
+        "search",
+        description="Search the cached package registries for packages",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        help="Search the cached package registries for packages",
+        add_help=True,
+    )
+
+    search_parser.add_argument(
+        "query",
+        type=str,
+        nargs="*",
+        help="Words to search for in namespaces, package names, publishers and registry descriptions",
+    )
+
+    search_parser.add_argument(
+        "--limit",
+        "-l",
+        type=int,
+        default=20,
+        help="The maximum number of results to show",
+        required=False,
+    )
+
+    search_parser.add_argument(
+        "--project-yaml-path",
+        type=str,
+        help="The relative path to the project.yaml file",
+        required=False,
+    )
+
+    return search_parser
+
+
+# set up the "store" subcommand parser
+def setup_store_parser(subparsers) -> callable:
+    store_parser = subparsers.add_parser(
+        "store",
+        description="Manage the package store used by --link-mode",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        help="Manage the package store used by --link-mode",
+        add_help=True,
+    )
+
+    store_parser.add_argument(
+        "action",
+        type=str,
+        choices=["gc"],
+        help="gc: evict the least recently used package trees to fit the size budget",
+    )
+
+    store_parser.add_argument(
+        "--max-size",
+        type=str,
+        help="Size budget of the store, e.g. 500M or 2G",
+        required=False,
+    )
+
+    return store_parser
+
+
+# set up the "fetch" subcommand parser
+def setup_fetch_parser(subparsers) -> callable:
+    fetch_parser = subparsers.add_parser(
+        "fetch",
+        description="Download the registries and packages of the project into the local caches, without installing them",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        help="Download the registries and packages of the project into the local caches, without installing them",
+        add_help=True,
+    )
+
+    fetch_parser.add_argument(
+        "--project-yaml-path",
+        type=str,
+        help="The relative path to the project.yaml file",
+        required=False,
+    )
+
+    fetch_parser.add_argument(
+        "--link-mode",
+        type=str,
+        choices=FppmStore.LINK_MODES,
+        help="Also add the packages to the package store when they will be installed as symlinks or hardlinks",
+        required=False,
+    )
+
+    fetch_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=4,
+        help="Number of packages to fetch concurrently",
+        required=False,
+    )
+
+    return fetch_parser
+
+
+# set up the "sync" subcommand parser
+def setup_sync_parser(subparsers) -> callable:
+    sync_parser = subparsers.add_parser(
+        "sync",
+        description="Install, update and remove packages so that _fprime_packages matches project.yaml",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        help="Install, update and remove packages so that _fprime_packages matches project.yaml",
+        add_help=True,
+    )
+
+    sync_parser.add_argument(
+        "--project-yaml-path",
+        type=str,
+        help="The relative path to the project.yaml file",
+        required=False,
+    )
+
+    sync_parser.add_argument(
+        "--link-mode",
+        type=str,
+        choices=FppmStore.LINK_MODES,
+        help="Install packages as git clones, or as symlinks or hardlinks into the package store",
+        required=False,
+    )
+
+    sync_parser.add_argument(
+        "--fetch-strategy",
+        type=str,
+        choices=FppmGit.FETCH_STRATEGIES,
+        help="How packages are cloned: full history, shallow (only the requested version) or partial (file contents fetched on checkout)",
+        required=False,
+    )
+
+    sync_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=4,
+        help="Number of packages to install concurrently",
+        required=False,
+    )
+
+    return sync_parser
+
+
+# set up the "list" subcommand parser
+def setup_list_parser(subparsers) -> callable:
+    list_parser = subparsers.add_parser(
+        "list",
+        aliases=["status"],
+        description="List the packages of the project and the versions installed in _fprime_packages",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        help="List the packages of the project and the versions installed in _fprime_packages",
+        add_help=True,
+    )
+
+    list_parser.add_argument(
+        "--project-yaml-path",
+        type=str,
+        help="The relative path to the project.yaml file",
+        required=False,
+    )
+
+    list_parser.add_argument(
+        "--json",
+        action=argparse.BooleanOptionalAction,
+        help="Print the packages as JSON",
+        required=False,
+    )
+
+    return list_parser
 
 
 # set up the "remove" subcommand parser
@@ -94,6 +270,14 @@ def setup_install_parser(subparsers) -> callable:
         required=False,
     )
 
+    install_parser.add_argument(
+        "--registry",
+        "-r",
+        type=str,
+        help="Only look the package up in this registry, and pin it to it in project.yaml",
+        required=False,
+    )
+
     install_parser.add_argument(
         "--project-yaml-path",
         type=str,
@@ -108,6 +292,38 @@ def setup_install_parser(subparsers) -> callable:
         required=False,
     )
 
+    install_parser.add_argument(
+        "--link-mode",
+        type=str,
+        choices=FppmStore.LINK_MODES,
+        help="Install packages as git clones, or as symlinks or hardlinks into the package store",
+        required=False,
+    )
+
+    install_parser.add_argument(
+        "--frozen",
+        action=argparse.BooleanOptionalAction,
+        help="With --project, fail if project.lock does not match project.yaml",
+        required=False,
+    )
+
+    install_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of packages to fetch concurrently with --project",
+        required=False,
+    )
+
+    install_parser.add_argument(
+        "--fetch-strategy",
+        type=str,
+        choices=FppmGit.FETCH_STRATEGIES,
+        help="How packages are cloned: full history, shallow (only the requested version) or partial (file contents fetched on checkout)",
+        required=False,
+    )
+
     return install_parser
 
 
@@ -137,6 +353,22 @@ def setup_registries_parser(subparsers) -> callable:
         required=False,
     )
 
+    registries_parser.add_argument(
+        "--compile",
+        "-c",
+        type=str,
+        help="Compile a registry.yaml into a registry.fppmc snapshot to publish alongside it",
+        required=False,
+    )
+
+    registries_parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        help="Output path of the compiled registry (with --compile)",
+        required=False,
+    )
+
     registries_parser.add_argument(
         "--project-yaml-path",
         type=str,
@@ -187,6 +419,18 @@ def start_cli_parser(args: list):
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
 
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use local caches (registries and package clones); never access the network",
+    )
+
+    parser.add_argument(
+        "--git-backend",
+        choices=FppmGit.GIT_BACKENDS,
+        help="Implementation of local git operations: the git command line (subprocess, default) or in-process (dulwich)",
+    )
+
     subparsers = parser.add_subparsers(dest="command")
 
     # setup all subparsers
@@ -196,6 +440,11 @@ def start_cli_parser(args: list):
     setup_registries_parser(subparsers)
     setup_config_parser(subparsers)
     setup_remove_parser(subparsers)
+    setup_search_parser(subparsers)
+    setup_store_parser(subparsers)
+    setup_fetch_parser(subparsers)
+    setup_sync_parser(subparsers)
+    setup_list_parser(subparsers)
 
     parsed, unknown = parser.parse_known_args(args)
 
@@ -207,5 +456,11 @@ def start_cli_parser(args: list):
         FppmUtils.print_error(f"[ERR] No command provided")
         sys.exit(1)
 
+    if parsed.offline:
+        FppmCache.set_offline(True)
+
+    if parsed.git_backend is not None:
+        FppmGit.set_git_backend(parsed.git_backend)
+
     # route the command
     return CMD_ROUTER.route_commands(parsed.command, parsed)
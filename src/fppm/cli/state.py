@@ -0,0 +1,95 @@
+import datetime
+import json
+import os
+import fppm.cli.cache as FppmCache
+import fppm.cli.utils as FppmUtils
+
+# the state manifest records what is installed in _fprime_packages, so that
+# installed packages and their versions are known without running git
+STATE_PATH = "_fprime_packages/.fppm-state.json"
+STATE_VERSION = 1
+
+
+def load_state() -> dict:
+    """
+    Loads the state manifest of _fprime_packages
+
+    Returns:
+        dict: Mapping of package name to its state entry, empty when nothing
+        was recorded yet or the manifest cannot be read
+    """
+
+    try:
+        with open(STATE_PATH, "r") as f:
+            content = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        FppmUtils.print_warning(f"[WARN]: Ignoring unreadable {STATE_PATH}: {e}")
+        return {}
+
+    if content.get("state-version") != STATE_VERSION:
+        return {}
+    return {entry["name"]: entry for entry in content.get("packages") or []}
+
+
+def store_state(stateEntries):
+    # written atomically, and only when _fprime_packages exists
+    if not os.path.isdir(os.path.dirname(STATE_PATH)):
+        return
+
+    FppmCache.write_atomic(
+        STATE_PATH,
+        json.dumps(
+            {
+                "state-version": STATE_VERSION,
+                "packages": [stateEntries[name] for name in sorted(stateEntries)],
+            },
+            indent=2,
+        ),
+    )
+
+
+def state_entry(resolved, linkMode, previousEntry=None) -> dict:
+    """
+    Builds the state entry of an installed package
+
+    Args:
+        resolved (dict): Installed package, with the commit and tree recorded
+            by the install
+        linkMode (str): Link mode the package was installed with
+        previousEntry (dict): State entry of the package before the install,
+            whose install time is kept if the same version is still installed
+
+    Returns:
+        dict: State entry
+    """
+
+    entry = {
+        "name": resolved["name"],
+        "folder": resolved["folder"],
+        "version": resolved["version"],
+        "commit": resolved.get("commit"),
+        "tree": resolved.get("tree"),
+        "registry": resolved["package"]["registry"],
+        "link": linkMode,
+    }
+
+    if resolved["package"]["info"].get("package"):
+        entry["package"] = resolved["package"]["info"]["package"]
+    if resolved.get("archive-sha256") is not None:
+        entry["archive-sha256"] = resolved["archive-sha256"]
+    if resolved.get("required-by"):
+        entry["required-by"] = resolved["required-by"]
+
+    installedAt = None
+    if previousEntry is not None and all(
+        previousEntry.get(key) == entry.get(key)
+        for key in ("commit", "tree", "link", "archive-sha256")
+    ):
+        installedAt = previousEntry.get("installed-at")
+    entry["installed-at"] = installedAt or datetime.datetime.now(
+        datetime.timezone.utc
+    ).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    return entry
@@ -0,0 +1,198 @@
+import os
+import re
+import shutil
+import stat
+import subprocess
+import tarfile
+import tempfile
+import fppm.cli.cache as FppmCache
+
+# how packages are materialized in _fprime_packages:
+#   clone     a git clone of the package (default)
+#   symlink   a symlink to the checked out tree in the package store
+#   hardlink  a directory whose files are hardlinks into the package store
+LINK_MODES = ("clone", "symlink", "hardlink")
+LINK_MODE = os.environ.get("FPPM_LINK_MODE", "clone")
+
+# size budget `fppm store gc` evicts down to, when --max-size is not given
+STORE_MAX_SIZE = os.environ.get("FPPM_STORE_MAX_SIZE", "5G")
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_size(size) -> int:
+    """
+    Parses a size such as 500M or 2G into bytes
+
+    Raises:
+        ValueError: The size is not valid
+    """
+
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", str(size).upper())
+    if match is None:
+        raise ValueError(f"invalid size [{size}]")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def tree_path(treeHash) -> str:
+    return os.path.join(FppmCache.get_cache_dir("store"), treeHash)
+
+
+def has_tree(treeHash) -> bool:
+    return os.path.isdir(tree_path(treeHash))
+
+
+def touch_tree(treeHash):
+    # the modification time of an entry records when it was last used
+    try:
+        os.utime(tree_path(treeHash))
+    except OSError:
+        pass
+
+
+def add_tree(repositoryPath, commit, treeHash) -> str:
+    """
+    Adds the tree of a commit to the store, if it is not stored yet. Stored
+    files are read-only, so that hardlinked packages cannot modify the store.
+
+    Args:
+        repositoryPath (str): Git repository holding the commit (e.g. a mirror)
+        commit (str): Commit to store
+        treeHash (str): Hash of the tree of the commit, the key of the entry
+
+    Returns:
+        str: Path to the stored tree
+
+    Raises:
+        subprocess.CalledProcessError: git failed to export the commit
+    """
+
+    entryPath = tree_path(treeHash)
+    if os.path.isdir(entryPath):
+        return entryPath
+
+    # export next to the final location, then move it in place so that an
+    # interrupted export never looks like a stored tree
+    tmpPath = tempfile.mkdtemp(dir=os.path.dirname(entryPath), prefix=".tmp-")
+    try:
+        archive = subprocess.Popen(
+            ["git", "archive", "--format=tar", commit],
+            cwd=repositoryPath,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        with tarfile.open(fileobj=archive.stdout, mode="r|") as tar:
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(tmpPath, filter="data")
+            else:
+                tar.extractall(tmpPath)
+        archive.stdout.close()
+        if archive.wait() != 0:
+            raise subprocess.CalledProcessError(
+                archive.returncode, archive.args, stderr=archive.stderr.read()
+            )
+
+        for root, _, files in os.walk(tmpPath):
+            for name in files:
+                filePath = os.path.join(root, name)
+                if not os.path.islink(filePath):
+                    mode = os.stat(filePath).st_mode
+                    os.chmod(
+                        filePath, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+                    )
+
+        try:
+            os.replace(tmpPath, entryPath)
+        except OSError:
+            # another fppm process stored the tree meanwhile
+            if not os.path.isdir(entryPath):
+                raise
+    finally:
+        shutil.rmtree(tmpPath, ignore_errors=True)
+
+    return entryPath
+
+
+def link_tree(treeHash, packagePath, linkMode):
+    """
+    Materializes a stored tree at packagePath
+
+    Args:
+        treeHash (str): Key of the stored tree
+        packagePath (str): Where to link the package, must not exist
+        linkMode (str): "symlink" or "hardlink"
+    """
+
+    entryPath = tree_path(treeHash)
+    touch_tree(treeHash)
+
+    if linkMode == "symlink":
+        os.symlink(entryPath, packagePath)
+        return
+
+    def link(source, destination):
+        try:
+            os.link(source, destination)
+        except OSError:
+            # the store is on another filesystem
+            shutil.copy2(source, destination)
+
+    shutil.copytree(entryPath, packagePath, symlinks=True, copy_function=link)
+
+
+def list_trees() -> list:
+    """
+    Lists the stored trees
+
+    Returns:
+        list: (treeHash, size in bytes, last used timestamp) tuples, least
+        recently used first
+    """
+
+    storeDir = FppmCache.get_cache_dir("store")
+    trees = []
+
+    for treeHash in os.listdir(storeDir):
+        entryPath = os.path.join(storeDir, treeHash)
+        if treeHash.startswith(".") or not os.path.isdir(entryPath):
+            continue
+
+        size = 0
+        for root, _, files in os.walk(entryPath):
+            for name in files:
+                size += os.lstat(os.path.join(root, name)).st_size
+        trees.append((treeHash, size, os.stat(entryPath).st_mtime))
+
+    return sorted(trees, key=lambda tree: tree[2])
+
+
+def remove_path(path):
+    # removes a stored tree, or a package hardlinked from the store
+    def make_writable(function, path, _):
+        # stored files are read-only, which prevents their removal on Windows
+        os.chmod(path, stat.S_IWUSR | stat.S_IRUSR)
+        function(path)
+
+    shutil.rmtree(path, onerror=make_writable)
+
+
+def collect_garbage(maxBytes) -> list:
+    """
+    Evicts the least recently used trees until the store fits in maxBytes
+
+    Returns:
+        list: (treeHash, size) of the evicted trees
+    """
+
+    trees = list_trees()
+    totalSize = sum(size for _, size, _ in trees)
+    evicted = []
+
+    for treeHash, size, _ in trees:
+        if totalSize <= maxBytes:
+            break
+        remove_path(tree_path(treeHash))
+        totalSize -= size
+        evicted.append((treeHash, size))
+
+    return evicted
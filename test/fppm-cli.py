@@ -2,14 +2,46 @@
 import fppm.cli.commands.new as cmd_new
 import fppm.cli.commands.init as cmd_init
 import fppm.cli.commands.registries as cmd_registries
+import fppm.cli.commands.install as cmd_install
+import fppm.cli.commands.remove as cmd_remove
+import fppm.cli.commands.search as cmd_search
+import fppm.cli.commands.store as cmd_store
+import fppm.cli.commands.fetch as cmd_fetch
+import fppm.cli.commands.sync as cmd_sync
+import fppm.cli.commands.status as cmd_status
+import fppm.cli.index as FppmIndex
+import fppm.cli.utils as FppmUtils
+import fppm.cli.cache as FppmCache
+import fppm.cli.git as FppmGit
+import fppm.cli.journal as FppmJournal
+import fppm.cli.lock as FppmLock
+import fppm.cli.store as FppmStore
+import fppm.cli.resolver as FppmResolver
+import fppm.cli.project as FppmProject
+import fppm.cli.state as FppmState
+import fppm.cli.registry_format as RegistryFormat
 from argparse import Namespace
+from functools import partial
+from unittest.mock import patch
+import gzip
+import hashlib
+import http.server
+import io
+import json
 import os
 import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import pytest
+import yaml
 
 
 def setup_test_env():
     # make tmp directory here
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
     try:
         os.mkdir("tmp")
     except FileExistsError:
@@ -168,3 +200,1572 @@ def test_new_with_args():
         print(f"[INFO]: Test New.5 passed")
 
     teardown_test_env()
+
+
+def serve_static(directory=None):
+    # serve the static registries over HTTP on an ephemeral localhost port
+    if directory is None:
+        directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+    handler = partial(http.server.SimpleHTTPRequestHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("localhost", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://localhost:{server.server_address[1]}"
+
+
+def test_registry_cache():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+    server, baseUrl = serve_static()
+
+    try:
+        registryUrl = f"{baseUrl}/working-registry.yaml"
+        assert FppmCache.load_registry_entry(registryUrl) is None
+        print(f"[INFO]: Test Cache.1 passed")
+
+        content = cmd_registries.get_registry(registryUrl)
+        assert content != 1 and content["publisher"] == "Ali Mosallaei"
+        entry = FppmCache.load_registry_entry(registryUrl)
+        assert entry is not None and entry["last-modified"] is not None
+        print(f"[INFO]: Test Cache.2 passed")
+
+        # a 304 must be served from the cache without re-parsing
+        with patch.object(RegistryFormat, "yaml_load") as yamlLoad:
+            content, digest = cmd_registries.fetch_remote_registry(registryUrl, entry)
+            assert content == entry["content"] and digest == entry["digest"]
+            yamlLoad.assert_not_called()
+        print(f"[INFO]: Test Cache.3 passed")
+
+        # a fresh entry is served without any request
+        cmd_registries._REGISTRY_MEMO.clear()
+        with patch.object(cmd_registries.requests, "get") as get:
+            assert cmd_registries.get_registry(registryUrl) == entry["content"]
+            get.assert_not_called()
+        print(f"[INFO]: Test Cache.4 passed")
+
+        # past the freshness window, the cached copy is still served when the
+        # registry is down
+        cmd_registries._REGISTRY_MEMO.clear()
+        server.shutdown()
+        server.server_close()
+        with patch.object(FppmCache, "REGISTRY_MAX_AGE", -1), patch.object(
+            cmd_registries, "REGISTRY_BACKGROUND_REFRESH", False
+        ):
+            assert cmd_registries.get_registry(registryUrl) == entry["content"]
+        print(f"[INFO]: Test Cache.5 passed")
+    finally:
+        server.shutdown()
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_package_index():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    try:
+        with open("project.yaml", "w") as f:
+            f.write("registries:\n- ../static/working-registry.yaml\n")
+
+        package = cmd_registries.shortname_to_git("project.yaml", "mosallaei/shortname")
+        assert package["info"]["git"] == "https://github.com/mosa11aei/testing"
+        assert package["info"]["stable"] == "v1.0"
+        print(f"[INFO]: Test Index.1 passed")
+
+        package = cmd_registries.shortname_to_git(
+            "project.yaml", "mosallaei-masters/shortname3"
+        )
+        assert package["info"]["package"] == "PackageName2"
+        print(f"[INFO]: Test Index.2 passed")
+
+        assert cmd_registries.shortname_to_git("project.yaml", "mosallaei/nope") == 1
+        print(f"[INFO]: Test Index.3 passed")
+
+        # the index of the namespaces looked up is persisted and reused
+        with open(
+            FppmIndex.registry_index_path("../static/working-registry.yaml")
+        ) as f:
+            assert json.load(f)["namespaces"] == ["mosallaei", "mosallaei-masters"]
+        cmd_registries._REGISTRY_MEMO.clear()
+        FppmIndex._MERGED_INDEXES.clear()
+        with patch.object(FppmIndex, "flatten_registry", side_effect=AssertionError):
+            package = cmd_registries.shortname_to_git(
+                "project.yaml", "mosallaei/shortname"
+            )
+        assert package["info"]["stable"] == "v1.0"
+        print(f"[INFO]: Test Index.4 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_registries_compile():
+    setup_test_env()
+
+    shutil.copy("../static/working-registry.yaml", "registry.yaml")
+    assert (
+        cmd_registries.registries_compile(Namespace(compile="registry.yaml"), None) == 0
+    )
+    assert os.path.exists("registry.fppmc")
+    print(f"[INFO]: Test Compile.1 passed")
+
+    # a fresh snapshot is loaded instead of the YAML
+    with patch.object(RegistryFormat, "yaml_load") as yamlLoad:
+        content = cmd_registries.get_registry("registry.yaml")
+        yamlLoad.assert_not_called()
+    assert content["publisher"] == "Ali Mosallaei"
+    print(f"[INFO]: Test Compile.2 passed")
+
+    # a stale snapshot is ignored
+    cmd_registries._REGISTRY_MEMO.clear()
+    with open("registry.yaml", "a") as f:
+        f.write("\n# changed\n")
+    with patch.object(
+        RegistryFormat, "yaml_load", wraps=RegistryFormat.yaml_load
+    ) as yamlLoad:
+        assert cmd_registries.get_registry("registry.yaml") != 1
+        yamlLoad.assert_called_once()
+    print(f"[INFO]: Test Compile.3 passed")
+
+    teardown_test_env()
+
+
+def test_remote_compiled_registry():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+    server, baseUrl = serve_static(os.getcwd())
+
+    try:
+        shutil.copy("../static/working-registry.yaml", "registry.yaml")
+        assert (
+            cmd_registries.registries_compile(Namespace(compile="registry.yaml"), None)
+            == 0
+        )
+        registryUrl = f"{baseUrl}/registry.yaml"
+
+        # a snapshot published after the registry.yaml is loaded instead of
+        # it: the YAML is neither downloaded nor parsed
+        with patch.object(RegistryFormat, "yaml_load") as yamlLoad, patch.object(
+            RegistryFormat, "spool_chunks", wraps=RegistryFormat.spool_chunks
+        ) as spoolChunks:
+            content = cmd_registries.get_registry(registryUrl)
+            yamlLoad.assert_not_called()
+        assert spoolChunks.call_count == 1
+        assert content["publisher"] == "Ali Mosallaei"
+        assert FppmCache.load_registry_entry(registryUrl)["source"] == "compiled"
+        print(f"[INFO]: Test RemoteCompiled.1 passed")
+
+        # a snapshot older than the published registry.yaml is ignored
+        with open("registry.yaml", "r") as f:
+            registry = yaml.safe_load(f)
+        registry["publisher"] = "Someone Else"
+        with open("registry.yaml", "w") as f:
+            yaml.dump(registry, f)
+        # Last-Modified has a one second resolution
+        modifiedOn = os.path.getmtime("registry.yaml") + 10
+        os.utime("registry.yaml", (modifiedOn, modifiedOn))
+        content, _ = cmd_registries.fetch_remote_registry(
+            registryUrl, FppmCache.load_registry_entry(registryUrl)
+        )
+        assert content["publisher"] == "Someone Else"
+        assert FppmCache.load_registry_entry(registryUrl)["source"] == "yaml"
+        print(f"[INFO]: Test RemoteCompiled.2 passed")
+
+        # the snapshot is tried again once the registry changes, and used as
+        # soon as it is republished
+        registry["publisher"] = "Republished"
+        with open("registry.yaml", "w") as f:
+            yaml.dump(registry, f)
+        assert (
+            cmd_registries.registries_compile(Namespace(compile="registry.yaml"), None)
+            == 0
+        )
+        os.utime("registry.yaml", (modifiedOn + 10, modifiedOn + 10))
+        os.utime("registry.fppmc", (modifiedOn + 10, modifiedOn + 10))
+        with patch.object(RegistryFormat, "yaml_load") as yamlLoad:
+            content, _ = cmd_registries.fetch_remote_registry(
+                registryUrl, FppmCache.load_registry_entry(registryUrl)
+            )
+            yamlLoad.assert_not_called()
+        assert content["publisher"] == "Republished"
+        assert FppmCache.load_registry_entry(registryUrl)["source"] == "compiled"
+        print(f"[INFO]: Test RemoteCompiled.3 passed")
+    finally:
+        cmd_registries._REGISTRY_MEMO.clear()
+        server.shutdown()
+        server.server_close()
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_search():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    try:
+        with open("project.yaml", "w") as f:
+            f.write("registries:\n- ../static/working-registry.yaml\n")
+
+        sources = cmd_search.search_sources(Namespace(project_yaml_path="project.yaml"))
+        registries = [cmd_search.load_source(source) for source in sources]
+        searchIndex = FppmIndex.build_search_index(registries, sources)
+
+        results = FppmIndex.search_packages(searchIndex, "shortname3")
+        assert [r["shortname"] for r in results] == ["mosallaei-masters/shortname3"]
+        print(f"[INFO]: Test Search.1 passed")
+
+        # prefix match
+        results = FppmIndex.search_packages(searchIndex, "short")
+        assert len(results) == 3
+        print(f"[INFO]: Test Search.2 passed")
+
+        # fuzzy match, combined with a publisher term
+        results = FppmIndex.search_packages(searchIndex, "mosalaei shortnme2")
+        assert results[0]["shortname"] == "mosallaei-masters/shortname2"
+        print(f"[INFO]: Test Search.3 passed")
+
+        assert FppmIndex.search_packages(searchIndex, "uart") == []
+        print(f"[INFO]: Test Search.4 passed")
+
+        assert (
+            cmd_search.search_packages(
+                Namespace(query=["masters"], limit=5, project_yaml_path="project.yaml"),
+                {},
+            )
+            == 0
+        )
+        assert FppmIndex.load_search_index(sources) is not None
+        print(f"[INFO]: Test Search.5 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_offline():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+    server, baseUrl = serve_static()
+
+    try:
+        registryUrl = f"{baseUrl}/working-registry.yaml"
+        cmd_registries._REGISTRY_MEMO.clear()
+        FppmCache.set_offline(True)
+
+        assert cmd_registries.get_registry(registryUrl) == 1  # not cached
+        print(f"[INFO]: Test Offline.1 passed")
+
+        FppmCache.set_offline(False)
+        assert cmd_registries.get_registry(registryUrl) != 1
+        cmd_registries._REGISTRY_MEMO.clear()
+        server.shutdown()
+        server.server_close()
+
+        FppmCache.set_offline(True)
+        assert cmd_registries.get_registry(registryUrl)["name"] == "Mosallaei"
+        print(f"[INFO]: Test Offline.2 passed")
+
+        # nothing is cloned yet, so nothing can be installed
+        content = {
+            "registries": [registryUrl],
+            "packages": [{"name": "mosallaei/shortname", "version": "v1.0"}],
+        }
+        assert cmd_install.check_offline_project(content, {}) == 1
+        print(f"[INFO]: Test Offline.3 passed")
+    finally:
+        FppmCache.set_offline(False)
+        cmd_registries._REGISTRY_MEMO.clear()
+        server.shutdown()
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_registry_streaming():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+    server, baseUrl = serve_static()
+
+    try:
+        content = cmd_registries.get_registry(
+            "../static/working-registry.yaml", namespaces=["mosallaei-masters"]
+        )
+        assert content["publisher"] == "Ali Mosallaei"
+        assert [list(ns) for ns in content["namespaces"]] == [["mosallaei-masters"]]
+        print(f"[INFO]: Test Streaming.1 passed")
+
+        # the event-based parse builds the same namespaces as a full parse
+        with open("../static/working-registry.yaml", "rb") as f:
+            full = RegistryFormat.load_registry(f)
+        assert content == RegistryFormat.select_namespaces(full, ["mosallaei-masters"])
+        print(f"[INFO]: Test Streaming.2 passed")
+
+        registryUrl = f"{baseUrl}/working-registry.yaml"
+        with patch.object(cmd_registries, "REGISTRY_MAX_BYTES", 16):
+            assert cmd_registries.get_registry(registryUrl) == 1
+        print(f"[INFO]: Test Streaming.3 passed")
+
+        # remote registries are obtained whole, so that they are cached
+        content = cmd_registries.get_registry(registryUrl, namespaces=["mosallaei"])
+        assert [list(ns) for ns in content["namespaces"]] == [["mosallaei"]]
+        assert FppmCache.load_registry_entry(registryUrl) is not None
+        print(f"[INFO]: Test Streaming.4 passed")
+
+        # package lookups only build the namespace of the package
+        with open("project.yaml", "w") as f:
+            yaml.dump({"registries": ["../static/working-registry.yaml"]}, f)
+        cmd_registries._REGISTRY_MEMO.clear()
+        package = cmd_registries.shortname_to_git(
+            "project.yaml", "mosallaei-masters/shortname2"
+        )
+        assert package["info"]["package"] == "PackageName"
+        assert cmd_registries._REGISTRY_MEMO["../static/working-registry.yaml"][2] == {
+            "mosallaei-masters"
+        }
+        print(f"[INFO]: Test Streaming.5 passed")
+
+        # the skipped namespaces are still routed to the registry
+        assert FppmIndex.load_routes()["../static/working-registry.yaml"] == [
+            "mosallaei",
+            "mosallaei-masters",
+        ]
+        print(f"[INFO]: Test Streaming.6 passed")
+
+        # namespaces not parsed yet are added to the memoized registry
+        package = cmd_registries.shortname_to_git("project.yaml", "mosallaei/shortname")
+        assert package["info"]["stable"] == "v1.0"
+        assert cmd_registries._REGISTRY_MEMO["../static/working-registry.yaml"][2] == {
+            "mosallaei",
+            "mosallaei-masters",
+        }
+        print(f"[INFO]: Test Streaming.7 passed")
+    finally:
+        server.shutdown()
+        server.server_close()
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_compressed_registry():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+    server, baseUrl = serve_static(os.getcwd())
+
+    try:
+        with open("../static/working-registry.yaml", "rb") as f:
+            yamlData = f.read()
+        with gzip.open("registry.yaml.gz", "wb") as f:
+            f.write(yamlData)
+
+        assert cmd_registries.verify_registry("registry.yaml.gz") != 1
+        print(f"[INFO]: Test Compressed.1 passed")
+
+        content = cmd_registries.get_registry(f"{baseUrl}/registry.yaml.gz")
+        assert content != 1 and content["name"] == "Mosallaei"
+        print(f"[INFO]: Test Compressed.2 passed")
+
+        assert cmd_registries.get_registry(f"{baseUrl}/registry.yml.gz") == 1
+        print(f"[INFO]: Test Compressed.3 passed")
+
+        # snapshots of compressed registries are matched against the published file
+        assert (
+            cmd_registries.registries_compile(
+                Namespace(compile="registry.yaml.gz"), None
+            )
+            == 0
+        )
+        cmd_registries._REGISTRY_MEMO.clear()
+        with patch.object(RegistryFormat, "yaml_load") as yamlLoad:
+            assert (
+                cmd_registries.get_registry("registry.yaml.gz")["name"] == "Mosallaei"
+            )
+            yamlLoad.assert_not_called()
+        print(f"[INFO]: Test Compressed.4 passed")
+    finally:
+        server.shutdown()
+        server.server_close()
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_namespace_routing():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+    FppmIndex._ROUTES = None
+
+    try:
+        shutil.copy("../static/working-registry.yaml", "other-registry.yaml")
+        with open("project.yaml", "w") as f:
+            f.write(
+                "registries:\n- ../static/working-registry.yaml\n- other-registry.yaml\n"
+            )
+
+        # unknown registries are always candidates
+        assert FppmIndex.route_namespace("mosallaei", ["a.yaml", "b.yaml"]) == [
+            "a.yaml",
+            "b.yaml",
+        ]
+        print(f"[INFO]: Test Routing.1 passed")
+
+        # pinned: no ambiguity between the two registries
+        package = cmd_registries.shortname_to_git(
+            "project.yaml", "mosallaei/shortname", "other-registry.yaml"
+        )
+        assert package["registry"] == "other-registry.yaml"
+        print(f"[INFO]: Test Routing.2 passed")
+
+        FppmIndex.update_namespace_routes("other-registry.yaml", {"elsewhere"})
+        assert FppmIndex.route_namespace(
+            "mosallaei", ["../static/working-registry.yaml", "other-registry.yaml"]
+        ) == ["../static/working-registry.yaml"]
+        print(f"[INFO]: Test Routing.3 passed")
+
+        # only the routed registry is fetched
+        with patch.object(
+            cmd_registries, "get_registries", wraps=cmd_registries.get_registries
+        ) as getRegistries:
+            package = cmd_registries.shortname_to_git(
+                "project.yaml", "mosallaei/shortname"
+            )
+            assert getRegistries.call_args[0][0] == ["../static/working-registry.yaml"]
+        assert package["registry"] == "../static/working-registry.yaml"
+        print(f"[INFO]: Test Routing.4 passed")
+
+        # a single lookup routes every registry it reads
+        with open("other-registry.yaml", "w") as f:
+            f.write("namespaces:\n- elsewhere:\n  - thing:\n    - git: x\n")
+        os.remove(FppmIndex.routes_path())
+        FppmIndex._ROUTES = None
+        cmd_registries._REGISTRY_MEMO.clear()
+        package = cmd_registries.shortname_to_git("project.yaml", "mosallaei/shortname")
+        assert package["registry"] == "../static/working-registry.yaml"
+        with open(FppmIndex.routes_path(), "r") as f:
+            assert json.load(f) == {
+                "../static/working-registry.yaml": ["mosallaei", "mosallaei-masters"],
+                "other-registry.yaml": ["elsewhere"],
+            }
+        cmd_registries._REGISTRY_MEMO.clear()
+        with patch.object(
+            cmd_registries, "get_registries", wraps=cmd_registries.get_registries
+        ) as getRegistries:
+            package = cmd_registries.shortname_to_git("project.yaml", "elsewhere/thing")
+            assert getRegistries.call_args[0][0] == ["other-registry.yaml"]
+        assert package["info"]["git"] == "x"
+        print(f"[INFO]: Test Routing.5 passed")
+    finally:
+        FppmIndex._ROUTES = None
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_registry_deadline():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+    release = threading.Event()
+
+    try:
+        # results follow the declared order, not the completion order
+        delays = {"first": 0.3, "second": 0.1, "third": 0}
+        assert cmd_registries.get_registries(
+            list(delays), lambda url: release.wait(delays[url]) or url
+        ) == ["first", "second", "third"]
+        print(f"[INFO]: Test Deadline.1 passed")
+
+        # so are the candidates of the merged package index
+        shutil.copy("../static/working-registry.yaml", "first.yaml")
+        shutil.copy("../static/working-registry.yaml", "second.yaml")
+        getRegistry = cmd_registries.get_registry
+
+        def slow_first(registry_url, namespaces=None):
+            if registry_url == "first.yaml":
+                release.wait(0.3)
+            return getRegistry(registry_url, namespaces)
+
+        with patch.object(cmd_registries, "get_registry", side_effect=slow_first):
+            packageIndex = cmd_registries.get_package_index(
+                ["first.yaml", "second.yaml"]
+            )
+        assert [
+            candidate["registry"] for candidate in packageIndex["mosallaei/shortname"]
+        ] == ["first.yaml", "second.yaml"]
+        print(f"[INFO]: Test Deadline.2 passed")
+
+        # a registry that does not answer in time fails without holding up
+        # the others, nor the exit of fppm while its fetch is still blocked
+        script = "\n".join(
+            [
+                "import threading",
+                "import fppm.cli.commands.registries as cmd_registries",
+                "cmd_registries.REGISTRY_TIMEOUT = 0.2",
+                "blocked = threading.Event()",
+                "print(cmd_registries.get_registries(",
+                "    ['slow', 'fast'],",
+                "    lambda url: blocked.wait() if url == 'slow' else url,",
+                "))",
+            ]
+        )
+        startedOn = time.monotonic()
+        result = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, timeout=30
+        )
+        assert result.stdout.splitlines()[-1] == "[1, 'fast']"
+        assert time.monotonic() - startedOn < 10
+        print(f"[INFO]: Test Deadline.3 passed")
+    finally:
+        release.set()
+        cmd_registries._REGISTRY_MEMO.clear()
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def make_package_repo(path, versions):
+    # local git repo with one tagged commit per version
+    os.makedirs(path)
+    for args in (
+        ["init", "-q"],
+        ["config", "user.email", "t@t"],
+        ["config", "user.name", "t"],
+    ):
+        subprocess.check_call(["git", *args], cwd=path)
+    for version in versions:
+        with open(os.path.join(path, "CMakeLists.txt"), "w") as f:
+            f.write(f"# {version}\n")
+        subprocess.check_call(["git", "add", "-A"], cwd=path)
+        subprocess.check_call(["git", "commit", "-q", "-m", version], cwd=path)
+        subprocess.check_call(["git", "tag", version], cwd=path)
+    return os.path.abspath(path)
+
+
+def setup_install_project(packageCount):
+    # project.yaml with a local registry listing packageCount local packages
+    registry = {
+        "name": "Local",
+        "publisher": "Tester",
+        "description": "Local test registry",
+        "updated-on": "01 JAN 2024",
+        "namespaces": [
+            {
+                "local": [
+                    {
+                        f"pkg{i}": {
+                            "git": make_package_repo(f"repos/pkg{i}", ["v1.0", "v1.1"]),
+                            "stable": "v1.0",
+                        }
+                    }
+                    for i in range(packageCount)
+                ]
+            }
+        ],
+    }
+    with open("registry.yaml", "w") as f:
+        yaml.dump(registry, f)
+    with open("project.yaml", "w") as f:
+        yaml.dump(
+            {
+                "registries": ["registry.yaml"],
+                "packages": [
+                    {"name": f"local/pkg{i}", "version": "v1.0"}
+                    for i in range(packageCount)
+                ],
+            },
+            f,
+        )
+    with open("project.cmake", "w") as f:
+        f.write("")
+    # registries, mirrors and dependencies are memoized per invocation, and
+    # tests reuse the same paths
+    cmd_registries._REGISTRY_MEMO.clear()
+    FppmGit._UPDATED_MIRRORS.clear()
+    FppmResolver._DEPENDENCIES.clear()
+    FppmResolver._TAGS.clear()
+
+
+def install_local_package(version, package="local/pkg0", **options):
+    # installs a package of the project, options are the other arguments of
+    # `fppm install` (fetch_strategy, link_mode...)
+    with patch.object(FppmUtils, "prompt", return_value="n"):
+        return cmd_install.install_package(
+            Namespace(
+                package=package,
+                version=version,
+                project=False,
+                project_yaml_path="project.yaml",
+                **options,
+            ),
+            {},
+        )
+
+
+def install_project_packages(frozen=False):
+    # installs the packages of project.yaml
+    with patch.object(FppmUtils, "prompt", return_value="n"):
+        return cmd_install.install_package(
+            Namespace(
+                package=None,
+                version=None,
+                project=True,
+                project_yaml_path="project.yaml",
+                frozen=frozen,
+            ),
+            {},
+        )
+
+
+def test_install_project():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    try:
+        setup_install_project(3)
+
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            assert (
+                cmd_install.install_package(
+                    Namespace(
+                        package=None,
+                        version=None,
+                        project=True,
+                        project_yaml_path="project.yaml",
+                        jobs=3,
+                    ),
+                    {},
+                )
+                == 0
+            )
+        for i in range(3):
+            assert os.path.exists(f"_fprime_packages/local.pkg{i}/CMakeLists.txt")
+        with open("_fprime_packages/CMakeLists.txt", "r") as f:
+            assert f.read().count("add_fprime_subdirectory") == 3
+        print(f"[INFO]: Test Install.1 passed")
+
+        # change the version of one package
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            assert (
+                cmd_install.install_package(
+                    Namespace(
+                        package="local/pkg1",
+                        version="v1.1",
+                        project=False,
+                        project_yaml_path="project.yaml",
+                    ),
+                    {},
+                )
+                == 0
+            )
+        with open("_fprime_packages/local.pkg1/CMakeLists.txt", "r") as f:
+            assert f.read() == "# v1.1\n"
+        with open("project.yaml", "r") as f:
+            assert {"name": "local/pkg1", "version": "v1.1"} in yaml.safe_load(f)[
+                "packages"
+            ]
+        print(f"[INFO]: Test Install.2 passed")
+
+        # unlocked packages only fetch the registries routed to their namespace
+        shutil.copy("../static/working-registry.yaml", "other-registry.yaml")
+        with open("project.yaml", "r") as f:
+            projectYaml = yaml.safe_load(f)
+        projectYaml["registries"].append("other-registry.yaml")
+        with open("project.yaml", "w") as f:
+            yaml.dump(projectYaml, f)
+        os.remove(FppmLock.lock_path("project.yaml"))
+        FppmIndex._ROUTES = None
+        FppmIndex.update_namespace_routes("other-registry.yaml", {"mosallaei"})
+        cmd_registries._REGISTRY_MEMO.clear()
+        with patch.object(
+            cmd_registries, "get_registries", wraps=cmd_registries.get_registries
+        ) as getRegistries:
+            assert install_project_packages() == 0
+        assert {
+            registry
+            for call in getRegistries.call_args_list
+            for registry in call.args[0]
+        } == {"registry.yaml"}
+        assert cmd_registries._REGISTRY_MEMO["registry.yaml"][2] == {"local"}
+        print(f"[INFO]: Test Install.3 passed")
+    finally:
+        FppmIndex._ROUTES = None
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_git_store():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    installArgs = Namespace(
+        package=None, version=None, project=True, project_yaml_path="project.yaml"
+    )
+
+    try:
+        setup_install_project(1)
+        gitUrl = os.path.abspath("repos/pkg0")
+
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            assert cmd_install.install_package(installArgs, {}) == 0
+        assert os.path.isdir(FppmGit.mirror_path(gitUrl))
+        with open("_fprime_packages/local.pkg0/.git/objects/info/alternates") as f:
+            assert f.read().strip().startswith(FppmGit.mirror_path(gitUrl))
+        remote = subprocess.check_output(
+            ["git", "remote", "get-url", "origin"],
+            cwd="_fprime_packages/local.pkg0",
+            text=True,
+        )
+        assert remote.strip() == gitUrl
+        print(f"[INFO]: Test GitStore.1 passed")
+
+        # a fresh install of the same package is served by the mirror offline
+        shutil.rmtree("_fprime_packages")
+        FppmCache.set_offline(True)
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            assert cmd_install.install_package(installArgs, {}) == 0
+        with open("_fprime_packages/local.pkg0/CMakeLists.txt", "r") as f:
+            assert f.read() == "# v1.0\n"
+        print(f"[INFO]: Test GitStore.2 passed")
+    finally:
+        FppmCache.set_offline(False)
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_fetch_strategy():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    def history_length():
+        return subprocess.check_output(
+            ["git", "rev-list", "--count", "HEAD"],
+            cwd="_fprime_packages/local.pkg0",
+            text=True,
+        ).strip()
+
+    try:
+        setup_install_project(1)
+        firstCommit = subprocess.check_output(
+            ["git", "rev-parse", "v1.0^{commit}"], cwd="repos/pkg0", text=True
+        ).strip()
+
+        assert install_local_package("v1.1", fetch_strategy="shallow") == 0
+        assert history_length() == "1"
+        with open("_fprime_packages/local.pkg0/CMakeLists.txt", "r") as f:
+            assert f.read() == "# v1.1\n"
+        print(f"[INFO]: Test FetchStrategy.1 passed")
+
+        shutil.rmtree("_fprime_packages")
+        assert install_local_package(firstCommit, fetch_strategy="shallow") == 0
+        assert history_length() == "1"
+        print(f"[INFO]: Test FetchStrategy.2 passed")
+
+        # abbreviated hashes cannot be fetched directly, a full clone is made
+        shutil.rmtree("_fprime_packages")
+        assert install_local_package(firstCommit[:10], fetch_strategy="shallow") == 0
+        with open("_fprime_packages/local.pkg0/CMakeLists.txt", "r") as f:
+            assert f.read() == "# v1.0\n"
+        print(f"[INFO]: Test FetchStrategy.3 passed")
+
+        shutil.rmtree("_fprime_packages")
+        assert install_local_package("v1.1", fetch_strategy="partial") == 0
+        with open("_fprime_packages/local.pkg0/CMakeLists.txt", "r") as f:
+            assert f.read() == "# v1.1\n"
+        print(f"[INFO]: Test FetchStrategy.4 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_version_change():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    try:
+        setup_install_project(1)
+        assert install_local_package("v1.0") == 0
+
+        # tags present locally are checked out without reaching the remote
+        os.rename("repos/pkg0", "repos/pkg0.offline")
+        assert install_local_package("v1.1") == 0
+        with open("_fprime_packages/local.pkg0/CMakeLists.txt", "r") as f:
+            assert f.read() == "# v1.1\n"
+        print(f"[INFO]: Test VersionChange.1 passed")
+
+        # nothing to do when the package is already at the version
+        with patch.object(FppmGit, "run_git", wraps=FppmGit.run_git) as runGit:
+            assert install_local_package("v1.1") == 0
+        gitCommands = [call.args[0] for call in runGit.call_args_list]
+        assert {"fetch", "checkout", "stash"}.isdisjoint(
+            command[0] for command in gitCommands
+        )
+        # HEAD is resolved once, for the comparison and for project.lock
+        assert sum("HEAD^{commit}" in command for command in gitCommands) == 1
+        print(f"[INFO]: Test VersionChange.2 passed")
+
+        # new versions are fetched, and local changes are stashed
+        os.rename("repos/pkg0.offline", "repos/pkg0")
+        with open("repos/pkg0/CMakeLists.txt", "w") as f:
+            f.write("# v1.2\n")
+        subprocess.check_call(["git", "commit", "-qam", "v1.2"], cwd="repos/pkg0")
+        subprocess.check_call(["git", "tag", "v1.2"], cwd="repos/pkg0")
+        with open("_fprime_packages/local.pkg0/CMakeLists.txt", "w") as f:
+            f.write("# local change\n")
+        # mirrors are refreshed once per invocation, start a new one
+        FppmGit._UPDATED_MIRRORS.clear()
+        assert install_local_package("v1.2") == 0
+        with open("_fprime_packages/local.pkg0/CMakeLists.txt", "r") as f:
+            assert f.read() == "# v1.2\n"
+        print(f"[INFO]: Test VersionChange.3 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_lockfile():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    try:
+        setup_install_project(2)
+        lockedCommit = subprocess.check_output(
+            ["git", "rev-parse", "v1.0^{commit}"], cwd="repos/pkg0", text=True
+        ).strip()
+
+        assert install_project_packages() == 0
+        lockEntries = FppmLock.load_lock("project.yaml")
+        assert sorted(lockEntries) == ["local/pkg0", "local/pkg1"]
+        assert lockEntries["local/pkg0"]["commit"] == lockedCommit
+        assert lockEntries["local/pkg0"]["git"] == os.path.abspath("repos/pkg0")
+        assert lockEntries["local/pkg0"]["registry"] == "registry.yaml"
+        print(f"[INFO]: Test Lockfile.1 passed")
+
+        # locked packages ignore moved tags and never read the registries
+        with open("repos/pkg0/CMakeLists.txt", "w") as f:
+            f.write("# moved\n")
+        subprocess.check_call(["git", "commit", "-qam", "moved"], cwd="repos/pkg0")
+        subprocess.check_call(["git", "tag", "-f", "v1.0"], cwd="repos/pkg0")
+        shutil.rmtree("_fprime_packages")
+        with patch.object(
+            cmd_registries, "get_package_index", side_effect=AssertionError
+        ):
+            assert install_project_packages(frozen=True) == 0
+        with open("_fprime_packages/local.pkg0/CMakeLists.txt", "r") as f:
+            assert f.read() == "# v1.0\n"
+        print(f"[INFO]: Test Lockfile.2 passed")
+
+        # --frozen refuses a project.yaml that disagrees with the lock
+        with open("project.yaml", "r") as f:
+            projectYaml = yaml.safe_load(f)
+        projectYaml["packages"][1]["version"] = "v1.1"
+        with open("project.yaml", "w") as f:
+            yaml.dump(projectYaml, f)
+        assert install_project_packages(frozen=True) == 1
+        assert FppmLock.load_lock("project.yaml")["local/pkg1"]["version"] == "v1.0"
+        assert install_project_packages() == 0
+        assert FppmLock.load_lock("project.yaml")["local/pkg1"]["version"] == "v1.1"
+        print(f"[INFO]: Test Lockfile.3 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_package_store():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    try:
+        setup_install_project(1)
+        treeHash = subprocess.check_output(
+            ["git", "rev-parse", "v1.0^{tree}"], cwd="repos/pkg0", text=True
+        ).strip()
+
+        assert install_local_package("v1.0", link_mode="symlink") == 0
+        assert os.path.islink("_fprime_packages/local.pkg0")
+        assert os.path.realpath("_fprime_packages/local.pkg0") == os.path.realpath(
+            FppmStore.tree_path(treeHash)
+        )
+        assert FppmLock.load_lock("project.yaml")["local/pkg0"]["tree"] == treeHash
+        print(f"[INFO]: Test PackageStore.1 passed")
+
+        assert install_local_package("v1.1", link_mode="hardlink") == 0
+        packageFile = "_fprime_packages/local.pkg0/CMakeLists.txt"
+        assert not os.path.islink("_fprime_packages/local.pkg0")
+        assert os.stat(packageFile).st_nlink == 2
+        with open(packageFile, "r") as f:
+            assert f.read() == "# v1.1\n"
+        print(f"[INFO]: Test PackageStore.2 passed")
+
+        # a clone replaces a linked package
+        assert install_local_package("v1.0", link_mode="clone") == 0
+        assert os.path.isdir("_fprime_packages/local.pkg0/.git")
+        print(f"[INFO]: Test PackageStore.3 passed")
+
+        # gc evicts the least recently used tree first
+        assert len(FppmStore.list_trees()) == 2
+        os.utime(FppmStore.tree_path(treeHash), (0, 0))
+        assert (
+            cmd_store.store_entrypoint(Namespace(action="gc", max_size="10"), {}) == 0
+        )
+        assert not FppmStore.has_tree(treeHash)
+        assert len(FppmStore.list_trees()) == 1
+        print(f"[INFO]: Test PackageStore.4 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_archive_install():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+    os.makedirs("archives")
+    server, baseUrl = serve_static(os.path.abspath("archives"))
+
+    try:
+        setup_install_project(1)
+        with open("registry.yaml", "r") as f:
+            registry = yaml.safe_load(f)
+        registry["namespaces"][0]["local"][0]["pkg0"][
+            "archive"
+        ] = f"{baseUrl}/pkg0-{{version}}.tar.gz"
+        with open("registry.yaml", "w") as f:
+            yaml.dump(registry, f)
+        cmd_registries._REGISTRY_MEMO.clear()
+        subprocess.check_call(
+            [
+                "git",
+                "archive",
+                "--format=tar.gz",
+                "--prefix=pkg0-v1.1/",
+                "-o",
+                os.path.abspath("archives/pkg0-v1.1.tar.gz"),
+                "v1.1",
+            ],
+            cwd="repos/pkg0",
+        )
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "v1.1^{commit}"], cwd="repos/pkg0", text=True
+        ).strip()
+
+        assert install_local_package("v1.1") == 0
+        assert not os.path.exists("_fprime_packages/local.pkg0/.git")
+        with open("_fprime_packages/local.pkg0/CMakeLists.txt", "r") as f:
+            assert f.read() == "# v1.1\n"
+        lockEntry = FppmLock.load_lock("project.yaml")["local/pkg0"]
+        assert lockEntry["commit"] == commit
+        assert lockEntry["archive"] == f"{baseUrl}/pkg0-v1.1.tar.gz"
+        with open("archives/pkg0-v1.1.tar.gz", "rb") as f:
+            assert lockEntry["archive-sha256"] == hashlib.sha256(f.read()).hexdigest()
+        print(f"[INFO]: Test Archive.1 passed")
+
+        # no archive for v1.0, the package is cloned instead
+        assert install_local_package("v1.0") == 0
+        assert os.path.isdir("_fprime_packages/local.pkg0/.git")
+        with open("_fprime_packages/local.pkg0/CMakeLists.txt", "r") as f:
+            assert f.read() == "# v1.0\n"
+        print(f"[INFO]: Test Archive.2 passed")
+    finally:
+        server.shutdown()
+        server.server_close()
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def add_package_dependencies(path, version, dependencies):
+    # tag a new version of a package repo declaring dependencies in package.yaml
+    with open(os.path.join(path, "package.yaml"), "w") as f:
+        yaml.dump({"dependencies": dependencies}, f)
+    subprocess.check_call(["git", "add", "-A"], cwd=path)
+    subprocess.check_call(["git", "commit", "-q", "-m", version], cwd=path)
+    subprocess.check_call(["git", "tag", version], cwd=path)
+
+
+def test_dependencies():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    try:
+        setup_install_project(3)
+        add_package_dependencies(
+            "repos/pkg0", "v1.2", [{"name": "local/pkg1", "version": ">=v1.0"}]
+        )
+        add_package_dependencies(
+            "repos/pkg1", "v1.2", [{"name": "local/pkg2", "version": "v1.0"}]
+        )
+        with open("project.yaml", "w") as f:
+            yaml.dump(
+                {
+                    "registries": ["registry.yaml"],
+                    "packages": [{"name": "local/pkg0", "version": "v1.2"}],
+                },
+                f,
+            )
+
+        assert install_project_packages() == 0
+        lockEntries = FppmLock.load_lock("project.yaml")
+        assert lockEntries["local/pkg1"]["version"] == "v1.2"
+        assert lockEntries["local/pkg1"]["required-by"] == ["local/pkg0"]
+        assert lockEntries["local/pkg2"]["version"] == "v1.0"
+        assert lockEntries["local/pkg2"]["required-by"] == ["local/pkg1"]
+        with open("project.yaml", "r") as f:
+            assert len(yaml.safe_load(f)["packages"]) == 1
+        with open("_fprime_packages/CMakeLists.txt", "r") as f:
+            assert f.read().count("add_fprime_subdirectory") == 3
+        print(f"[INFO]: Test Dependencies.1 passed")
+
+        # locked dependencies are installed without resolving them again
+        shutil.rmtree("_fprime_packages")
+        with patch.object(
+            cmd_registries, "get_package_index", side_effect=AssertionError
+        ):
+            assert install_project_packages(frozen=True) == 0
+        with open("_fprime_packages/local.pkg1/package.yaml", "r") as f:
+            assert "local/pkg2" in f.read()
+        assert os.path.isdir("_fprime_packages/local.pkg2")
+        print(f"[INFO]: Test Dependencies.2 passed")
+
+        # locked dependencies no longer required are not installed
+        lockEntries = FppmLock.load_lock("project.yaml")
+        lockEntries["local/pkg2"]["required-by"] = ["local/other"]
+        FppmLock.store_lock("project.yaml", lockEntries)
+        shutil.rmtree("_fprime_packages")
+        assert install_project_packages() == 0
+        assert not os.path.exists("_fprime_packages/local.pkg2")
+        assert "local/pkg2" not in FppmLock.load_lock("project.yaml")
+        with open("_fprime_packages/CMakeLists.txt", "r") as f:
+            assert f.read().count("add_fprime_subdirectory") == 2
+        print(f"[INFO]: Test Dependencies.3 passed")
+
+        # project versions conflicting with a dependency are reported
+        with open("project.yaml", "r") as f:
+            projectYaml = yaml.safe_load(f)
+        projectYaml["packages"].append({"name": "local/pkg2", "version": "v1.1"})
+        with open("project.yaml", "w") as f:
+            yaml.dump(projectYaml, f)
+        assert install_project_packages() == 1
+        print(f"[INFO]: Test Dependencies.4 passed")
+
+        # without the git store, dependencies are resolved without mirroring
+        # the package repositories
+        projectYaml["packages"].pop()
+        with open("project.yaml", "w") as f:
+            yaml.dump(projectYaml, f)
+        os.remove(FppmLock.lock_path("project.yaml"))
+        shutil.rmtree("_fprime_packages")
+        shutil.rmtree("cache")
+        FppmResolver._DEPENDENCIES.clear()
+        FppmResolver._TAGS.clear()
+        with patch.object(FppmGit, "GIT_STORE_ENABLED", False), patch.object(
+            FppmGit, "FETCH_STRATEGY", "shallow"
+        ), patch.object(FppmGit, "update_mirror", side_effect=AssertionError):
+            assert install_project_packages() == 0
+        assert FppmLock.load_lock("project.yaml")["local/pkg2"]["version"] == "v1.0"
+        assert os.path.isdir("_fprime_packages/local.pkg2")
+        print(f"[INFO]: Test Dependencies.5 passed")
+
+        # removing a package removes the dependencies nothing else requires
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            cmd_remove.remove_package(
+                Namespace(package="local/pkg0", project_yaml_path="project.yaml"), {}
+            )
+        for folder in ("local.pkg0", "local.pkg1", "local.pkg2"):
+            assert not os.path.exists(f"_fprime_packages/{folder}")
+        assert FppmLock.load_lock("project.yaml") == {}
+        assert FppmState.load_state() == {}
+        with open("_fprime_packages/CMakeLists.txt", "r") as f:
+            assert "add_fprime_subdirectory" not in f.read()
+        print(f"[INFO]: Test Dependencies.6 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_project_session():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    installArgs = Namespace(
+        package=None, version=None, project=True, project_yaml_path="project.yaml"
+    )
+
+    try:
+        setup_install_project(2)
+        with patch.object(FppmUtils, "prompt", return_value="y"):
+            assert cmd_install.install_package(installArgs, {}) == 0
+        with open("project.cmake", "r") as f:
+            assert f.read() == FppmProject.PACKAGES_CMAKE_LINE
+        print(f"[INFO]: Test ProjectSession.1 passed")
+
+        # nothing changed: no project file is rewritten
+        with patch.object(
+            FppmCache, "write_atomic", wraps=FppmCache.write_atomic
+        ) as writeAtomic:
+            with patch.object(FppmUtils, "prompt", return_value="y"):
+                assert cmd_install.install_package(installArgs, {}) == 0
+        writtenPaths = [
+            os.path.basename(call.args[0]) for call in writeAtomic.call_args_list
+        ]
+        for projectFile in ("project.yaml", "project.lock", "CMakeLists.txt"):
+            assert projectFile not in writtenPaths
+        print(f"[INFO]: Test ProjectSession.2 passed")
+
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            cmd_remove.remove_package(
+                Namespace(package="local/pkg1", project_yaml_path="project.yaml"), {}
+            )
+        with open("_fprime_packages/CMakeLists.txt", "r") as f:
+            assert f.read() == FppmProject.package_cmake_line("local.pkg0")
+        assert sorted(FppmLock.load_lock("project.yaml")) == ["local/pkg0"]
+        print(f"[INFO]: Test ProjectSession.3 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_atomic_install():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    installArgs = Namespace(
+        package=None,
+        version=None,
+        project=True,
+        project_yaml_path="project.yaml",
+        link_mode="symlink",
+    )
+    cloneArgs = Namespace(
+        package="local/pkg0",
+        version="v1.0",
+        project=False,
+        project_yaml_path="project.yaml",
+        link_mode="clone",
+    )
+
+    def interrupted_clone(remoteUrl, packagePath, revision=None, strategy=None):
+        os.makedirs(os.path.join(packagePath, ".git"))
+        raise KeyboardInterrupt()
+
+    try:
+        setup_install_project(2)
+
+        # an interrupted clone leaves nothing behind
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            with patch.object(FppmGit, "clone_package", side_effect=interrupted_clone):
+                try:
+                    cmd_install.install_package(cloneArgs, {})
+                except KeyboardInterrupt:
+                    pass
+            assert not os.path.lexists("_fprime_packages/local.pkg0")
+            assert cmd_install.install_package(cloneArgs, {}) == 0
+        assert not any(
+            name.startswith(".tmp-") for name in os.listdir("_fprime_packages")
+        )
+        assert os.path.isdir("_fprime_packages/local.pkg0/.git")
+        print(f"[INFO]: Test AtomicInstall.1 passed")
+
+        # a failed batch keeps the journal, and resuming it does not fetch the
+        # packages already installed again
+        linkTree = FppmStore.link_tree
+
+        def interrupted_link(treeHash, packagePath, linkMode):
+            if packagePath.endswith("local.pkg1"):
+                raise OSError("interrupted")
+            linkTree(treeHash, packagePath, linkMode)
+
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            with patch.object(FppmStore, "link_tree", side_effect=interrupted_link):
+                assert cmd_install.install_package(installArgs, {}) == 1
+            assert os.path.islink("_fprime_packages/local.pkg0")
+            assert not os.path.lexists("_fprime_packages/local.pkg1")
+            assert os.path.exists(FppmJournal.JOURNAL_PATH)
+
+            with patch.object(
+                FppmStore, "link_tree", wraps=FppmStore.link_tree
+            ) as linkTreeMock:
+                assert cmd_install.install_package(installArgs, {}) == 0
+        assert [
+            call.args[1].endswith("local.pkg1") for call in linkTreeMock.call_args_list
+        ] == [True]
+        assert not os.path.exists(FppmJournal.JOURNAL_PATH)
+        assert sorted(FppmLock.load_lock("project.yaml")) == [
+            "local/pkg0",
+            "local/pkg1",
+        ]
+        print(f"[INFO]: Test AtomicInstall.2 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_monorepo_install():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    try:
+        setup_install_project(0)
+
+        # one repository holding two packages
+        monorepo = make_package_repo("repos/mono", [])
+        for subdirectory in ("PackageA", "PackageB"):
+            os.makedirs(os.path.join(monorepo, subdirectory))
+            with open(os.path.join(monorepo, subdirectory, "CMakeLists.txt"), "w") as f:
+                f.write(f"# {subdirectory}\n")
+        add_package_dependencies(monorepo, "v1.0", [])
+        with open("registry.yaml", "w") as f:
+            yaml.dump(
+                {
+                    "name": "Local",
+                    "publisher": "Tester",
+                    "description": "Local test registry",
+                    "updated-on": "01 JAN 2024",
+                    "namespaces": [
+                        {
+                            "local": [
+                                {
+                                    "a": [
+                                        {"git": monorepo},
+                                        {"package": "PackageA"},
+                                        {"stable": "v1.0"},
+                                    ]
+                                },
+                                {
+                                    "b": [
+                                        {"git": monorepo},
+                                        {"package": "PackageB"},
+                                        {"stable": "v1.0"},
+                                    ]
+                                },
+                            ]
+                        }
+                    ],
+                },
+                f,
+            )
+
+        assert install_local_package(None, package="local/a", link_mode="clone") == 0
+        assert os.path.isfile("_fprime_packages/local.a/PackageA/CMakeLists.txt")
+        assert not os.path.exists("_fprime_packages/local.a/PackageB")
+        # the clone borrows the objects of the mirror of the repository
+        with open("_fprime_packages/local.a/.git/objects/info/alternates") as f:
+            assert os.path.dirname(f.read().strip()) == FppmGit.mirror_path(monorepo)
+        lockEntry = FppmLock.load_lock("project.yaml")["local/a"]
+        assert lockEntry["package"] == "PackageA"
+        assert lockEntry["tree"] == FppmGit.tree_hash(monorepo, "v1.0", "PackageA")
+        print(f"[INFO]: Test MonorepoInstall.1 passed")
+
+        assert install_local_package(None, package="local/b", link_mode="symlink") == 0
+        assert os.path.realpath(
+            "_fprime_packages/local.b/PackageB"
+        ) == os.path.realpath(
+            FppmStore.tree_path(FppmGit.tree_hash(monorepo, "v1.0", "PackageB"))
+        )
+        with open("_fprime_packages/CMakeLists.txt", "r") as f:
+            assert f.read() == FppmProject.package_cmake_line(
+                "local.a/PackageA"
+            ) + FppmProject.package_cmake_line("local.b/PackageB")
+        print(f"[INFO]: Test MonorepoInstall.2 passed")
+
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            cmd_remove.remove_package(
+                Namespace(package="local/a", project_yaml_path="project.yaml"), {}
+            )
+        with open("_fprime_packages/CMakeLists.txt", "r") as f:
+            assert f.read() == FppmProject.package_cmake_line("local.b/PackageB")
+        print(f"[INFO]: Test MonorepoInstall.3 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_git_backend():
+    pytest.importorskip("dulwich")
+    setup_test_env()
+    # the test directory is inside the fppm repository
+    outsidePath = tempfile.mkdtemp()
+
+    try:
+        repositoryPath = make_package_repo("repos/pkg0", ["v1.0", "v1.1"])
+        add_package_dependencies(repositoryPath, "v1.2", ["local/pkg1"])
+
+        results = {}
+        for backendName in FppmGit.GIT_BACKENDS:
+            FppmGit.set_git_backend(backendName)
+            backend = FppmGit.backend()
+            assert backend.name == backendName
+
+            os.makedirs(f"new/{backendName}")
+            backend.init(f"new/{backendName}")
+            backend.add_remote(f"new/{backendName}", "origin", repositoryPath)
+            results[backendName] = (
+                backend.resolve_revision(repositoryPath, "tags/v1.1"),
+                backend.resolve_revision(repositoryPath, "tags/v9.9"),
+                backend.tree_hash(repositoryPath, "tags/v1.0"),
+                backend.list_tags(repositoryPath),
+                backend.read_file(repositoryPath, "tags/v1.2", "package.yaml"),
+                backend.read_file(repositoryPath, "tags/v1.0", "package.yaml"),
+                len(backend.ls_remote(repositoryPath)),
+                backend.is_repository(f"new/{backendName}"),
+                backend.is_repository(outsidePath),
+                subprocess.check_output(
+                    ["git", "remote", "get-url", "origin"],
+                    cwd=f"new/{backendName}",
+                    text=True,
+                ).strip(),
+            )
+
+        assert results["subprocess"] == results["dulwich"]
+        assert results["dulwich"][1] is None
+        assert results["dulwich"][3] == ["v1.0", "v1.1", "v1.2"]
+        assert results["dulwich"][5] is None
+        assert results["dulwich"][7:] == (True, False, repositoryPath)
+        print(f"[INFO]: Test GitBackend.1 passed")
+
+        # local changes are stashed before checking out another version
+        results = {}
+        for backendName in FppmGit.GIT_BACKENDS:
+            FppmGit.set_git_backend(backendName)
+            backend = FppmGit.backend()
+            clonePath = f"clones/{backendName}"
+            FppmGit.clone_package(repositoryPath, clonePath)
+
+            with open(f"{clonePath}/CMakeLists.txt", "w") as f:
+                f.write("# changed\n")
+            changed = backend.has_local_changes(clonePath)
+            backend.stash(clonePath)
+            stashed = not backend.has_local_changes(clonePath)
+            backend.checkout(clonePath, "tags/v1.0")
+            with open(f"{clonePath}/CMakeLists.txt", "r") as f:
+                results[backendName] = (
+                    changed,
+                    stashed,
+                    backend.resolve_revision(clonePath, "HEAD"),
+                    f.read(),
+                    backend.has_local_changes(clonePath),
+                )
+
+        assert results["subprocess"] == results["dulwich"]
+        assert results["dulwich"] == (
+            True,
+            True,
+            FppmGit.resolve_revision(repositoryPath, "tags/v1.0"),
+            "# v1.0\n",
+            False,
+        )
+        print(f"[INFO]: Test GitBackend.2 passed")
+
+        # sparse clones are checked out by git
+        FppmGit.clone_package(repositoryPath, "clones/sparse", subdirectory="src")
+        with patch.object(
+            FppmGit.backend().porcelain, "checkout", side_effect=AssertionError
+        ):
+            FppmGit.backend().checkout("clones/sparse", "tags/v1.0")
+        assert FppmGit.resolve_revision(
+            "clones/sparse", "HEAD"
+        ) == FppmGit.resolve_revision(repositoryPath, "tags/v1.0")
+        print(f"[INFO]: Test GitBackend.3 passed")
+    finally:
+        shutil.rmtree(outsidePath, ignore_errors=True)
+        FppmGit.set_git_backend("subprocess")
+        teardown_test_env()
+
+
+def test_fetch():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    try:
+        setup_install_project(2)
+        with open("project.yaml", "r") as f:
+            projectYaml = f.read()
+
+        assert (
+            cmd_fetch.fetch_project(
+                Namespace(
+                    project_yaml_path="project.yaml", link_mode="symlink", jobs=2
+                ),
+                {},
+            )
+            == 0
+        )
+        # the project is left untouched
+        assert not os.path.exists("_fprime_packages")
+        assert not os.path.exists("project.lock")
+        with open("project.yaml", "r") as f:
+            assert f.read() == projectYaml
+        for i in range(2):
+            assert FppmGit.has_revision(
+                FppmGit.mirror_path(os.path.abspath(f"repos/pkg{i}")), "tags/v1.0"
+            )
+            assert FppmStore.has_tree(FppmGit.tree_hash(f"repos/pkg{i}", "tags/v1.0"))
+        print(f"[INFO]: Test Fetch.1 passed")
+
+        # the packages can then be installed without the network
+        shutil.rmtree("repos")
+        FppmCache.set_offline(True)
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            assert (
+                cmd_install.install_package(
+                    Namespace(
+                        package=None,
+                        version=None,
+                        project=True,
+                        project_yaml_path="project.yaml",
+                    ),
+                    {},
+                )
+                == 0
+            )
+        assert os.path.isdir("_fprime_packages/local.pkg1/.git")
+        print(f"[INFO]: Test Fetch.2 passed")
+    finally:
+        FppmCache.set_offline(False)
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_sync():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    def sync(expected=0):
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            with patch.object(
+                cmd_install, "fetch_package", wraps=cmd_install.fetch_package
+            ) as fetchPackage:
+                assert (
+                    cmd_sync.sync_project(
+                        Namespace(project_yaml_path="project.yaml", jobs=2), {}
+                    )
+                    == expected
+                )
+        return sorted(call.args[0]["name"] for call in fetchPackage.call_args_list)
+
+    try:
+        setup_install_project(3)
+
+        assert sync() == ["local/pkg0", "local/pkg1", "local/pkg2"]
+        assert sorted(FppmLock.load_lock("project.yaml")) == [
+            "local/pkg0",
+            "local/pkg1",
+            "local/pkg2",
+        ]
+        print(f"[INFO]: Test Sync.1 passed")
+
+        # nothing changed: nothing is fetched or written
+        with patch.object(
+            FppmCache, "write_atomic", wraps=FppmCache.write_atomic
+        ) as writeAtomic:
+            assert sync() == []
+        assert writeAtomic.call_count == 0
+        print(f"[INFO]: Test Sync.2 passed")
+
+        with open("project.yaml", "r") as f:
+            content = yaml.safe_load(f)
+        content["packages"] = [
+            {"name": "local/pkg0", "version": "v1.1"},
+            {"name": "local/pkg1", "version": "v1.0"},
+        ]
+        with open("project.yaml", "w") as f:
+            yaml.dump(content, f)
+
+        assert sync() == ["local/pkg0"]
+        assert not os.path.exists("_fprime_packages/local.pkg2")
+        with open("_fprime_packages/local.pkg0/CMakeLists.txt", "r") as f:
+            assert f.read() == "# v1.1\n"
+        with open("_fprime_packages/CMakeLists.txt", "r") as f:
+            assert f.read() == FppmProject.package_cmake_line(
+                "local.pkg0"
+            ) + FppmProject.package_cmake_line("local.pkg1")
+        assert sorted(FppmLock.load_lock("project.yaml")) == [
+            "local/pkg0",
+            "local/pkg1",
+        ]
+        print(f"[INFO]: Test Sync.3 passed")
+
+        # a package that fails to resolve is kept, with its CMake line
+        content["packages"][1]["version"] = "v1.1"
+        with open("project.yaml", "w") as f:
+            yaml.dump(content, f)
+        with open("registry.yaml", "r") as f:
+            registry = yaml.safe_load(f)
+        registry["namespaces"][0]["local"] = registry["namespaces"][0]["local"][:1]
+        with open("registry.yaml", "w") as f:
+            yaml.dump(registry, f)
+        cmd_registries._REGISTRY_MEMO.clear()
+
+        assert sync(expected=1) == []
+        assert os.path.exists("_fprime_packages/local.pkg1")
+        with open("_fprime_packages/CMakeLists.txt", "r") as f:
+            assert FppmProject.package_cmake_line("local.pkg1") in f.read()
+        assert "local/pkg1" in FppmLock.load_lock("project.yaml")
+        print(f"[INFO]: Test Sync.4 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()
+
+
+def test_list():
+    setup_test_env()
+    os.environ["FPPM_CACHE_DIR"] = os.path.abspath("cache")
+
+    listArgs = Namespace(project_yaml_path="project.yaml", json=False)
+
+    try:
+        setup_install_project(3)
+        # a folder sharing a prefix with an installed package is not mistaken
+        # for it
+        os.makedirs("_fprime_packages/local.pkg10")
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            assert (
+                cmd_install.install_package(
+                    Namespace(
+                        package="local/pkg1",
+                        version="v1.1",
+                        project=False,
+                        project_yaml_path="project.yaml",
+                    ),
+                    {},
+                )
+                == 0
+            )
+        assert os.listdir("_fprime_packages/local.pkg10") == []
+
+        state = FppmState.load_state()
+        assert sorted(state) == ["local/pkg1"]
+        assert state["local/pkg1"]["commit"] == FppmGit.resolve_revision(
+            "repos/pkg1", "tags/v1.1"
+        )
+        assert state["local/pkg1"]["registry"] == "registry.yaml"
+        print(f"[INFO]: Test List.1 passed")
+
+        # listing the packages runs no git
+        session = FppmProject.ProjectSession("project.yaml")
+        assert session.load() == 0
+        with patch.object(subprocess, "run") as run:
+            rows = cmd_status.package_rows(session)
+            with patch.object(FppmUtils, "prompt", return_value="n"):
+                assert cmd_status.list_packages(listArgs, {}) == 0
+        assert run.call_count == 0
+        assert [(row["name"], row["status"]) for row in rows] == [
+            ("local/pkg0", "missing"),
+            ("local/pkg1", "installed"),
+            ("local/pkg2", "missing"),
+        ]
+        print(f"[INFO]: Test List.2 passed")
+
+        # --json prints the JSON document alone on stdout
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            assert (
+                cmd_status.list_packages(
+                    Namespace(project_yaml_path="project.yaml", json=True), {}
+                )
+                == 0
+            )
+        assert [row["name"] for row in json.loads(stdout.getvalue())] == [
+            "local/pkg0",
+            "local/pkg1",
+            "local/pkg2",
+        ]
+        print(f"[INFO]: Test List.3 passed")
+
+        with patch.object(FppmUtils, "prompt", return_value="n"):
+            cmd_remove.remove_package(
+                Namespace(package="local/pkg1", project_yaml_path="project.yaml"), {}
+            )
+        assert FppmState.load_state() == {}
+        print(f"[INFO]: Test List.4 passed")
+    finally:
+        del os.environ["FPPM_CACHE_DIR"]
+        teardown_test_env()